@@ -1,84 +1,155 @@
-import os, yaml, asyncio
-from pathlib import Path
+import asyncio, time
 from app.utils.logger import logger
 from app.utils.embedding_utils import text_to_vector
 from app.utils.config import settings
-
-
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except Exception:
-    OPENAI_AVAILABLE = False
-
-try:
-    from huggingface_hub import InferenceClient
-    HF_AVAILABLE = True
-except Exception:
-    HF_AVAILABLE = False
+from app.utils.cache import response_cache, make_cache_key
+from app.utils.singleflight import agent_calls
+from app.agents import providers
+from app.agents.router import provider_router
+from app.agents.registry import AgentRegistry, get_registry
+from app.utils.metrics import AGENT_CACHE_HITS, AGENT_SIMULATED
+from app.utils.admission import AdmissionRejected, estimate_tokens, admission
+from app.services.retrieval import retriever, format_context, retrieval_enabled, scoped_key
+from app.services.manuscript_service import record_agent_output
 
 class CrewManager:
-    def __init__(self, agents):
-        self.agents = agents
+    def __init__(self, registry):
+        self.registry = registry
+
+    @property
+    def agents(self):
+        return self.registry.agents
 
     @classmethod
     def load_from_folder(cls, folder: str = None):
         if folder is None:
-            folder = Path(__file__).parent
-        agents = {}
-        for p in Path(folder).glob("*_agent.yaml"):
-            try:
-                cfg = yaml.safe_load(p.read_text())
-                agents[cfg['name']] = cfg
-            except Exception as e:
-                logger.exception(f"Failed to load {p}: {e}")
-        return cls(agents)
+            return cls(get_registry())
+        return cls(AgentRegistry(agents_dir=folder, config_dir=None))
 
     async def _call_openai(self, prompt, max_tokens=500, temp=0.3):
-        if not OPENAI_AVAILABLE or not os.environ.get('OPENAI_API_KEY'):
-            raise RuntimeError('OpenAI not configured')
-        openai.api_key = os.environ.get('OPENAI_API_KEY')
-        resp = await asyncio.to_thread(lambda: openai.Completion.create(engine='text-davinci-003', prompt=prompt, max_tokens=max_tokens, temperature=temp))
-        return resp.choices[0].text.strip()
-
-    async def _call_hf(self, model_name, prompt):
-        if not HF_AVAILABLE or not os.environ.get('HUGGINGFACEHUB_API_TOKEN'):
-            raise RuntimeError('HF not configured')
-        client = InferenceClient(os.environ.get('HUGGINGFACEHUB_API_TOKEN'))
-        resp = client.text_generation(prompt, model=model_name)
-        return resp
-
-    async def run_agent_async(self, name, **kwargs):
-        if name not in self.agents:
-            raise ValueError('Unknown agent: ' + name)
-        cfg = self.agents[name]
-        provider = cfg.get('model', {}).get('provider', 'simulated')
-        temp = cfg.get('model', {}).get('temperature', 0.7)
-        # Build prompt based on template
-        prompt_file = Path(Path(__file__).parent / cfg.get('prompt_template', ''))
-        templ = prompt_file.read_text() if prompt_file.exists() else ''
-        if name == 'writer':
-            prompt_body = templ.replace('{{prompt}}', kwargs.get('prompt',''))
-        elif name == 'reviewer':
-            prompt_body = templ.replace('{{text}}', kwargs.get('text',''))
-        else:
-            prompt_body = templ.replace('{{context}}', kwargs.get('context',''))
+        return await providers.call_openai(prompt, max_tokens=max_tokens, temp=temp)
+
+    async def _call_hf(self, model_name, prompt, temp=None):
+        return await providers.call_hf(model_name, prompt, temp=temp)
+
+    def _provider_candidates(self, cfg, provider, prompt_body, temp):
+        candidates = []
+        if 'openai' in provider and providers.openai_configured():
+            candidates.append(('openai', lambda: self._call_openai(prompt_body, max_tokens=1200, temp=temp)))
+        if 'hf' in provider and providers.hf_configured():
+            candidates.append(('hf', lambda: self._call_hf(cfg.get('model', {}).get('name','gpt-like'), prompt_body, temp=temp)))
+        return candidates
+
+    def has_provider(self, name):
+        """Whether a real provider is configured for the agent, i.e. simulated output means it failed."""
+        cfg = self.registry.get(name)
+        model = cfg.get('model', {})
+        return bool(self._provider_candidates(cfg, model.get('provider', 'simulated'), '', model.get('temperature')))
 
-        # Try providers
-        if 'openai' in provider and OPENAI_AVAILABLE and os.environ.get('OPENAI_API_KEY'):
+    async def _dispatch_providers(self, cfg, provider, prompt_body, temp):
+        """Route to the configured providers; None when none is available or all failed."""
+        candidates = self._provider_candidates(cfg, provider, prompt_body, temp)
+        if not candidates:
+            return None
+        try:
+            name, text = await provider_router.call(candidates, tokens=estimate_tokens(prompt_body, 1200))
+        except AdmissionRejected:
+            # overload must reach the client as a 429, not degrade to simulated output
+            raise
+        except Exception as e:
+            logger.warning('All providers failed, using simulated output: %s', e)
+            return None
+        return {'text': text, 'provider': name}
+
+    async def _cached_dispatch(self, name, cache_key, key, cfg, provider, prompt_body, temp, scope):
+        """Cache lookup, provider call and the side effects of a fresh answer.
+
+        Runs once per single-flight group, so coalesced callers never index or
+        store the same answer twice.
+        """
+        if settings.CACHE_ENABLED:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                return {**cached, 'cached': True}
+        result = await self._dispatch_providers(cfg, provider, prompt_body, temp)
+        if result is not None:
+            if settings.CACHE_ENABLED:
+                await response_cache.set(cache_key, result)
+            self._ingest(name, cfg, key, result, scope)
+            self._persist(name, cfg, cache_key, result)
+        return result
+
+    def _render_prompt(self, name, kwargs, retrieved=''):
+        return self.registry.render(name, kwargs, retrieved_context=retrieved)
+
+    @staticmethod
+    def _source_key(name, base, scope):
+        """doc_key under which output for the (un-augmented) prompt `base` is indexed in `scope`."""
+        return scoped_key(scope, f'{name}:{make_cache_key(name, base)[:16]}')
+
+    @staticmethod
+    def _uses_retrieval(cfg, scope, option='enabled'):
+        return bool(scope) and retrieval_enabled() and bool((cfg.get('retrieval') or {}).get(option))
+
+    async def _build_prompt(self, name, cfg, kwargs, scope=None):
+        """Render the prompt, adding retrieved chunks when the agent enables retrieval.
+
+        Retrieval only runs for a call with a `scope` (such as `book:<id>`) and
+        only searches what was indexed in that scope, so a prompt never sees
+        text from another book. Returns (prompt, retrieval info, key), where
+        `key` is what the cache and single-flight are keyed on: the render
+        without context plus the ids of the retrieved chunks. Chunks indexed
+        from earlier answers to this same prompt are never retrieved, so
+        repeating a call finds its cached answer.
+        """
+        base = self._render_prompt(name, kwargs)
+        if not self._uses_retrieval(cfg, scope):
+            return base, None, base
+        opts = cfg['retrieval']
+        query = next((kwargs[v] for v in self.registry.inputs(name) if kwargs.get(v)), '')
+        try:
+            chunks, ms = await retriever.retrieve(query, scope, k=opts.get('top_k'), token_budget=opts.get('token_budget'),
+                                                  exclude_doc_key=self._source_key(name, base, scope))
+        except Exception as e:
+            logger.exception('Retrieval failed for %s: %s', name, e)
+            return base, None, base
+        logger.info('Retrieved %d chunks for %s in %.1f ms', len(chunks), name, ms)
+        info = {'chunks': len(chunks), 'ms': round(ms, 2)}
+        if not chunks:
+            return base, info, base
+        key = {'prompt': base, 'chunks': [c['id'] for c in chunks]}
+        return self._render_prompt(name, kwargs, format_context(chunks)), info, key
+
+    def _ingest(self, name, cfg, key, result, scope):
+        """Index the agent's output in the background so later calls in the same scope can retrieve it."""
+        if not self._uses_retrieval(cfg, scope, 'ingest'):
+            return
+        text = result.get('draft') or result.get('text')
+        if not text:
+            return
+        base = key['prompt'] if isinstance(key, dict) else key
+
+        async def run():
             try:
-                text = await self._call_openai(prompt_body, max_tokens=1200, temp=temp)
-                return {'text': text, 'provider': 'openai'}
+                await retriever.index_document(self._source_key(name, base, scope), text)
             except Exception as e:
-                logger.exception('OpenAI provider failed: %s', e)
-        if 'hf' in provider and HF_AVAILABLE and os.environ.get('HUGGINGFACEHUB_API_TOKEN'):
+                logger.exception('Failed to index %s output: %s', name, e)
+        asyncio.ensure_future(run())
+
+    def _persist(self, name, cfg, cache_key, result):
+        """Keep provider-generated output in the manuscript store, in the background."""
+        if not settings.PERSIST_AGENT_OUTPUTS:
+            return
+
+        async def run():
             try:
-                text = await self._call_hf(cfg.get('model', {}).get('name','gpt-like'), prompt_body)
-                return {'text': text, 'provider': 'hf'}
+                await record_agent_output(name, cache_key, result, provider=result.get('provider'),
+                                          model=cfg.get('model', {}).get('name'))
             except Exception as e:
-                logger.exception('HF provider failed: %s', e)
+                logger.exception('Failed to store %s output: %s', name, e)
+        asyncio.ensure_future(run())
 
-        # Fallback simulated deterministic output
+    def _simulated_output(self, name, kwargs):
         if name == 'writer':
             p = kwargs.get('prompt','')[:300]
             vec = text_to_vector(p)
@@ -89,4 +160,129 @@ class CrewManager:
         if name == 'designer':
             c = kwargs.get('context','')[:300]
             return {'cover':'Simulated cover concept','image_prompt': f'Image prompt: {c}...','provider':'simulated'}
-        return {'output':'ok'}
\ No newline at end of file
+        return {'output':'ok'}
+
+    async def run_agent_async(self, name, scope=None, **kwargs):
+        """Run agent `name` on the template variables in `kwargs`.
+
+        `scope` (e.g. `book:<id>`) is where the answer may draw retrieved
+        context from and is indexed into; unscoped calls do neither.
+        """
+        cfg = self.registry.get(name)
+        provider = cfg.get('model', {}).get('provider', 'simulated')
+        temp = cfg.get('model', {}).get('temperature', 0.7)
+        prompt_body, retrieval, key = await self._build_prompt(name, cfg, kwargs, scope)
+
+        model = cfg.get('model', {})
+        cache_key = make_cache_key(name, key, model.get('name'), temp, provider)
+        # identical concurrent calls share one cache lookup / provider round-trip
+        result = await agent_calls.do(
+            cache_key, lambda: self._cached_dispatch(name, cache_key, key, cfg, provider, prompt_body, temp, scope))
+        if result is not None:
+            result = dict(result)
+            if result.get('cached'):
+                AGENT_CACHE_HITS.inc(agent=name)
+        else:
+            # Fallback simulated deterministic output (never cached, indexed or stored, so an outage does not stick)
+            AGENT_SIMULATED.inc(agent=name)
+            result = self._simulated_output(name, kwargs)
+        if retrieval is not None:
+            result['retrieval'] = retrieval
+        return result
+
+    def _provider_streams(self, cfg, provider, prompt_body, temp):
+        if 'openai' in provider and providers.openai_configured():
+            yield 'openai', lambda: providers.stream_openai(prompt_body, max_tokens=1200, temp=temp)
+        if 'hf' in provider and providers.hf_configured():
+            yield 'hf', lambda: providers.stream_hf(cfg.get('model', {}).get('name','gpt-like'), prompt_body, temp=temp)
+
+    async def stream_agent_async(self, name, info=None, scope=None, **kwargs):
+        """Yield the agent's completion as text chunks while the provider produces them.
+
+        `info`, if given, is filled with the provider that answered and whether
+        the answer came from the cache; `scope` is as for `run_agent_async`. A
+        provider may only be skipped before it has produced its first token;
+        later failures propagate to the caller.
+        """
+        info = {} if info is None else info
+        cfg = self.registry.get(name)
+        provider = cfg.get('model', {}).get('provider', 'simulated')
+        temp = cfg.get('model', {}).get('temperature', 0.7)
+        prompt_body, retrieval, key = await self._build_prompt(name, cfg, kwargs, scope)
+        if retrieval is not None:
+            info['retrieval'] = retrieval
+        cache_key = make_cache_key(name, key, cfg.get('model', {}).get('name'), temp, provider)
+
+        if settings.CACHE_ENABLED:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                AGENT_CACHE_HITS.inc(agent=name)
+                info.update(provider=cached.get('provider'), cached=True)
+                yield cached.get('text', '')
+                return
+
+        rejected = None
+        for provider_name, open_stream in self._provider_streams(cfg, provider, prompt_body, temp):
+            if not provider_router.allow(provider_name):
+                continue
+            chunks = []
+            try:
+                await admission.acquire_provider(provider_name, estimate_tokens(prompt_body, 1200))
+            except AdmissionRejected as e:
+                provider_router.release(provider_name)
+                rejected = e
+                continue
+            start = time.perf_counter()
+            try:
+                async for token in open_stream():
+                    if not chunks:
+                        # streams are judged on time to first token, tracked apart from full calls
+                        provider_router.record(provider_name, time.perf_counter() - start, True, stream=True)
+                    chunks.append(token)
+                    info.update(provider=provider_name, cached=False)
+                    yield token
+            except Exception as e:
+                if chunks:
+                    raise
+                provider_router.record(provider_name, time.perf_counter() - start, False, stream=True)
+                logger.exception('%s streaming failed: %s', provider_name, e)
+                continue
+            finally:
+                if not chunks:
+                    provider_router.release(provider_name)
+            result = {'text': ''.join(chunks), 'provider': provider_name}
+            if settings.CACHE_ENABLED:
+                await response_cache.set(cache_key, result)
+            self._ingest(name, cfg, key, result, scope)
+            self._persist(name, cfg, cache_key, result)
+            return
+
+        if rejected is not None:
+            raise rejected
+
+        # Simulated provider streams word by word so the path is testable offline
+        AGENT_SIMULATED.inc(agent=name)
+        info.update(provider='simulated', cached=False)
+        result = self._simulated_output(name, kwargs)
+        for i, word in enumerate(simulated_text(result).split(' ')):
+            yield word if i == 0 else ' ' + word
+            await asyncio.sleep(0)
+
+
+def simulated_text(out):
+    return out.get('draft') or out.get('corrected') or out.get('image_prompt') or out.get('text') or out.get('output', '')
+
+
+_default_crew = None
+
+def get_crew():
+    """Process-wide CrewManager over the shared agent registry."""
+    global _default_crew
+    if _default_crew is None:
+        _default_crew = CrewManager(get_registry())
+    return _default_crew
+
+
+async def run_writer_agent(title: str, topic: str) -> str:
+    out = await get_crew().run_agent_async('writer', prompt=f'Book title: {title}\nTopic: {topic}')
+    return out.get('draft') or out.get('text', '')
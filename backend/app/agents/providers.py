@@ -0,0 +1,198 @@
+"""Provider calls shared by both CrewManager implementations.
+
+All calls go through the pooled clients in `provider_clients`, so nothing
+here blocks the event loop. Latency, errors and token counts are recorded
+per provider and model.
+"""
+import json, time
+from contextlib import contextmanager
+from app.utils.config import settings
+from app.utils.provider_clients import provider_clients, HTTPX_AVAILABLE
+from app.utils.admission import estimate_tokens
+from app.utils.metrics import PROVIDER_REQUEST_SECONDS, PROVIDER_FIRST_TOKEN_SECONDS, PROVIDER_ERRORS, PROVIDER_TOKENS
+
+DEFAULT_OLLAMA_URL = 'https://ollama.com'
+
+
+def openai_configured():
+    return HTTPX_AVAILABLE and bool(settings.OPENAI_API_KEY)
+
+
+def hf_configured():
+    return HTTPX_AVAILABLE and bool(settings.HUGGINGFACEHUB_API_TOKEN)
+
+
+def ollama_configured():
+    return HTTPX_AVAILABLE and bool(settings.OLLAMA_API_KEY or settings.OLLAMA_BASE_URL)
+
+
+def _bearer(token):
+    return {'Authorization': f'Bearer {token}'} if token else {}
+
+
+@contextmanager
+def _instrumented(provider, model, mode):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        PROVIDER_ERRORS.inc(provider=provider, model=model)
+        raise
+    finally:
+        PROVIDER_REQUEST_SECONDS.observe(time.perf_counter() - start, provider=provider, model=model, mode=mode)
+
+
+def _count_tokens(provider, model, prompt, completion, prompt_tokens=None, completion_tokens=None):
+    PROVIDER_TOKENS.inc(prompt_tokens or estimate_tokens(prompt), provider=provider, model=model, kind='prompt')
+    PROVIDER_TOKENS.inc(completion_tokens or estimate_tokens(str(completion)), provider=provider, model=model, kind='completion')
+
+
+async def _metered(provider, model, prompt, tokens):
+    """Wrap a token stream with latency, time-to-first-token and token accounting."""
+    start = time.perf_counter()
+    chunks = []
+    try:
+        with _instrumented(provider, model, 'stream'):
+            async for token in tokens:
+                if not chunks:
+                    PROVIDER_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start, provider=provider, model=model)
+                chunks.append(token)
+                yield token
+    finally:
+        await tokens.aclose()
+    _count_tokens(provider, model, prompt, ''.join(chunks))
+
+
+async def call_openai(prompt, model=None, max_tokens=500, temp=0.3):
+    if not openai_configured():
+        raise RuntimeError('OpenAI not configured')
+    client = provider_clients.get('openai', settings.OPENAI_BASE_URL)
+    model = model or settings.OPENAI_MODEL
+    with _instrumented('openai', model, 'call'):
+        resp = await client.post('/chat/completions', headers=_bearer(settings.OPENAI_API_KEY), json={
+            'model': model,
+            'messages': [{'role': 'user', 'content': prompt}],
+            'max_tokens': max_tokens,
+            'temperature': temp,
+        })
+        resp.raise_for_status()
+        data = resp.json()
+        text = data['choices'][0]['message']['content'].strip()
+    usage = data.get('usage') or {}
+    _count_tokens('openai', model, prompt, text, usage.get('prompt_tokens'), usage.get('completion_tokens'))
+    return text
+
+
+async def call_hf(model_name, prompt, max_tokens=500, temp=None):
+    if not hf_configured():
+        raise RuntimeError('HF not configured')
+    client = provider_clients.get('hf', settings.HF_BASE_URL)
+    params = {'max_new_tokens': max_tokens, 'return_full_text': False}
+    if temp:
+        params['temperature'] = temp
+    with _instrumented('hf', model_name, 'call'):
+        resp = await client.post(f'/{model_name}', headers=_bearer(settings.HUGGINGFACEHUB_API_TOKEN),
+                                 json={'inputs': prompt, 'parameters': params})
+        resp.raise_for_status()
+        data = resp.json()
+    if isinstance(data, list) and data:
+        data = data[0]
+    text = data.get('generated_text', '') if isinstance(data, dict) else str(data)
+    _count_tokens('hf', model_name, prompt, text)
+    return text
+
+
+async def call_ollama(model_name, prompt, base_url=None, api_key=None, temp=None):
+    if not HTTPX_AVAILABLE:
+        raise RuntimeError('Ollama client not configured')
+    client = provider_clients.get('ollama', base_url or settings.OLLAMA_BASE_URL or DEFAULT_OLLAMA_URL)
+    payload = {'model': model_name, 'prompt': prompt, 'stream': False}
+    if temp is not None:
+        payload['options'] = {'temperature': temp}
+    with _instrumented('ollama', model_name, 'call'):
+        resp = await client.post('/api/generate', headers=_bearer(api_key or settings.OLLAMA_API_KEY), json=payload)
+        resp.raise_for_status()
+        data = resp.json()
+    # try common response shapes
+    text = data.get('response') or data.get('text') or data.get('output') or data
+    _count_tokens('ollama', model_name, prompt, text, data.get('prompt_eval_count'), data.get('eval_count'))
+    return text
+
+
+async def _sse_data(resp):
+    async for line in resp.aiter_lines():
+        if not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return
+        if data:
+            yield json.loads(data)
+
+
+def stream_openai(prompt, model=None, max_tokens=500, temp=0.3):
+    model = model or settings.OPENAI_MODEL
+    return _metered('openai', model, prompt, _stream_openai(prompt, model, max_tokens, temp))
+
+
+async def _stream_openai(prompt, model, max_tokens, temp):
+    if not openai_configured():
+        raise RuntimeError('OpenAI not configured')
+    client = provider_clients.get('openai', settings.OPENAI_BASE_URL)
+    async with client.stream('POST', '/chat/completions', headers=_bearer(settings.OPENAI_API_KEY), json={
+        'model': model,
+        'messages': [{'role': 'user', 'content': prompt}],
+        'max_tokens': max_tokens,
+        'temperature': temp,
+        'stream': True,
+    }) as resp:
+        resp.raise_for_status()
+        async for event in _sse_data(resp):
+            choices = event.get('choices') or [{}]
+            token = (choices[0].get('delta') or {}).get('content')
+            if token:
+                yield token
+
+
+def stream_hf(model_name, prompt, max_tokens=500, temp=None):
+    return _metered('hf', model_name, prompt, _stream_hf(model_name, prompt, max_tokens, temp))
+
+
+async def _stream_hf(model_name, prompt, max_tokens, temp):
+    if not hf_configured():
+        raise RuntimeError('HF not configured')
+    client = provider_clients.get('hf', settings.HF_BASE_URL)
+    params = {'max_new_tokens': max_tokens, 'return_full_text': False}
+    if temp:
+        params['temperature'] = temp
+    async with client.stream('POST', f'/{model_name}', headers=_bearer(settings.HUGGINGFACEHUB_API_TOKEN),
+                             json={'inputs': prompt, 'parameters': params, 'stream': True}) as resp:
+        resp.raise_for_status()
+        async for event in _sse_data(resp):
+            token = (event.get('token') or {})
+            if token.get('text') and not token.get('special'):
+                yield token['text']
+
+
+def stream_ollama(model_name, prompt, base_url=None, api_key=None, temp=None):
+    return _metered('ollama', model_name, prompt, _stream_ollama(model_name, prompt, base_url, api_key, temp))
+
+
+async def _stream_ollama(model_name, prompt, base_url, api_key, temp):
+    if not HTTPX_AVAILABLE:
+        raise RuntimeError('Ollama client not configured')
+    client = provider_clients.get('ollama', base_url or settings.OLLAMA_BASE_URL or DEFAULT_OLLAMA_URL)
+    payload = {'model': model_name, 'prompt': prompt, 'stream': True}
+    if temp is not None:
+        payload['options'] = {'temperature': temp}
+    # Ollama streams newline-delimited JSON objects
+    async with client.stream('POST', '/api/generate', headers=_bearer(api_key or settings.OLLAMA_API_KEY), json=payload) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if data.get('response'):
+                yield data['response']
+            if data.get('done'):
+                return
@@ -0,0 +1,167 @@
+"""Agent registry shared by both CrewManager implementations.
+
+Agent YAMLs (`agents/*_agent.yaml` plus the entries of `config/agents.yaml`)
+are parsed once and their prompt templates compiled with Jinja2, so a
+request renders from memory. Each agent's variables are either declared in
+its YAML (`variables: [prompt]`) or taken from the template itself. The
+source files are stat'ed at most every AGENT_RELOAD_INTERVAL seconds and
+everything is reloaded when one of them changes.
+"""
+import threading, time
+from pathlib import Path
+import yaml
+from jinja2 import Environment, meta
+from app.utils.config import settings
+from app.utils.logger import logger
+from app.utils.metrics import PROMPT_RENDER_SECONDS
+from app.utils.embedding_utils import content_hash
+
+AGENTS_DIR = Path(__file__).parent
+CONFIG_DIR = AGENTS_DIR.parent / 'config'
+
+# filled in by the retrieval step, never by the caller
+RESERVED_VARIABLES = {'retrieved_context'}
+
+_env = Environment(autoescape=False, keep_trailing_newline=True)
+
+
+class AgentRegistry:
+    def __init__(self, agents_dir=AGENTS_DIR, config_dir=CONFIG_DIR, reload_interval=None):
+        self.agents_dir = Path(agents_dir) if agents_dir else None
+        self.config_dir = Path(config_dir) if config_dir else None
+        self.reload_interval = settings.AGENT_RELOAD_INTERVAL if reload_interval is None else reload_interval
+        self.agents = {}
+        self.templates = {}
+        self.variables = {}
+        self.fingerprints = {}
+        self._mtimes = {}
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.load()
+
+    # -- loading --
+
+    def _read_yaml(self, path):
+        self._mtimes[path] = _mtime(path)
+        return yaml.safe_load(path.read_text())
+
+    def _agent_files(self):
+        """[(logical name or None, path or inline cfg, base dir for relative paths)]"""
+        entries = []
+        if self.agents_dir is not None:
+            self._mtimes[self.agents_dir] = _mtime(self.agents_dir)  # catches added/removed agents
+            entries += [(None, p.resolve(), None) for p in sorted(self.agents_dir.glob('*_agent.yaml'))]
+        agents_file = self.config_dir / 'agents.yaml' if self.config_dir is not None else None
+        if agents_file is not None and agents_file.exists():
+            try:
+                cfg = self._read_yaml(agents_file) or {}
+                for name, entry in (cfg.get('agents') or {}).items():
+                    if isinstance(entry, str):
+                        entries.append((name, (agents_file.parent / entry).resolve(), None))
+                    else:
+                        entries.append((name, entry, agents_file.parent))
+            except Exception as e:
+                logger.exception(f"Failed to parse {agents_file}: {e}")
+        return entries
+
+    def _compile(self, name, cfg, base_dir):
+        source = ''
+        if cfg.get('prompt_template'):
+            prompt_file = (base_dir / cfg['prompt_template']).resolve()
+            if prompt_file.exists():
+                self._mtimes[prompt_file] = _mtime(prompt_file)
+                source = prompt_file.read_text()
+            else:
+                logger.warning('Prompt template %s for agent %s not found', prompt_file, name)
+        used = meta.find_undeclared_variables(_env.parse(source)) - RESERVED_VARIABLES
+        declared = cfg.get('variables')
+        if declared is None:
+            declared = sorted(used)
+        elif used - set(declared):
+            logger.warning('Agent %s template uses undeclared variables %s', name, sorted(used - set(declared)))
+        return _env.from_string(source), list(declared), content_hash(source)
+
+    def load(self):
+        """Parse every agent and compile its template; swaps in atomically."""
+        agents, templates, variables, fingerprints = {}, {}, {}, {}
+        by_path = {}
+        self._mtimes = {}
+        for name, entry, base_dir in self._agent_files():
+            try:
+                if isinstance(entry, Path):
+                    if entry in by_path:
+                        # the config entry maps a name to a file the agents folder already provided
+                        for loaded in (agents, templates, variables, fingerprints):
+                            loaded.setdefault(name, loaded[by_path[entry]])
+                        continue
+                    cfg = self._read_yaml(entry) or {}
+                    base_dir = entry.parent
+                else:
+                    cfg = dict(entry or {})
+                key = cfg.get('name') or name
+                templates[key], variables[key], fingerprints[key] = self._compile(key, cfg, base_dir)
+                agents[key] = cfg
+                if isinstance(entry, Path):
+                    by_path[entry] = key
+            except Exception as e:
+                logger.exception(f"Failed to load agent {name or entry}: {e}")
+        self.agents, self.templates, self.variables, self.fingerprints = agents, templates, variables, fingerprints
+        self._checked = time.monotonic()
+        logger.info('Loaded %d agents: %s', len(agents), ', '.join(sorted(agents)))
+
+    def refresh(self):
+        """Reload if any source file changed; stats them at most once per reload interval."""
+        if not self.reload_interval or time.monotonic() - self._checked < self.reload_interval:
+            return False
+        with self._lock:
+            if time.monotonic() - self._checked < self.reload_interval:
+                return False
+            self._checked = time.monotonic()
+            if all(_mtime(p) == m for p, m in self._mtimes.items()):
+                return False
+            logger.info('Agent configuration changed on disk, reloading')
+            self.load()
+            self.reloads += 1
+            return True
+
+    # -- lookups --
+
+    def get(self, name):
+        self.refresh()
+        if name not in self.agents:
+            raise ValueError('Unknown agent: ' + name)
+        return self.agents[name]
+
+    def inputs(self, name):
+        return self.variables.get(name, [])
+
+    def render(self, name, kwargs, retrieved_context=''):
+        """Render the precompiled prompt; missing inputs render as empty strings."""
+        with PROMPT_RENDER_SECONDS.time(agent=name):
+            values = {v: kwargs.get(v, '') for v in self.inputs(name)}
+            return self.templates[name].render(values, retrieved_context=retrieved_context)
+
+    def snapshot(self):
+        return {
+            'agents': {name: {'variables': self.inputs(name)} for name in sorted(self.agents)},
+            'reloads': self.reloads,
+            'watched_files': len(self._mtimes),
+        }
+
+
+def _mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+_default_registry = None
+
+def get_registry():
+    """Process-wide registry over `agents/` and `config/agents.yaml`."""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = AgentRegistry()
+    return _default_registry
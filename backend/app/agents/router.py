@@ -0,0 +1,227 @@
+"""Provider routing shared by both CrewManager implementations.
+
+Tracks rolling latency and error rates per provider, trips a circuit breaker
+on sustained failures so dead providers are skipped instead of timing out
+on every request, and optionally hedges a slow call with the next provider.
+"""
+import asyncio, time
+from collections import deque
+from app.utils.config import settings
+from app.utils.logger import logger
+from app.utils.admission import admission, AdmissionRejected
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class NoProviderAvailable(RuntimeError):
+    pass
+
+
+class ProviderStats:
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)  # (latency seconds, ok)
+        self.calls = 0
+        self.failures = 0
+
+    def record(self, latency, ok):
+        self.samples.append((latency, ok))
+        self.calls += 1
+        self.failures += 0 if ok else 1
+
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def percentile(self, p):
+        lat = sorted(latency for latency, ok in self.samples if ok)
+        if not lat:
+            return None
+        return lat[min(len(lat) - 1, int(round(p / 100 * (len(lat) - 1))))]
+
+    def snapshot(self):
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'window': len(self.samples),
+            'error_rate': round(self.error_rate(), 3),
+            'p50_ms': _ms(self.percentile(50)),
+            'p95_ms': _ms(self.percentile(95)),
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures or a high windowed
+    error rate; after `open_seconds` lets a single probe call through."""
+
+    def __init__(self, name, failure_threshold, error_rate, min_samples, open_seconds):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate = error_rate
+        self.min_samples = min_samples
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self._probing = False
+        if self.state == HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+        return self.state == CLOSED
+
+    def record(self, ok, stats):
+        if ok:
+            self.consecutive_failures = 0
+            self.state = CLOSED
+            self._probing = False
+            return
+        self.consecutive_failures += 1
+        tripped = self.consecutive_failures >= self.failure_threshold or (
+            len(stats.samples) >= self.min_samples and stats.error_rate() >= self.error_rate)
+        if self.state == HALF_OPEN or tripped:
+            if self.state != OPEN:
+                logger.warning('Circuit for %s opened after %d consecutive failures', self.name, self.consecutive_failures)
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        # a half-open probe that was cancelled (e.g. lost a hedge) says nothing about health
+        self._probing = False
+
+
+class ProviderRouter:
+    def __init__(self):
+        self.stats = {}
+        self.stream_stats = {}  # time to first token; kept apart so it never sets the hedge delay
+        self.breakers = {}
+        self.counters = {'calls': 0, 'hedges': 0, 'fallthroughs': 0, 'skipped_open': 0}
+
+    def _stats(self, name, stream=False):
+        table = self.stream_stats if stream else self.stats
+        if name not in table:
+            table[name] = ProviderStats(settings.ROUTER_WINDOW)
+        return table[name]
+
+    def _breaker(self, name):
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name, settings.ROUTER_FAILURE_THRESHOLD, settings.ROUTER_ERROR_RATE,
+                                                 settings.ROUTER_MIN_SAMPLES, settings.ROUTER_OPEN_SECONDS)
+        return self.breakers[name]
+
+    def allow(self, name):
+        ok = self._breaker(name).allow()
+        if not ok:
+            self.counters['skipped_open'] += 1
+        return ok
+
+    def release(self, name):
+        """Give back a half-open probe slot for a call that ended without an outcome."""
+        self._breaker(name).release_probe()
+
+    def record(self, name, latency, ok, stream=False):
+        """Record a call outcome; `stream` samples measure time to first token, not the full completion."""
+        stats = self._stats(name, stream)
+        stats.record(latency, ok)
+        self._breaker(name).record(ok, stats)
+
+    def hedge_delay(self, name):
+        if not settings.ROUTER_HEDGE_ENABLED:
+            return None
+        stats = self._stats(name)
+        if len(stats.samples) < settings.ROUTER_HEDGE_MIN_SAMPLES:
+            return None
+        return stats.percentile(settings.ROUTER_HEDGE_PERCENTILE)
+
+    async def _timed(self, name, factory, tokens=0):
+        try:
+            await admission.acquire_provider(name, tokens)
+        except (AdmissionRejected, asyncio.CancelledError):
+            # being rate limited locally says nothing about the provider's health
+            self._breaker(name).release_probe()
+            raise
+        start = time.perf_counter()
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            self._breaker(name).release_probe()
+            raise
+        except Exception:
+            self.record(name, time.perf_counter() - start, False)
+            raise
+        self.record(name, time.perf_counter() - start, True)
+        return result
+
+    async def call(self, candidates, tokens=0):
+        """Run `candidates` ([(provider name, coroutine factory)], in preference
+        order) and return (name, result) from the first that succeeds.
+
+        Each attempt first passes the provider's admission queue with an
+        estimated `tokens` cost; a rejection moves on to the next provider.
+
+        Providers with an open circuit are skipped. On failure the next
+        provider starts immediately; with hedging enabled it also starts once
+        the current one is slower than its latency percentile.
+        """
+        self.counters['calls'] += 1
+        queue = [c for c in candidates if self.allow(c[0])]
+        if not queue:
+            raise NoProviderAvailable('No provider available (all circuits open)')
+        pending = {}
+        last_exc = None
+
+        def launch():
+            name, factory = queue.pop(0)
+            pending[asyncio.ensure_future(self._timed(name, factory, tokens))] = name
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if queue and len(pending) == 1:
+                    timeout = self.hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.counters['hedges'] += 1
+                    logger.info('Hedging slow %s call with %s', next(iter(pending.values())), queue[0][0])
+                    launch()
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        return name, task.result()
+                    last_exc = task.exception()
+                    logger.warning('Provider %s failed: %s', name, last_exc)
+                    if queue:
+                        self.counters['fallthroughs'] += 1
+                        launch()
+            raise last_exc
+        finally:
+            for task in pending:
+                task.cancel()
+            for name, _ in queue:
+                self._breaker(name).release_probe()
+
+    def snapshot(self):
+        return {
+            **self.counters,
+            'providers': {
+                name: {**self._stats(name).snapshot(), 'circuit': self._breaker(name).state,
+                       **({'stream': self.stream_stats[name].snapshot()} if name in self.stream_stats else {})}
+                for name in sorted(set(self.stats) | set(self.breakers))
+            },
+        }
+
+
+provider_router = ProviderRouter()
@@ -1,25 +1,41 @@
-from fastapi import APIRouter, HTTPException, Request
-from app.agents.crew_setup import CrewManager
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Query
+from app.agents.crew_setup import get_crew
 from app.utils.logger import logger
+from app.api.streaming import sse_event, sse_response
+from app.utils.cache import response_cache
+from app.utils.singleflight import agent_calls
+from app.agents.router import provider_router
+from app.services.manuscript_service import list_agent_outputs
+from app.services.review_service import incremental_review
+from app.services.retrieval import book_scope
 from pydantic import BaseModel
 
 router = APIRouter()
-crew = CrewManager.load_from_folder()
+crew = get_crew()
 
 class WriteRequest(BaseModel):
     prompt: str
+    book_id: Optional[str] = None  # retrieved context comes from this book only; none without it
 
 class ReviewRequest(BaseModel):
     text: str
 
 class DesignRequest(BaseModel):
     context: str
+    book_id: Optional[str] = None
+
+class IncrementalReviewRequest(BaseModel):
+    doc_id: str
+    text: str
 
 @router.post("/write")
 async def write_endpoint(req: WriteRequest):
     try:
-        out = await crew.run_agent_async("writer", prompt=req.prompt)
+        out = await crew.run_agent_async("writer", scope=book_scope(req.book_id), prompt=req.prompt)
         return {"status":"ok", "output": out}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Writer error")
         raise HTTPException(status_code=500, detail=str(e))
@@ -29,15 +45,74 @@ async def review_endpoint(req: ReviewRequest):
     try:
         out = await crew.run_agent_async("reviewer", text=req.text)
         return {"status":"ok", "output": out}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Reviewer error")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/review/incremental")
+async def incremental_review_endpoint(req: IncrementalReviewRequest):
+    try:
+        out = await incremental_review(req.doc_id, req.text, crew)
+        return {"status":"ok", "output": out}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Incremental review error")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/design")
 async def design_endpoint(req: DesignRequest):
     try:
-        out = await crew.run_agent_async("designer", context=req.context)
+        out = await crew.run_agent_async("designer", scope=book_scope(req.book_id), context=req.context)
         return {"status":"ok", "output": out}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Designer error")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _agent_events(name, **kwargs):
+    info = {}
+    try:
+        async for token in crew.stream_agent_async(name, info=info, **kwargs):
+            yield sse_event({"token": token})
+        yield sse_event(info, event="done")
+    except HTTPException as e:
+        # the response has already started, so overload is reported in-band
+        yield sse_event({"detail": e.detail, "status": e.status_code}, event="error")
+    except Exception as e:
+        logger.exception("%s stream error", name)
+        yield sse_event({"detail": str(e)}, event="error")
+
+@router.post("/write/stream")
+async def write_stream_endpoint(req: WriteRequest):
+    return sse_response(_agent_events("writer", scope=book_scope(req.book_id), prompt=req.prompt))
+
+@router.post("/review/stream")
+async def review_stream_endpoint(req: ReviewRequest):
+    return sse_response(_agent_events("reviewer", text=req.text))
+
+@router.post("/design/stream")
+async def design_stream_endpoint(req: DesignRequest):
+    return sse_response(_agent_events("designer", scope=book_scope(req.book_id), context=req.context))
+
+@router.get("/cache/stats")
+async def cache_stats():
+    return {"status":"ok", "cache": response_cache.stats(), "singleflight": agent_calls.stats()}
+
+@router.get("/providers/stats")
+async def provider_stats():
+    return {"status":"ok", "router": provider_router.snapshot()}
+
+@router.get("/registry")
+async def registry_stats():
+    return {"status":"ok", "registry": crew.registry.snapshot()}
+
+@router.get("/outputs")
+async def agent_outputs(agent: Optional[str] = None, limit: int = Query(None, ge=1), cursor: Optional[str] = None):
+    try:
+        return await list_agent_outputs(agent, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
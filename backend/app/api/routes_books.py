@@ -1,8 +1,42 @@
-from fastapi import APIRouter
-from app.services.book_service import generate_book
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query
+from app.services.book_service import generate_book, retry_chapters
+from app.services import manuscript_service as store
 
 router = APIRouter(prefix="/books", tags=["Books"])
 
 @router.post("/generate")
-async def generate_book_route(title: str, topic: str):
-    return await generate_book(title, topic)
+async def generate_book_route(title: str, topic: str, mode: str = "single", chapters: int = 0):
+    if mode not in ("single", "outline"):
+        raise HTTPException(status_code=400, detail="mode must be 'single' or 'outline'")
+    return await generate_book(title, topic, mode=mode, chapters=chapters)
+
+@router.post("/{book_id}/retry")
+async def retry_chapters_route(book_id: str, chapter: Optional[List[int]] = Query(None)):
+    try:
+        return await retry_chapters(book_id, chapter)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown book run")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("")
+async def list_books_route(limit: int = Query(None, ge=1), cursor: Optional[str] = None, status: Optional[str] = None):
+    try:
+        return await store.list_books(limit, cursor, status)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{book_id}")
+async def get_book_route(book_id: str, text: bool = False):
+    book = await store.get_book(book_id, with_text=text)
+    if book is None:
+        raise HTTPException(status_code=404, detail="Unknown book")
+    return book
+
+@router.get("/{book_id}/chapters/{seq}/revisions")
+async def list_revisions_route(book_id: str, seq: int, limit: int = Query(None, ge=1), cursor: Optional[str] = None):
+    try:
+        return await store.list_revisions(book_id, seq, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
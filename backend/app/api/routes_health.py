@@ -1,6 +1,65 @@
+import os
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.utils.admission import admission
+from app.utils.cache import response_cache
+from app.utils.singleflight import agent_calls
+from app.utils.embedding_utils import embedding_cache
+from app.utils.metrics import metrics
+from app.agents.router import provider_router
+from app.services.job_service import job_queue
+from app.services.retrieval import retriever
+from app.utils.config import settings
 router = APIRouter()
 
+
+@metrics.collector
+def _component_stats():
+    cache = response_cache.stats()
+    router_stats = provider_router.snapshot()
+    admission_stats = admission.snapshot()
+    jobs = job_queue.stats()
+    faiss_stats = retriever.stats()
+    families = [
+        ('response_cache_lookups_total', 'counter', 'Response cache lookups by tier and result.',
+         [({'result': r}, cache[r]) for r in ('memory_hits', 'disk_hits', 'misses')]),
+        ('response_cache_entries', 'gauge', 'Entries in the in-memory response cache.', [({}, cache['entries'])]),
+        ('response_cache_bytes', 'gauge', 'Serialized size of the in-memory response cache.', [({}, cache['bytes'])]),
+        ('embedding_cache_lookups_total', 'counter', 'Embedding cache lookups.',
+         [({'result': r}, v) for r, v in embedding_cache.stats().items() if r in ('hits', 'misses')]),
+        ('singleflight_coalesced_total', 'counter', 'Agent calls that joined an identical in-flight call.',
+         [({}, agent_calls.stats()['coalesced'])]),
+        ('provider_circuit_open', 'gauge', 'Whether a provider circuit is open (1) or half-open (0.5).',
+         [({'provider': name}, {'open': 1, 'half_open': 0.5}.get(p['circuit'], 0))
+          for name, p in router_stats['providers'].items()]),
+        ('admission_queue_depth', 'gauge', 'Callers waiting for provider capacity.',
+         [({'provider': name}, q['queue_depth']) for name, q in admission_stats['providers'].items()]),
+        ('admission_rejections_total', 'counter', 'Requests rejected by admission control.',
+         [({'provider': name}, q['rejected']) for name, q in admission_stats['providers'].items()]
+         + [({'provider': 'client_quota'}, admission_stats['client_rejections'])]),
+        ('job_queue_jobs', 'gauge', 'Jobs queued and running.',
+         [({'state': 'queued'}, jobs['queued']), ({'state': 'running'}, jobs['running'])]),
+    ]
+    if faiss_stats is not None:
+        families.append(('faiss_snapshot_version', 'gauge', 'FAISS snapshot version this worker serves.',
+                         [({'role': faiss_stats['role']}, faiss_stats['version'])]))
+    return families
+
+
 @router.get("/health")
 async def health_check():
-    return {"status":"ok", "service":"book-writer-ai"}
\ No newline at end of file
+    return {"status":"ok", "service":"book-writer-ai"}
+
+@router.get("/health/admission")
+async def admission_stats():
+    return {"status":"ok", "admission": admission.snapshot()}
+
+@router.get("/health/worker")
+async def worker_stats():
+    """Which worker process answered, and its share of the shared state."""
+    return {"status":"ok", "pid": os.getpid(), "workers": settings.WORKERS,
+            "faiss": retriever.stats(), "jobs": job_queue.stats()}
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
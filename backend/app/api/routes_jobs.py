@@ -0,0 +1,66 @@
+from typing import Literal
+from fastapi import APIRouter, HTTPException, Depends
+from app.services.job_service import job_queue, QueueFull, FINISHED, SUCCEEDED
+from app.utils.logger import logger
+from app.utils.admission import admit_client
+from pydantic import BaseModel
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+class BookJobRequest(BaseModel):
+    title: str
+    topic: str
+    mode: Literal["single", "outline"] = "single"
+    chapters: int = 0
+
+class FlowJobRequest(BaseModel):
+    prompt: str
+
+async def _submit(kind, params):
+    try:
+        job_id = await job_queue.submit(kind, params)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.exception("Job submit error")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"status":"ok", "job_id": job_id}
+
+@router.post("/books", status_code=202, dependencies=[Depends(admit_client)])
+async def submit_book_job(req: BookJobRequest):
+    return await _submit("book", {"title": req.title, "topic": req.topic, "mode": req.mode, "chapters": req.chapters})
+
+@router.post("/book_flow", status_code=202, dependencies=[Depends(admit_client)])
+async def submit_book_flow_job(req: FlowJobRequest):
+    return await _submit("book_flow", {"prompt": req.prompt})
+
+@router.get("/stats")
+async def job_stats():
+    return {"status":"ok", "jobs": job_queue.stats()}
+
+@router.get("/{job_id}")
+async def job_status(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    job.pop("result", None)
+    return {"status":"ok", "job": job}
+
+@router.get("/{job_id}/result")
+async def job_result(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    if job["status"] not in FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    if job["status"] != SUCCEEDED:
+        return {"status": job["status"], "error": job["error"]}
+    return {"status":"ok", "result": job["result"]}
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    if not await job_queue.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job already finished")
+    return {"status":"ok", "job_id": job_id}
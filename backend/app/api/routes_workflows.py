@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from app.workflows.workflow_runner import WorkflowRunner
 from app.utils.logger import logger
+from app.api.streaming import sse_event, sse_response
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -14,6 +15,15 @@ async def run_book_flow(req: FlowRequest):
     try:
         result = await runner.run_book_workflow_async(req.prompt)
         return {"status":"ok", "result": result}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Workflow error")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/run_book_flow/stream")
+async def run_book_flow_stream(req: FlowRequest):
+    async def events():
+        async for event in runner.stream_book_workflow(req.prompt):
+            yield sse_event(event, event=event["event"])
+    return sse_response(events())
@@ -0,0 +1,13 @@
+import json
+from fastapi.responses import StreamingResponse
+
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def sse_response(events):
+    """Wrap an async iterator of SSE strings in a non-buffered streaming response."""
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,37 +1,25 @@
-import os, yaml, asyncio
+import yaml
 from pathlib import Path
 from app.utils.logger import logger
 from app.utils.embedding_utils import text_to_vector
 from app.utils.config import settings
+from app.utils.cache import response_cache, make_cache_key
+from app.utils.singleflight import agent_calls
 
-
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except Exception:
-    OPENAI_AVAILABLE = False
-
-try:
-    from huggingface_hub import InferenceClient
-    HF_AVAILABLE = True
-except Exception:
-    HF_AVAILABLE = False
-
-try:
-    from ollama import LLM
-    OLLAMA_AVAILABLE = True
-except Exception:
-    OLLAMA_AVAILABLE = False
-
-try:
-    import requests
-    REQUESTS_AVAILABLE = True
-except Exception:
-    REQUESTS_AVAILABLE = False
+from app.agents import providers
+from app.agents.router import provider_router
+from app.utils.admission import AdmissionRejected, estimate_tokens
+from app.agents.registry import AgentRegistry, get_registry
+from app.utils.metrics import AGENT_CACHE_HITS, AGENT_SIMULATED
 
 class CrewManager:
-    def __init__(self, agents):
-        self.agents = agents
+    def __init__(self, registry):
+        self.registry = registry
+        self.tasks = {}
+
+    @property
+    def agents(self):
+        return self.registry.agents
 
     @classmethod
     def load_from_config(cls, config_dir: str = None):
@@ -42,36 +30,19 @@ class CrewManager:
           - an inline YAML mapping for the agent
         - `config/tasks.yaml` can contain named tasks that reference an agent and input variable.
         The method returns a CrewManager instance and attaches `tasks` attribute (dict) if present.
+
+        Agents come from the shared registry (parsed and compiled once, hot
+        reloaded on change); a non-default `config_dir` gets its own registry.
         """
         if config_dir is None:
             # default: ../config relative to this file
             config_dir = Path(__file__).parent.parent / 'config'
-        cfg_dir = Path(config_dir)
-        agents = {}
+            registry = get_registry()
+        else:
+            registry = AgentRegistry(agents_dir=None, config_dir=config_dir)
         tasks = {}
 
-        agents_file = cfg_dir / 'agents.yaml'
-        if agents_file.exists():
-            try:
-                cfg = yaml.safe_load(agents_file.read_text()) or {}
-                for name, entry in (cfg.get('agents') or {}).items():
-                    # if entry is a string, treat as path to agent YAML
-                    if isinstance(entry, str):
-                        p = (agents_file.parent / entry).resolve()
-                        try:
-                            agentcfg = yaml.safe_load(p.read_text())
-                            if agentcfg and 'name' in agentcfg:
-                                agents[agentcfg['name']] = agentcfg
-                            else:
-                                agents[name] = agentcfg
-                        except Exception as e:
-                            logger.exception(f"Failed to load agent file {p}: {e}")
-                    else:
-                        agents[name] = entry
-            except Exception as e:
-                logger.exception(f"Failed to parse {agents_file}: {e}")
-
-        tasks_file = cfg_dir / 'tasks.yaml'
+        tasks_file = Path(config_dir) / 'tasks.yaml'
         if tasks_file.exists():
             try:
                 tasks = yaml.safe_load(tasks_file.read_text()) or {}
@@ -79,99 +50,74 @@ class CrewManager:
             except Exception as e:
                 logger.exception(f"Failed to parse {tasks_file}: {e}")
 
-        mgr = cls(agents)
+        mgr = cls(registry)
         # attach tasks mapping for caller convenience
         mgr.tasks = tasks
         return mgr
 
     async def _call_openai(self, prompt, max_tokens=500, temp=0.3):
-        if not OPENAI_AVAILABLE or not os.environ.get('OPENAI_API_KEY'):
-            raise RuntimeError('OpenAI not configured')
-        openai.api_key = os.environ.get('OPENAI_API_KEY')
-        resp = await asyncio.to_thread(lambda: openai.Completion.create(engine='text-davinci-003', prompt=prompt, max_tokens=max_tokens, temperature=temp))
-        return resp.choices[0].text.strip()
-
-    async def _call_hf(self, model_name, prompt):
-        if not HF_AVAILABLE or not os.environ.get('HUGGINGFACEHUB_API_TOKEN'):
-            raise RuntimeError('HF not configured')
-        client = InferenceClient(os.environ.get('HUGGINGFACEHUB_API_TOKEN'))
-        resp = client.text_generation(prompt, model=model_name)
-        return resp
-
-    async def _call_ollama(self, model_name, prompt, base_url=None, api_key=None):
-        # Prefer official ollama client if available
-        if OLLAMA_AVAILABLE:
-            try:
-                client = LLM(model=model_name, base_url=base_url, api_key=api_key)
-                # try common method names
-                if hasattr(client, 'generate'):
-                    return client.generate(prompt)
-                if hasattr(client, 'create'):
-                    return client.create(prompt)
-                # fallback: string representation
-                return str(client)
-            except Exception as e:
-                logger.exception('Ollama client call failed: %s', e)
-                raise
+        return await providers.call_openai(prompt, max_tokens=max_tokens, temp=temp)
 
-        # Fallback to a raw HTTP call if requests is available
-        if REQUESTS_AVAILABLE and base_url:
-            try:
-                url = f"{base_url.rstrip('/')}/api/generate"
-                headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
-                resp = requests.post(url, json={'model': model_name, 'prompt': prompt}, headers=headers, timeout=30)
-                resp.raise_for_status()
-                data = resp.json()
-                # try common response shapes
-                return data.get('text') or data.get('output') or data
-            except Exception as e:
-                logger.exception('Ollama HTTP call failed: %s', e)
-                raise
+    async def _call_hf(self, model_name, prompt, temp=None):
+        return await providers.call_hf(model_name, prompt, temp=temp)
 
-        raise RuntimeError('Ollama client not configured')
+    async def _call_ollama(self, model_name, prompt, base_url=None, api_key=None, temp=None):
+        return await providers.call_ollama(model_name, prompt, base_url=base_url, api_key=api_key, temp=temp)
+
+    def _provider_candidates(self, cfg, provider, prompt_body, temp):
+        model_name = cfg.get('model', {}).get('name')
+        candidates = []
+        if 'openai' in provider and providers.openai_configured():
+            candidates.append(('openai', lambda: self._call_openai(prompt_body, max_tokens=1200, temp=temp)))
+        if 'hf' in provider and providers.hf_configured():
+            candidates.append(('hf', lambda: self._call_hf(model_name or 'gpt-like', prompt_body, temp=temp)))
+        # Try Ollama cloud if configured or explicitly requested
+        if ('ollama' in provider and providers.HTTPX_AVAILABLE) or providers.ollama_configured():
+            candidates.append(('ollama', lambda: self._call_ollama(model_name or 'gpt-oss:120b-cloud', prompt_body, temp=temp)))
+        return candidates
+
+    async def _dispatch_providers(self, cfg, provider, prompt_body, temp):
+        """Route to the configured providers; None when none is available or all failed."""
+        candidates = self._provider_candidates(cfg, provider, prompt_body, temp)
+        if not candidates:
+            return None
+        try:
+            name, text = await provider_router.call(candidates, tokens=estimate_tokens(prompt_body, 1200))
+        except AdmissionRejected:
+            # overload must reach the client as a 429, not degrade to simulated output
+            raise
+        except Exception as e:
+            logger.warning('All providers failed, using simulated output: %s', e)
+            return None
+        return {'text': text, 'provider': name}
+
+    async def _cached_dispatch(self, cache_key, cfg, provider, prompt_body, temp):
+        if settings.CACHE_ENABLED:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                return {**cached, 'cached': True}
+        result = await self._dispatch_providers(cfg, provider, prompt_body, temp)
+        if result is not None and settings.CACHE_ENABLED:
+            await response_cache.set(cache_key, result)
+        return result
 
     async def run_agent_async(self, name, **kwargs):
-        if name not in self.agents:
-            raise ValueError('Unknown agent: ' + name)
-        cfg = self.agents[name]
+        cfg = self.registry.get(name)
         provider = cfg.get('model', {}).get('provider', 'simulated')
         temp = cfg.get('model', {}).get('temperature', 0.7)
-        # Build prompt based on template
-        prompt_file = Path(Path(__file__).parent / cfg.get('prompt_template', ''))
-        templ = prompt_file.read_text() if prompt_file.exists() else ''
-        if name == 'writer':
-            prompt_body = templ.replace('{{prompt}}', kwargs.get('prompt',''))
-        elif name == 'reviewer':
-            prompt_body = templ.replace('{{text}}', kwargs.get('text',''))
-        else:
-            prompt_body = templ.replace('{{context}}', kwargs.get('context',''))
-
-        # Try providers
-        if 'openai' in provider and OPENAI_AVAILABLE and os.environ.get('OPENAI_API_KEY'):
-            try:
-                text = await self._call_openai(prompt_body, max_tokens=1200, temp=temp)
-                return {'text': text, 'provider': 'openai'}
-            except Exception as e:
-                logger.exception('OpenAI provider failed: %s', e)
-        if 'hf' in provider and HF_AVAILABLE and os.environ.get('HUGGINGFACEHUB_API_TOKEN'):
-            try:
-                text = await self._call_hf(cfg.get('model', {}).get('name','gpt-like'), prompt_body)
-                return {'text': text, 'provider': 'hf'}
-            except Exception as e:
-                logger.exception('HF provider failed: %s', e)
-
-        # Try Ollama cloud if configured or explicitly requested
-        if ('ollama' in provider) or (os.environ.get('OLLAMA_API_KEY') or os.environ.get('OLLAMA_BASE_URL')):
-            try:
-                model_name = cfg.get('model', {}).get('name', 'gpt-oss:120b-cloud')
-                base_url = os.environ.get('OLLAMA_BASE_URL', 'https://ollama.com/v1')
-                api_key = os.environ.get('OLLAMA_API_KEY')
-                text = await self._call_ollama(model_name, prompt_body, base_url=base_url, api_key=api_key)
-                return {'text': text, 'provider': 'ollama'}
-            except Exception as e:
-                logger.exception('Ollama provider failed: %s', e)
-
-        # Fallback simulated deterministic output
+        prompt_body = self.registry.render(name, kwargs)
+
+        model = cfg.get('model', {})
+        cache_key = make_cache_key(name, prompt_body, model.get('name'), temp, provider)
+        # identical concurrent calls share one cache lookup / provider round-trip
+        result = await agent_calls.do(cache_key, lambda: self._cached_dispatch(cache_key, cfg, provider, prompt_body, temp))
+        if result is not None:
+            if result.get('cached'):
+                AGENT_CACHE_HITS.inc(agent=name)
+            return dict(result)
+
+        # Fallback simulated deterministic output (never cached, so an outage does not stick)
+        AGENT_SIMULATED.inc(agent=name)
         if name == 'writer':
             p = kwargs.get('prompt','')[:300]
             vec = text_to_vector(p)
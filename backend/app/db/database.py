@@ -1,15 +1,153 @@
-from sqlalchemy import create_engine
+import time
+from datetime import datetime
+from sqlalchemy import create_engine, event, inspect, text, select, Integer
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.utils.config import settings
 from app.utils.logger import logger
 
-engine = create_engine(settings.MYSQL_URI, future=True, echo=False)
+# async drivers for the sync URLs used in settings / docker-compose
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+
+def pool_options(url):
+    """Connection pool settings; SQLite uses its own single-file pool and takes none of them."""
+    if make_url(url).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        # MySQL drops idle connections after wait_timeout (8h by default); recycle well before that
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+
+def share_sqlite(engine):
+    """WAL journal plus a busy timeout, so worker processes can share one SQLite file."""
+    if engine.dialect.name != 'sqlite':
+        return engine
+
+    @event.listens_for(engine, 'connect')
+    def _pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        cur.execute('PRAGMA journal_mode=WAL')
+        cur.execute(f'PRAGMA busy_timeout={int(settings.DB_POOL_TIMEOUT * 1000)}')
+        cur.close()
+    return engine
+
+
+def async_url(url):
+    u = make_url(url)
+    return u.set(drivername=ASYNC_DRIVERS.get(u.drivername, u.drivername))
+
+
+engine = share_sqlite(create_engine(settings.MYSQL_URI, future=True, echo=False, **pool_options(settings.MYSQL_URI)))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def init_db():
-    try:
-        from app.db import models
-        Base.metadata.create_all(bind=engine)
-    except Exception as e:
-        logger.exception('init_db failed: %s', e)
\ No newline at end of file
+_async_engine = None
+_async_sessions = None
+
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(async_url(settings.MYSQL_URI), echo=False, **pool_options(settings.MYSQL_URI))
+        share_sqlite(_async_engine.sync_engine)
+    return _async_engine
+
+
+def AsyncSessionLocal():
+    """New AsyncSession on the shared pooled async engine (`async with AsyncSessionLocal() as db:`)."""
+    global _async_sessions
+    if _async_sessions is None:
+        _async_sessions = async_sessionmaker(get_async_engine(), expire_on_commit=False, autoflush=False)
+    return _async_sessions()
+
+
+async def dispose_async_engine():
+    global _async_engine, _async_sessions
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = _async_sessions = None
+
+
+# the integer-keyed `books` table of earlier releases is renamed to this and its rows copied over
+LEGACY_BOOKS_TABLE = 'books_legacy'
+
+
+def _rename_legacy_books(conn):
+    insp = inspect(conn)
+    if 'books' not in insp.get_table_names():
+        return False
+    id_type = next(c['type'] for c in insp.get_columns('books') if c['name'] == 'id')
+    if not isinstance(id_type, Integer):
+        return False
+    conn.execute(text(f'ALTER TABLE books RENAME TO {LEGACY_BOOKS_TABLE}'))
+    return True
+
+
+def _copy_legacy_books(conn, books):
+    legacy = inspect(conn).get_columns(LEGACY_BOOKS_TABLE)
+    cols = [c for c in ('id', 'title', 'author', 'summary') if c in {c['name'] for c in legacy}]
+    rows = conn.execute(select(*(text(c) for c in cols)).select_from(text(LEGACY_BOOKS_TABLE))).mappings().all()
+    now = datetime.utcnow()
+    if rows:
+        conn.execute(books.insert(), [
+            {**row, 'id': str(row['id']), 'mode': 'single', 'status': 'done', 'created_at': now, 'updated_at': now}
+            for row in rows])
+    logger.info('Migrated %d books from the integer-keyed table (kept as %s)', len(rows), LEGACY_BOOKS_TABLE)
+
+
+# nullable columns added to existing tables since the first release
+ADDED_COLUMNS = {'jobs': ('worker_id', 'heartbeat_at')}
+
+
+def _add_missing_columns(conn):
+    insp = inspect(conn)
+    for name, columns in ADDED_COLUMNS.items():
+        have = {c['name'] for c in insp.get_columns(name)}
+        table = Base.metadata.tables[name]
+        for col in columns:
+            if col not in have:
+                ddl = table.c[col].type.compile(dialect=conn.dialect)
+                conn.execute(text(f'ALTER TABLE {name} ADD COLUMN {col} {ddl}'))
+                logger.info('Added column %s.%s', name, col)
+
+
+def upgrade_schema(conn):
+    """Create missing tables and adapt ones left by earlier releases (create_all never alters a table)."""
+    renamed = _rename_legacy_books(conn)
+    Base.metadata.create_all(bind=conn)
+    if renamed:
+        _copy_legacy_books(conn, Base.metadata.tables['books'])
+    _add_missing_columns(conn)
+
+
+def init_db(attempts=3):
+    from app.db import models  # noqa: F401 (registers the tables on Base.metadata)
+    for attempt in range(1, attempts + 1):
+        try:
+            with engine.begin() as conn:
+                upgrade_schema(conn)
+            return
+        except OperationalError as e:
+            # worker processes starting together race to create the same tables; the loser re-checks
+            if attempt == attempts:
+                logger.exception('init_db failed: %s', e)
+            else:
+                time.sleep(0.2 * attempt)
+        except Exception as e:
+            logger.exception('init_db failed: %s', e)
+            return
@@ -1,27 +1,538 @@
-import os, faiss, numpy as np
+import os, asyncio, fcntl, threading, time, faiss, numpy as np
 from app.utils.config import settings
 from app.utils.logger import logger
+from app.utils.metrics import FAISS_SECONDS
+
+# WAL segment layout: int64 base (index.ntotal when the segment was opened),
+# followed by fixed-size records of int64 id + float32[dim].
+WAL_HEADER = np.dtype('<i8')
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+ROLES = ('auto', 'writer', 'reader')
+# readers map the snapshot read-only, so worker processes share its pages. IO_FLAG_MMAP
+# covers IVF inverted lists; flat codes (flat, hnsw storage) also need IO_FLAG_MMAP_IFC,
+# which faiss refuses for IVF files.
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+MMAP_FLAT_FLAGS = MMAP_FLAGS | getattr(faiss, 'IO_FLAG_MMAP_IFC', 0)
+
+
+def mmap_flags(kind):
+    return MMAP_FLAT_FLAGS if kind in ('flat', 'hnsw') else MMAP_FLAGS
+
+
+def choose_index_type(n):
+    """Pick an index for a corpus of n vectors: exact when small, graph when
+    mid-sized, compressed inverted lists beyond a million."""
+    if n < 10_000:
+        return 'flat'
+    if n < 1_000_000:
+        return 'hnsw'
+    return 'ivf_pq'
+
+
+def index_type(index):
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(inner, faiss.IndexIVF):
+        return 'ivf_flat'
+    return 'flat'
+
+
+def build_index(kind, dim, n_train=0):
+    """Create an empty (untrained) ID-mapped index of the given kind."""
+    if kind == 'flat':
+        inner = faiss.IndexFlatL2(dim)
+    elif kind == 'hnsw':
+        inner = faiss.IndexHNSWFlat(dim, settings.FAISS_HNSW_M)
+        inner.hnsw.efConstruction = settings.FAISS_HNSW_EF_CONSTRUCTION
+    elif kind in ('ivf_flat', 'ivf_pq'):
+        nlist = settings.FAISS_NLIST or int(4 * np.sqrt(max(n_train, 1)))
+        nlist = max(1, min(nlist, n_train // 39 or 1))  # faiss wants ~39 training points per list
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == 'ivf_flat':
+            inner = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            inner = faiss.IndexIVFPQ(quantizer, dim, nlist, settings.FAISS_PQ_M, settings.FAISS_PQ_NBITS)
+    else:
+        raise ValueError(f'Unknown FAISS index type {kind!r}; expected one of {INDEX_TYPES} or auto')
+    return faiss.IndexIDMap2(inner)
+
 
 class FAISSHandler:
-    def __init__(self, dim=768):
+    """ID-mapped FAISS index with batched, write-ahead-logged ingest.
+
+    Inserts go to the in-memory index and are appended to a WAL segment; the
+    full index is only snapshotted (write to temp file, then atomic rename)
+    once `flush_batch` vectors are pending or `flush_interval` seconds have
+    passed. On startup the snapshot is loaded and any WAL records it does not
+    yet contain are replayed.
+
+    `index_type` is one of flat, ivf_flat, ivf_pq, hnsw or auto. Index kinds
+    that need training start as flat and are migrated at the next flush once
+    FAISS_TRAIN_SIZE vectors exist; auto re-picks the kind as the corpus grows.
+
+    Several processes can share one index path. The process holding an
+    exclusive lock on `<path>.lock` is the writer and owns everything above;
+    each snapshot it writes bumps the number in `<path>.version`. Every other
+    process is a reader: it memory-maps the snapshot read-only, re-maps it
+    when the version changes, and hands its inserts to the writer through
+    `<path>.inbox`, which the writer drains into its WAL. With `role` auto
+    a reader takes over as writer once the lock is free (the writer exited).
+    Readers see new vectors once the writer snapshots them, i.e. within
+    `flush_interval` plus `sync_interval` seconds.
+    """
+
+    def __init__(self, dim=768, path=None, flush_batch=None, flush_interval=None, index_type=None, role=None,
+                 sync_interval=None):
         self.dim = dim
-        self.path = settings.FAISS_PATH
+        self.index_type = index_type or settings.FAISS_INDEX_TYPE
+        self.nprobe = settings.FAISS_NPROBE
+        self.ef_search = settings.FAISS_EF_SEARCH
+        self.path = path or settings.FAISS_PATH
+        self.wal_path = self.path + '.wal'
+        self.inbox_path = self.path + '.inbox'
+        self.version_path = self.path + '.version'
+        self.flush_batch = flush_batch or settings.FAISS_FLUSH_BATCH
+        self.flush_interval = flush_interval or settings.FAISS_FLUSH_INTERVAL
+        self.sync_interval = settings.FAISS_SYNC_INTERVAL if sync_interval is None else sync_interval
+        self.requested_role = role or settings.FAISS_ROLE
+        if self.requested_role not in ROLES:
+            raise ValueError(f'Unknown FAISS role {self.requested_role!r}; expected one of {ROLES}')
+        self._record = np.dtype([('id', '<i8'), ('vec', '<f4', (dim,))])
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._pending = 0
+        self._last_flush = self._last_sync = time.monotonic()
+        self._lock_file = None
+        self._wal = None
+        self._syncer = None
+        self._stop = threading.Event()
+        self.version = 0
         os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if self.requested_role != 'reader' and self._take_writer_lock(block=self.requested_role == 'writer'):
+            self._open_writer()
+        else:
+            self._open_reader()
+
+    # -- roles --
+
+    def _take_writer_lock(self, block=False):
+        f = open(self.path + '.lock', 'a+')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if block else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._lock_file = f
+        return True
+
+    def _open_writer(self):
+        self.role = 'writer'
+        self.version = self._read_version()[0]  # before replay, which may publish the next one
+        self.index = self._load_snapshot()
+        self._next_id = self._max_id() + 1
+        self._replay_wal()
+        self._wal = self._open_segment(self.wal_path)
+        self._drain_inbox()
+        if self.sync_interval:
+            self._syncer = threading.Thread(target=self._sync_loop, name='faiss-writer', daemon=True)
+            self._syncer.start()
+        logger.info('FAISS writer for %s (pid %d, %d vectors)', self.path, os.getpid(), self.index.ntotal)
+
+    def _open_reader(self):
+        self.role = 'reader'
+        self.version, kind = self._read_version()
+        self.index = self._map_snapshot(kind)
+        self._next_id = 0
+        logger.info('FAISS reader for %s (pid %d, snapshot version %d)', self.path, os.getpid(), self.version)
+
+    def _sync_loop(self):
+        while not self._stop.wait(self.sync_interval):
+            try:
+                self._drain_inbox()
+                with self._lock:
+                    flush = self._should_flush()
+                if flush:
+                    self.flush()
+            except Exception as e:
+                logger.exception('FAISS writer sync failed: %s', e)
+
+    def refresh(self, force=False):
+        """Reader side: re-map a newer snapshot, or become the writer if the lock is free.
+
+        Cheap enough for the query path: does nothing until `sync_interval` has passed.
+        """
+        if self.role == 'writer' or not (force or time.monotonic() - self._last_sync >= self.sync_interval):
+            return
+        with self._lock:
+            self._last_sync = time.monotonic()
+            if self.requested_role == 'auto' and self._take_writer_lock():
+                logger.info('FAISS writer lock for %s was free; promoting this reader', self.path)
+                self._open_writer()
+                return
+            # read the version before mapping, so a snapshot published in between is picked up next time
+            version, kind = self._read_version()
+            if version != self.version:
+                self.index = self._map_snapshot(kind)
+                self.version = version
+
+    async def arefresh(self):
+        if self.role != 'writer':
+            await asyncio.to_thread(self.refresh)
+
+    def stats(self):
+        return {'role': self.role, 'version': self.version, 'vectors': self.index.ntotal,
+                'index_type': index_type(self.index), 'pending': self._pending}
+
+    # -- persistence --
+
+    def _load_snapshot(self):
+        index = None
         if os.path.exists(self.path):
             try:
-                self.index = faiss.read_index(self.path)
+                index = faiss.read_index(self.path)
             except Exception as e:
                 logger.exception('Failed reading faiss index: %s', e)
-                self.index = faiss.IndexFlatL2(self.dim)
-        else:
-            self.index = faiss.IndexFlatL2(self.dim)
+        if index is None:
+            return build_index('flat', self.dim)
+        if not isinstance(index, faiss.IndexIDMap):
+            # legacy bare IndexFlatL2 file: ids were row positions
+            legacy = index
+            index = build_index('flat', self.dim)
+            if legacy.ntotal:
+                index.add_with_ids(legacy.reconstruct_n(0, legacy.ntotal), np.arange(legacy.ntotal, dtype='int64'))
+            logger.info('Wrapped legacy flat FAISS index (%d vectors) in an ID map', legacy.ntotal)
+        return index
+
+    def _map_snapshot(self, kind=None):
+        """Map the published snapshot read-only; `kind` is the index type it was published as."""
+        if not os.path.exists(self.path):
+            return build_index('flat', self.dim)
+        with FAISS_SECONDS.time(op='map'):
+            flags = mmap_flags(kind)
+            try:
+                return faiss.read_index(self.path, flags)
+            except RuntimeError:
+                if flags == MMAP_FLAGS:
+                    raise
+                # a migration published a different kind after we read the version file
+                return faiss.read_index(self.path, MMAP_FLAGS)
+
+    def _read_version(self):
+        """(version, index type) of the published snapshot; (0, None) before the first one."""
+        try:
+            with open(self.version_path) as f:
+                fields = f.read().split()
+            return int(fields[0]), (fields[1] if len(fields) > 1 else None)
+        except (FileNotFoundError, ValueError, IndexError):
+            return 0, None
+
+    def _publish(self, kind):
+        self.version += 1
+        tmp = f'{self.version_path}.tmp-{os.getpid()}'
+        with open(tmp, 'w') as f:
+            f.write(f'{self.version} {kind}')
+        os.replace(tmp, self.version_path)
+
+    def _max_id(self):
+        if self.index.ntotal == 0:
+            return -1
+        return int(faiss.vector_to_array(self.index.id_map).max())
+
+    def _read_segment(self, path):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        if len(raw) < WAL_HEADER.itemsize:
+            return 0, np.empty(0, dtype=self._record)
+        base = int(np.frombuffer(raw[:WAL_HEADER.itemsize], dtype=WAL_HEADER)[0])
+        body = raw[WAL_HEADER.itemsize:]
+        usable = len(body) - len(body) % self._record.itemsize  # drop a torn trailing record
+        return base, np.frombuffer(body[:usable], dtype=self._record)
+
+    def _replay_wal(self):
+        replayed = 0
+        for path in (self.wal_path + '.1', self.wal_path):
+            if not os.path.exists(path):
+                continue
+            base, records = self._read_segment(path)
+            skip = max(0, self.index.ntotal - base)  # rows the snapshot already holds
+            if skip < len(records):
+                self._index_add(records['id'][skip:], np.ascontiguousarray(records['vec'][skip:]))
+                replayed += len(records) - skip
+        if replayed:
+            logger.info('Replayed %d vectors from FAISS WAL', replayed)
+            self._pending = replayed
+            self.flush()
+
+    def _open_segment(self, path):
+        f = open(path, 'ab')
+        if f.tell() == 0:
+            f.write(np.array([self.index.ntotal], dtype=WAL_HEADER).tobytes())
+            f.flush()
+        return f
+
+    def flush(self):
+        """Snapshot the index to disk atomically and retire the WAL it covers."""
+        if self.role != 'writer':
+            return
+        with self._flush_lock:
+            with self._lock:
+                if self._pending == 0 and os.path.exists(self.path):
+                    return
+                target = self._target_type()
+                migrate = target != index_type(self.index)
+            if migrate:
+                self._migrate(target)
+            with self._lock:
+                data = faiss.serialize_index(self.index)
+                kind = index_type(self.index)
+                wal = getattr(self, '_wal', None)
+                if wal is not None:
+                    # rotate so new inserts land in a fresh segment while we write
+                    wal.close()
+                    self._retire_segment()
+                    self._wal = self._open_segment(self.wal_path)
+                self._pending = 0
+                self._last_flush = time.monotonic()
+            tmp = f'{self.path}.tmp-{os.getpid()}'
+            with open(tmp, 'wb') as f:
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._publish(kind)
+            # the snapshot now covers every retired record (and, during startup replay, the live WAL too)
+            for path in (self.wal_path + '.1',) if wal is not None else (self.wal_path + '.1', self.wal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _retire_segment(self):
+        retired = self.wal_path + '.1'
+        if not os.path.exists(retired):
+            os.replace(self.wal_path, retired)
+            return
+        # an earlier snapshot failed: segments are contiguous, so append the body
+        with open(self.wal_path, 'rb') as src, open(retired, 'ab') as dst:
+            src.seek(WAL_HEADER.itemsize)
+            dst.write(src.read())
+        os.remove(self.wal_path)
+
+    def _should_flush(self):
+        return self._pending >= self.flush_batch or (
+            self._pending and time.monotonic() - self._last_flush >= self.flush_interval)
+
+    def close(self):
+        if self.role == 'writer':
+            self._stop.set()
+            if self._syncer is not None:
+                self._syncer.join()
+            self._drain_inbox()
+            self.flush()
+            with self._lock:
+                self._wal.close()
+        if self._lock_file is not None:
+            self._lock_file.close()  # releases the writer lock
+            self._lock_file = None
+
+    # -- reader -> writer handoff --
+
+    def _send_to_writer(self, ids, arr):
+        records = np.empty(len(arr), dtype=self._record)
+        records['id'] = ids
+        records['vec'] = arr
+        while True:
+            with open(self.inbox_path, 'ab') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    # the writer may have taken this file for draining while we waited for the lock
+                    if os.path.exists(self.inbox_path) and os.stat(self.inbox_path).st_ino == os.fstat(f.fileno()).st_ino:
+                        f.write(records.tobytes())
+                        f.flush()
+                        return
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _drain_inbox(self):
+        """Writer side: move vectors readers handed over into the index (and so the WAL)."""
+        draining = self.inbox_path + '.draining'
+        if not os.path.exists(draining):
+            if not os.path.exists(self.inbox_path):
+                return 0
+            with open(self.inbox_path, 'ab') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)  # wait for an append in progress
+                os.replace(self.inbox_path, draining)
+        with open(draining, 'rb') as f:
+            raw = f.read()
+        records = np.frombuffer(raw[:len(raw) - len(raw) % self._record.itemsize], dtype=self._record)
+        if len(records):
+            self.add_vectors(np.ascontiguousarray(records['vec']), records['id'])
+        os.remove(draining)
+        return len(records)
+
+    # -- ingest --
+
+    def _index_add(self, ids, matrix):
+        self.index.add_with_ids(matrix, ids)
+        if len(ids):
+            self._next_id = max(self._next_id, int(ids.max()) + 1)
+
+    def add_vectors(self, matrix, ids=None):
+        """Add a (n, dim) matrix of vectors; returns the ids assigned to the rows.
+
+        Pass `ids` (e.g. row ids, as the retriever does) to map search hits back to their source.
+        """
+        arr = np.ascontiguousarray(np.atleast_2d(np.asarray(matrix, dtype='float32')))
+        if arr.shape[1] != self.dim:
+            raise ValueError(f'Expected vectors of dim {self.dim}, got {arr.shape[1]}')
+        if self.role == 'reader':
+            if ids is None:
+                raise ValueError('A FAISS reader cannot assign ids; pass explicit ids to hand vectors to the writer')
+            ids = np.asarray(ids, dtype='int64').reshape(-1)
+            if len(ids) != len(arr):
+                raise ValueError('ids and vectors differ in length')
+            with FAISS_SECONDS.time(op='handoff'):
+                self._send_to_writer(ids, arr)
+            return ids
+        with FAISS_SECONDS.time(op='add'), self._lock:
+            if ids is None:
+                ids = np.arange(self._next_id, self._next_id + len(arr), dtype='int64')
+            else:
+                ids = np.asarray(ids, dtype='int64').reshape(-1)
+                if len(ids) != len(arr):
+                    raise ValueError('ids and vectors differ in length')
+            records = np.empty(len(arr), dtype=self._record)
+            records['id'] = ids
+            records['vec'] = arr
+            self._wal.write(records.tobytes())
+            self._wal.flush()
+            if settings.FAISS_WAL_FSYNC:
+                os.fsync(self._wal.fileno())
+            self._index_add(ids, arr)
+            self._pending += len(arr)
+            flush = self._should_flush()
+        if flush:
+            self.flush()
+        return ids
 
     def add_vector(self, vector):
-        arr = np.array([vector]).astype('float32')
-        self.index.add(arr)
-        faiss.write_index(self.index, self.path)
-
-    def search(self, vector, k=3):
-        arr = np.array([vector]).astype('float32')
-        d, i = self.index.search(arr, k)
-        return d.tolist(), i.tolist()
\ No newline at end of file
+        return int(self.add_vectors([vector])[0])
+
+    async def aadd_vectors(self, matrix, ids=None):
+        return await asyncio.to_thread(self.add_vectors, matrix, ids)
+
+    async def aflush(self):
+        await asyncio.to_thread(self.flush)
+
+    # -- index type management --
+
+    def _target_type(self):
+        n = self.index.ntotal
+        kind = choose_index_type(n) if self.index_type == 'auto' else self.index_type
+        if kind != 'flat' and n < settings.FAISS_TRAIN_SIZE and kind != 'hnsw':
+            return index_type(self.index)  # not enough data to train yet
+        return kind
+
+    def _export(self, index, start=0):
+        """(ids, vectors) of rows `start`.. of an ID-mapped index; the caller holds `_lock`."""
+        n = index.ntotal - start
+        ids = faiss.vector_to_array(index.id_map)[start:].astype('int64')
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexIVF):
+            inner.make_direct_map()
+        vectors = inner.reconstruct_n(start, n) if n > 0 else np.empty((0, self.dim), dtype='float32')
+        return ids, vectors
+
+    def _migrate(self, kind):
+        """Rebuild the index as `kind`; the caller holds `_flush_lock`.
+
+        Only copying the vectors out and the final swap hold `_lock`: training
+        and filling the new index (minutes at a million vectors) happen while
+        searches and inserts keep using the old one. Rows inserted meanwhile
+        are carried over just before the swap.
+        """
+        with self._lock:
+            old = self.index
+            ids, vectors = self._export(old)
+        n = len(ids)
+        new = build_index(kind, self.dim, n_train=min(n, settings.FAISS_TRAIN_SIZE))
+        if not new.is_trained:
+            sample = vectors[np.random.default_rng(0).choice(n, min(n, settings.FAISS_TRAIN_SIZE), replace=False)]
+            new.train(sample)
+        for start in range(0, n, 65536):
+            new.add_with_ids(vectors[start:start + 65536], ids[start:start + 65536])
+        with self._lock:
+            late_ids, late = self._export(old, n)
+            if len(late_ids):
+                new.add_with_ids(late, late_ids)
+            self.index = new
+        logger.info('Migrated FAISS index %s -> %s (%d vectors)', index_type(old), kind, n + len(late_ids))
+
+    def migrate(self, kind=None):
+        """Rebuild the index as `kind` (default: the configured/auto type) and snapshot it.
+
+        An explicit `kind` becomes this handler's index type. Vectors are
+        reconstructed from the current index, so migrating away from ivf_pq
+        carries its quantization error along.
+        """
+        if self.role != 'writer':
+            raise RuntimeError(f'Only the FAISS writer process can migrate {self.path}')
+        if kind is not None:
+            self.index_type = kind
+        with self._flush_lock:
+            with self._lock:
+                target = kind or self._target_type()
+            self._migrate(target)
+            with self._lock:
+                self._pending = max(self._pending, 1)
+        self.flush()
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if ef_search is not None:
+            self.ef_search = ef_search
+
+    def _apply_search_params(self):
+        inner = faiss.downcast_index(self.index.index)
+        if isinstance(inner, faiss.IndexIVF):
+            inner.nprobe = self.nprobe
+        elif isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = self.ef_search
+
+    def _search_params(self, ids):
+        # per-query parameters replace the index's own, so carry nprobe / efSearch along with the selector
+        sel = faiss.IDSelectorBatch(np.asarray(ids, dtype='int64'))
+        inner = faiss.downcast_index(self.index.index)
+        if isinstance(inner, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(sel=sel, nprobe=self.nprobe)
+        if isinstance(inner, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=sel, efSearch=self.ef_search)
+        return faiss.SearchParameters(sel=sel)
+
+    # -- query --
+
+    def search(self, vector, k=3, ids=None):
+        """Return (distances, ids); ids are the values given at insert time, -1 when missing.
+
+        `ids` restricts the search to those vectors (HNSW may then return
+        fewer than k hits when they are a small part of the index).
+        """
+        arr = np.atleast_2d(np.asarray(vector, dtype='float32'))
+        self.refresh()
+        with FAISS_SECONDS.time(op='search'), self._lock:
+            if ids is None:
+                self._apply_search_params()
+                d, i = self.index.search(arr, k)
+            else:
+                d, i = self.index.search(arr, k, params=self._search_params(ids))
+        return d.tolist(), i.tolist()
+
+    async def asearch(self, vector, k=3, ids=None):
+        return await asyncio.to_thread(self.search, vector, k, ids)
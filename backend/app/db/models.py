@@ -1,9 +1,108 @@
-from sqlalchemy import Column, Integer, String, Text
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.orm import relationship
 from app.db.database import Base
 
 class Book(Base):
     __tablename__ = 'books'
-    id = Column(Integer, primary_key=True, index=True)
+    # (created_at, id) is the keyset for paging the newest books first
+    __table_args__ = (Index('ix_books_created_id', 'created_at', 'id'),)
+    id = Column(String(36), primary_key=True)
     title = Column(String(255), nullable=False)
-    author = Column(String(255), nullable=False)
-    summary = Column(Text)
\ No newline at end of file
+    author = Column(String(255))
+    topic = Column(Text)
+    summary = Column(Text)
+    mode = Column(String(16), nullable=False, default='single')
+    status = Column(String(16), nullable=False, index=True, default='pending')
+    docx_file = Column(String(512))
+    pdf_file = Column(String(512))
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    chapters = relationship('Chapter', back_populates='book', order_by='Chapter.seq', cascade='all, delete-orphan')
+
+class Chapter(Base):
+    __tablename__ = 'chapters'
+    # (book_id, seq) is both the natural key for upserts and the lookup path
+    __table_args__ = (UniqueConstraint('book_id', 'seq', name='uq_chapter_book_seq'),)
+    id = Column(Integer, primary_key=True)
+    book_id = Column(String(36), ForeignKey('books.id', ondelete='CASCADE'), nullable=False)
+    seq = Column(Integer, nullable=False)
+    title = Column(String(255))
+    synopsis = Column(Text)
+    text = Column(Text)
+    content_hash = Column(String(64))
+    status = Column(String(16), nullable=False, default='pending')
+    provider = Column(String(32))
+    attempts = Column(Integer, nullable=False, default=0)
+    seconds = Column(Float)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    book = relationship('Book', back_populates='chapters')
+
+class Revision(Base):
+    """Every distinct text a chapter has had, so a regenerated chapter never loses the previous one."""
+    __tablename__ = 'revisions'
+    __table_args__ = (UniqueConstraint('chapter_id', 'number', name='uq_revision_chapter_number'),)
+    id = Column(Integer, primary_key=True)
+    chapter_id = Column(Integer, ForeignKey('chapters.id', ondelete='CASCADE'), nullable=False)
+    number = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    provider = Column(String(32))
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class AgentOutput(Base):
+    """A provider-generated agent response (draft, review, design), kept after the response is sent."""
+    __tablename__ = 'agent_outputs'
+    __table_args__ = (Index('ix_agent_outputs_agent_created_id', 'agent', 'created_at', 'id'),
+                      Index('ix_agent_outputs_created_id', 'created_at', 'id'))
+    id = Column(Integer, primary_key=True)
+    agent = Column(String(64), nullable=False)
+    book_id = Column(String(36), ForeignKey('books.id', ondelete='SET NULL'), index=True)
+    prompt_hash = Column(String(64), nullable=False, index=True)
+    provider = Column(String(32))
+    model = Column(String(128))
+    output = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class Job(Base):
+    __tablename__ = 'jobs'
+    id = Column(String(36), primary_key=True)
+    kind = Column(String(64), nullable=False, index=True)
+    status = Column(String(16), nullable=False, index=True, default='queued')
+    params = Column(Text)
+    result = Column(Text)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    # the worker process running the job and its last lease renewal
+    worker_id = Column(String(64))
+    heartbeat_at = Column(DateTime)
+
+class Chunk(Base):
+    __tablename__ = 'chunks'
+    __table_args__ = (UniqueConstraint('doc_key', 'content_hash', name='uq_chunk_doc_hash'),)
+    id = Column(Integer, primary_key=True)
+    doc_key = Column(String(255), nullable=False, index=True)
+    seq = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    text = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class ReviewChunk(Base):
+    """Reviewer output for one manuscript chunk, keyed by chunk content and reviewer configuration."""
+    __tablename__ = 'review_chunks'
+    cache_key = Column(String(64), primary_key=True)
+    content_hash = Column(String(64), nullable=False)
+    review = Column(Text, nullable=False)
+    provider = Column(String(32))
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class ReviewSnapshot(Base):
+    """Chunk hashes of the last reviewed revision of a document, to diff the next review against."""
+    __tablename__ = 'review_snapshots'
+    doc_key = Column(String(255), primary_key=True)
+    chunk_hashes = Column(Text, nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,8 +1,14 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import routes_agents, routes_workflows, routes_health
-from app.db.database import init_db
+from app.api import routes_agents, routes_workflows, routes_health, routes_books, routes_jobs
+from app.db.database import init_db, dispose_async_engine
 from app.utils.logger import logger
+from app.utils.provider_clients import provider_clients
+from app.utils.admission import admit_client
+from app.services.job_service import job_queue
+from app.services.retrieval import retriever, retrieval_enabled
+from app.utils.file_manager import shutdown_export_pool
 
 app = FastAPI(title="Book Writer AI (Robust)")
 
@@ -14,9 +20,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# per-client quotas apply to every route that can reach a provider (job submission opts in per route)
+quota = [Depends(admit_client)]
+
 app.include_router(routes_health.router)
-app.include_router(routes_agents.router, prefix="/agents", tags=["Agents"])
-app.include_router(routes_workflows.router, prefix="/workflows", tags=["Workflows"])
+app.include_router(routes_agents.router, prefix="/agents", tags=["Agents"], dependencies=quota)
+app.include_router(routes_workflows.router, prefix="/workflows", tags=["Workflows"], dependencies=quota)
+app.include_router(routes_books.router, dependencies=quota)
+app.include_router(routes_jobs.router)
 
 @app.on_event('startup')
 async def startup_event():
@@ -25,6 +36,21 @@ async def startup_event():
         logger.info("Database initialized")
     except Exception as e:
         logger.exception("DB init failed: %s", e)
+    try:
+        # loading the embedding model, FAISS snapshot and WAL blocks, so keep it off the event loop
+        if await asyncio.to_thread(retrieval_enabled):
+            await asyncio.to_thread(retriever.open)
+    except Exception as e:
+        logger.exception("FAISS init failed: %s", e)
+    await job_queue.start()
+
+@app.on_event('shutdown')
+async def shutdown_event():
+    await job_queue.stop()
+    await provider_clients.aclose()
+    shutdown_export_pool()
+    await asyncio.to_thread(retriever.close)
+    await dispose_async_engine()
 
 @app.get('/')
 async def root():
@@ -1,17 +1,202 @@
-from app.utils.file_manager import save_docx, save_pdf
-from app.agents.crew_setup import run_writer_agent
+import asyncio, re, time, uuid
+from collections import OrderedDict
+from app.utils.file_manager import export_book
+from app.agents.crew_setup import run_writer_agent, get_crew
+from app.services.retrieval import book_scope
+from app.utils.config import settings
+from app.utils.logger import logger
+from app.utils.metrics import WORKFLOW_SECONDS
+from app.services import manuscript_service as store
+
+# in-process record of outline-mode runs so failed chapters can be retried
+book_runs = OrderedDict()
+MAX_BOOK_RUNS = 100
+
+OUTLINE_LINE = re.compile(r'^\s*(?:chapter\s*)?\d+[.):\-]?\s*(.+?)\s*(?:[:–—-]\s+(.+))?$', re.IGNORECASE)
+
+
+async def generate_book(title: str, topic: str, mode: str = "single", chapters: int = 0):
+    with WORKFLOW_SECONDS.time(workflow=f"book_{mode}"):
+        return await _generate_book(title, topic, mode, chapters)
+
+
+async def _generate_book(title, topic, mode, chapters):
+    if mode == "outline":
+        return await generate_book_from_outline(title, topic, chapters or settings.BOOK_DEFAULT_CHAPTERS)
 
-async def generate_book(title: str, topic: str):
     # Call your CrewAI writer agent
     content = await run_writer_agent(title=title, topic=topic)
 
-    # Save as both DOCX and PDF
-    docx_path = save_docx(title, content)
-    pdf_path = save_pdf(title, content)
+    # Render DOCX and PDF in parallel in the export process pool
+    paths = await export_book(title, [content])
 
+    book_id = str(uuid.uuid4())
+    await _persist("book", _store_single(book_id, title, topic, content, paths))
     return {
+        "book_id": book_id,
         "title": title,
         "topic": topic,
-        "docx_file": docx_path,
-        "pdf_file": pdf_path,
+        "docx_file": paths["docx"],
+        "pdf_file": paths["pdf"],
     }
+
+
+async def _persist(what, coro):
+    # storage is best-effort: a database hiccup must not throw away text we already paid for
+    try:
+        await coro
+    except Exception as e:
+        logger.exception("Failed to persist %s: %s", what, e)
+
+
+async def _store_single(book_id, title, topic, content, paths):
+    await store.create_book(book_id, title, topic=topic, mode="single", status="done",
+                            docx_file=paths["docx"], pdf_file=paths["pdf"])
+    await store.upsert_chapters(book_id, [{"seq": 0, "title": title, "text": content, "status": "done", "attempts": 1}])
+
+
+def _chapter_row(ch):
+    return {"seq": ch["index"], **{k: ch.get(k) for k in store.CHAPTER_FIELDS}}
+
+
+async def _store_outline(book):
+    await store.create_book(book["id"], book["title"], topic=book["topic"], mode="outline", status="writing")
+    await store.upsert_chapters(book["id"], [_chapter_row(c) for c in book["chapters"]])
+
+
+async def _load_run(book_id):
+    """Rebuild an outline-mode run from the database (e.g. after a restart) so it can be retried."""
+    saved = await store.get_book(book_id, with_text=True)
+    if saved is None or saved["mode"] != "outline":
+        return None
+    chapters = [{"index": c["seq"], **{k: c[k] for k in store.CHAPTER_FIELDS}} for c in saved["chapters"]]
+    return {"id": book_id, "title": saved["title"], "topic": saved["topic"], "chapter_count": len(chapters),
+            "outline_seconds": None, "chapters": chapters,
+            "docx_file": saved["docx_file"], "pdf_file": saved["pdf_file"]}
+
+
+def _remember(book):
+    book_runs[book["id"]] = book
+    while len(book_runs) > MAX_BOOK_RUNS:
+        book_runs.popitem(last=False)
+
+
+def parse_outline(text, n):
+    """Turn the writer's outline into up to n {'title', 'synopsis'} entries."""
+    entries = []
+    for line in (text or "").splitlines():
+        m = OUTLINE_LINE.match(line)
+        if m:
+            entries.append({"title": m.group(1).strip(" *#"), "synopsis": (m.group(2) or "").strip()})
+    return entries[:n]
+
+
+async def _write_outline(book):
+    n = book["chapter_count"]
+    out = await get_crew().run_agent_async("outliner", title=book["title"], topic=book["topic"], chapters=n)
+    entries = parse_outline(out.get("text", ""), n)
+    if len(entries) < n:
+        # provider ignored the format (or the simulated provider answered): pad with generic chapters
+        entries += [{"title": f"Chapter {i + 1}", "synopsis": book["topic"]} for i in range(len(entries), n)]
+    return entries
+
+
+def _chapter_prompt(book, index):
+    chapters = book["chapters"]
+    ch = chapters[index]
+    outline = "\n".join(f"{c['index'] + 1}. {c['title']}: {c['synopsis']}" for c in chapters)
+    prompt = (f"Book title: {book['title']}\nTopic: {book['topic']}\nOutline:\n{outline}\n\n"
+              f"Write chapter {index + 1}: {ch['title']}. {ch['synopsis']}")
+    if index > 0:
+        prev = chapters[index - 1]
+        # rolling context: the end of the previous chapter if it is already written, else its synopsis
+        if prev.get("text"):
+            tail = prev["text"][-settings.BOOK_ROLLING_CONTEXT_CHARS:]
+            prompt += f"\n\nThe previous chapter ({prev['title']}) ends:\n{tail}"
+        else:
+            prompt += f"\n\nThe previous chapter ({prev['title']}) is not written yet. Its synopsis:\n{prev['synopsis']}"
+    return prompt
+
+
+async def _write_chapter(book, index, limit):
+    ch = book["chapters"][index]
+    async with limit:
+        ch.update(status="running", error=None)
+        ch["attempts"] += 1
+        start = time.perf_counter()
+        try:
+            crew = get_crew()
+            # chapters draw on (and feed) retrieved context from this book only
+            out = await crew.run_agent_async("writer", scope=book_scope(book["id"]), prompt=_chapter_prompt(book, index))
+            if out.get("provider") == "simulated" and crew.has_provider("writer"):
+                # every configured provider failed; keep the chapter retryable instead of saving a placeholder
+                raise RuntimeError("All providers failed; got simulated output")
+            ch.update(status="done", text=out.get("draft") or out.get("text", ""), provider=out.get("provider"))
+        except Exception as e:
+            logger.exception("Chapter %d of %r failed", index + 1, book["title"])
+            ch.update(status="failed", error=str(e))
+        finally:
+            ch["seconds"] = round(time.perf_counter() - start, 3)
+    # saved as soon as it is written, so a crash only loses chapters still in flight
+    await _persist(f"chapter {index + 1}", store.upsert_chapters(book["id"], [_chapter_row(ch)]))
+
+
+async def _write_chapters(book, indexes):
+    limit = asyncio.Semaphore(settings.BOOK_CHAPTER_CONCURRENCY)
+    await asyncio.gather(*(_write_chapter(book, i, limit) for i in indexes))
+    failed = [c["index"] for c in book["chapters"] if c["status"] != "done"]
+    if not failed:
+        paths = await export_book(book["title"], ((c["title"], c["text"]) for c in book["chapters"]))
+        book.update(docx_file=paths["docx"], pdf_file=paths["pdf"])
+    await _persist("book", store.update_book(book["id"], status="partial" if failed else "done",
+                                             docx_file=book.get("docx_file"), pdf_file=book.get("pdf_file")))
+    return _summary(book)
+
+
+def _summary(book):
+    return {
+        "book_id": book["id"],
+        "title": book["title"],
+        "topic": book["topic"],
+        "mode": "outline",
+        "outline_seconds": book["outline_seconds"],
+        "chapters": [{k: c.get(k) for k in ("index", "title", "status", "seconds", "attempts", "error")}
+                     for c in book["chapters"]],
+        "failed": [c["index"] for c in book["chapters"] if c["status"] != "done"],
+        "docx_file": book.get("docx_file"),
+        "pdf_file": book.get("pdf_file"),
+    }
+
+
+async def generate_book_from_outline(title: str, topic: str, chapter_count: int):
+    """Outline first, then write the chapters concurrently and assemble them in order.
+
+    Failed chapters are reported instead of failing the whole book; pass the
+    returned book_id to `retry_chapters` to redo just those.
+    """
+    book = {"id": str(uuid.uuid4()), "title": title, "topic": topic, "chapter_count": chapter_count}
+    start = time.perf_counter()
+    entries = await _write_outline(book)
+    book["outline_seconds"] = round(time.perf_counter() - start, 3)
+    book["chapters"] = [{"index": i, "title": e["title"], "synopsis": e["synopsis"], "status": "pending",
+                         "text": None, "error": None, "seconds": None, "attempts": 0, "provider": None}
+                        for i, e in enumerate(entries)]
+    _remember(book)
+    await _persist("outline", _store_outline(book))
+    return await _write_chapters(book, range(len(entries)))
+
+
+async def retry_chapters(book_id: str, indexes=None):
+    """Regenerate the given chapters (default: every failed one) of an outline-mode book."""
+    book = book_runs.get(book_id)
+    if book is None:
+        book = await _load_run(book_id)
+        if book is None:
+            raise KeyError(book_id)
+        _remember(book)
+    if indexes is None:
+        indexes = [c["index"] for c in book["chapters"] if c["status"] != "done"]
+    bad = [i for i in indexes if not 0 <= i < len(book["chapters"])]
+    if bad:
+        raise ValueError(f"No such chapters: {bad}")
+    return await _write_chapters(book, indexes)
@@ -0,0 +1,261 @@
+import asyncio, json, os, socket, uuid
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_
+from app.db.database import SessionLocal
+from app.db.models import Job
+from app.utils.config import settings
+from app.utils.logger import logger
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register an async callable as the handler for a job kind."""
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+@job_handler('book')
+async def _run_book(title: str, topic: str, mode: str = 'single', chapters: int = 0):
+    from app.services.book_service import generate_book
+    return await generate_book(title, topic, mode=mode, chapters=chapters)
+
+
+@job_handler('book_flow')
+async def _run_book_flow(prompt: str):
+    from app.api.routes_workflows import runner
+    return await runner.run_book_workflow_async(prompt)
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _job_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class JobQueue:
+    """Bounded pool of asyncio workers executing jobs persisted in the `jobs` table.
+
+    Job rows are the source of truth. A job is run by whichever worker
+    process first moves its row from queued to running with a conditional
+    UPDATE, so with WORKERS > 1 every process polls the table for queued
+    jobs and no job runs twice. The owner renews a lease on each running job;
+    a job whose lease lapses (its process died) is queued again, and a job
+    cancelled through another process is stopped at the next renewal.
+    """
+
+    def __init__(self, concurrency=None, max_queue=None):
+        self.concurrency = concurrency or settings.JOB_WORKERS
+        self.max_queue = max_queue or settings.JOB_QUEUE_SIZE
+        self.worker_id = None
+        self._queue = None
+        self._workers = []
+        self._poller = None
+        self._running = {}  # job id -> handler task
+
+    # -- persistence (sync, run via asyncio.to_thread) --
+
+    def _insert(self, job_id, kind, params):
+        with SessionLocal() as db:
+            db.add(Job(id=job_id, kind=kind, status=QUEUED, params=json.dumps(params)))
+            db.commit()
+
+    def _load(self, job_id):
+        with SessionLocal() as db:
+            job = db.get(Job, job_id)
+            if job is None:
+                return None
+            out = _job_dict(job)
+            out['params'] = json.loads(job.params or '{}')
+            out['result'] = json.loads(job.result) if job.result else None
+            return out
+
+    def _update(self, job_id, only_if=None, owned=False, **fields):
+        """Conditional single-row UPDATE; True when the row matched.
+
+        `only_if` restricts the current status, `owned` to jobs this process is running.
+        """
+        with SessionLocal() as db:
+            query = db.query(Job).filter(Job.id == job_id)
+            if only_if:
+                query = query.filter(Job.status.in_(only_if))
+            if owned:
+                query = query.filter(Job.status == RUNNING, Job.worker_id == self.worker_id)
+            matched = query.update(fields, synchronize_session=False)
+            db.commit()
+            return matched == 1
+
+    def _claim(self, job_id):
+        now = datetime.utcnow()
+        return self._update(job_id, (QUEUED,), status=RUNNING, worker_id=self.worker_id, started_at=now, heartbeat_at=now)
+
+    def _pending_ids(self):
+        with SessionLocal() as db:
+            rows = db.query(Job.id).filter(Job.status.in_([QUEUED, RUNNING])).order_by(Job.created_at).all()
+            db.query(Job).filter(Job.status == RUNNING).update(
+                {Job.status: QUEUED, Job.worker_id: None}, synchronize_session=False)
+            db.commit()
+            return [r[0] for r in rows]
+
+    def _renew(self, job_ids):
+        """Extend the lease on our running jobs; returns the ids we no longer own."""
+        with SessionLocal() as db:
+            mine = (Job.id.in_(job_ids), Job.status == RUNNING, Job.worker_id == self.worker_id)
+            db.query(Job).filter(*mine).update({Job.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+            return set(job_ids) - {r[0] for r in db.query(Job.id).filter(*mine)}
+
+    def _queued_ids(self, limit):
+        """Re-queue jobs whose lease lapsed, then return the oldest queued ids."""
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        with SessionLocal() as db:
+            db.query(Job).filter(Job.status == RUNNING, or_(Job.heartbeat_at < cutoff, Job.heartbeat_at.is_(None))).update(
+                {Job.status: QUEUED, Job.worker_id: None}, synchronize_session=False)
+            db.commit()
+            return [r[0] for r in db.query(Job.id).filter(Job.status == QUEUED).order_by(Job.created_at).limit(limit)]
+
+    def _count_queued(self):
+        with SessionLocal() as db:
+            return db.query(func.count(Job.id)).filter(Job.status == QUEUED).scalar()
+
+    # -- lifecycle --
+
+    async def start(self):
+        if self._workers:
+            return
+        # set here rather than at import so forked workers each get their own id
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._queue = asyncio.Queue()
+        if settings.WORKERS <= 1:
+            # the only worker process: anything left running was interrupted by our own restart
+            try:
+                for job_id in await asyncio.to_thread(self._pending_ids):
+                    self._queue.put_nowait(job_id)
+            except Exception as e:
+                logger.exception('Failed to recover pending jobs: %s', e)
+        self._workers = [asyncio.ensure_future(self._worker(n)) for n in range(self.concurrency)]
+        self._poller = asyncio.ensure_future(self._poll())
+        logger.info('Job queue %s started with %d workers (%d recovered)', self.worker_id, self.concurrency, self._queue.qsize())
+
+    async def stop(self):
+        tasks = self._workers + ([self._poller] if self._poller else [])
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers, self._poller = [], None
+
+    # -- public API --
+
+    async def submit(self, kind, params):
+        if kind not in JOB_HANDLERS:
+            raise ValueError('Unknown job kind: ' + kind)
+        if self._queue is None:
+            raise RuntimeError('Job queue is not running')
+        queued = await asyncio.to_thread(self._count_queued) if settings.WORKERS > 1 else self._queue.qsize()
+        if queued >= self.max_queue:
+            raise QueueFull(f'Job queue is full ({self.max_queue} pending)')
+        job_id = str(uuid.uuid4())
+        await asyncio.to_thread(self._insert, job_id, kind, params)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def get(self, job_id):
+        return await asyncio.to_thread(self._load, job_id)
+
+    async def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if it already finished.
+
+        A job running in another worker process is marked cancelled here and
+        stopped by its owner when it next renews the lease.
+        """
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+            return True
+        return await asyncio.to_thread(
+            self._update, job_id, (QUEUED, RUNNING), status=CANCELLED, finished_at=datetime.utcnow())
+
+    def stats(self):
+        return {
+            'worker_id': self.worker_id,
+            'workers': len(self._workers),
+            'queued': self._queue.qsize() if self._queue else 0,
+            'running': len(self._running),
+        }
+
+    async def _worker(self, n):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._execute(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception('Job worker %d failed on %s: %s', n, job_id, e)
+            finally:
+                self._queue.task_done()
+
+    async def _poll(self):
+        """Renew leases on running jobs and pull queued jobs (from any process) into idle workers."""
+        while True:
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+            try:
+                if self._running:
+                    for job_id in await asyncio.to_thread(self._renew, list(self._running)):
+                        task = self._running.get(job_id)
+                        if task is not None:
+                            logger.info('Job %s was cancelled or reassigned elsewhere; stopping it', job_id)
+                            task.cancel()
+                idle = self.concurrency - len(self._running) - self._queue.qsize()
+                if idle > 0:
+                    for job_id in await asyncio.to_thread(self._queued_ids, idle):
+                        if job_id not in self._running:
+                            self._queue.put_nowait(job_id)
+            except Exception as e:
+                logger.exception('Job queue poll failed: %s', e)
+
+    async def _execute(self, job_id):
+        job = await asyncio.to_thread(self._load, job_id)
+        if job is None or job['status'] != QUEUED:
+            return
+        if not await asyncio.to_thread(self._claim, job_id):
+            return  # another worker claimed it first
+        task = asyncio.ensure_future(JOB_HANDLERS[job['kind']](**job['params']))
+        self._running[job_id] = task
+        try:
+            # wait() instead of awaiting the task so a job cancel is distinguishable from worker shutdown
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            task.cancel()
+            await asyncio.to_thread(self._update, job_id, owned=True, status=QUEUED, started_at=None, worker_id=None)
+            raise
+        finally:
+            self._running.pop(job_id, None)
+
+        if task.cancelled():
+            fields = {'status': CANCELLED}
+        elif task.exception() is not None:
+            logger.error('Job %s (%s) failed: %s', job_id, job['kind'], task.exception())
+            fields = {'status': FAILED, 'error': str(task.exception())}
+        else:
+            fields = {'status': SUCCEEDED, 'result': json.dumps(task.result(), default=str)}
+        # owned: a job cancelled or re-queued from elsewhere keeps the state it was given there
+        await asyncio.to_thread(self._update, job_id, owned=True, finished_at=datetime.utcnow(), **fields)
+
+
+job_queue = JobQueue()
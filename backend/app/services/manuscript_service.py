@@ -0,0 +1,199 @@
+"""Durable store for books, chapters, chapter revisions and agent outputs.
+
+Everything goes through the pooled async engine. Chapters are written with
+one multi-row INSERT .. ON DUPLICATE KEY UPDATE (ON CONFLICT on SQLite and
+PostgreSQL) keyed by (book_id, seq); whenever a chapter's text changes the
+new text is also appended to `revisions`. Lists use keyset pagination: the
+opaque cursor holds the sort key of the last row returned.
+"""
+import base64, json
+from datetime import datetime
+from sqlalchemy import select, update, insert, func, or_, and_
+from sqlalchemy.dialects import mysql, sqlite, postgresql
+from app.db.database import AsyncSessionLocal
+from app.db.models import Book, Chapter, Revision, AgentOutput
+from app.utils.config import settings
+from app.utils.embedding_utils import content_hash
+
+CHAPTER_FIELDS = ('title', 'synopsis', 'text', 'status', 'provider', 'attempts', 'seconds', 'error')
+UPSERT_DIALECTS = {'mysql': mysql, 'sqlite': sqlite, 'postgresql': postgresql}
+
+
+# -- pagination --
+
+def encode_cursor(*values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def page_limit(limit):
+    return max(1, min(limit or settings.PAGE_DEFAULT_LIMIT, settings.PAGE_MAX_LIMIT))
+
+
+def _newest_first(query, model, cursor, limit):
+    """Order by (created_at, id) descending, starting after `cursor`."""
+    if cursor:
+        try:
+            created, key = decode_cursor(cursor)
+            created = datetime.fromisoformat(created)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+        query = query.where(or_(model.created_at < created, and_(model.created_at == created, model.id < key)))
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+
+def _page(rows, limit, to_dict, cursor_of):
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {'items': [to_dict(r) for r in rows], 'next_cursor': cursor_of(rows[-1]) if more else None}
+
+
+def _created_cursor(row):
+    return encode_cursor(row.created_at, row.id)
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+# -- serialization --
+
+def book_dict(book, chapters=None):
+    out = {k: getattr(book, k) for k in ('id', 'title', 'author', 'topic', 'summary', 'mode', 'status', 'docx_file', 'pdf_file')}
+    out.update(created_at=_iso(book.created_at), updated_at=_iso(book.updated_at))
+    if chapters is not None:
+        out['chapters'] = chapters
+    return out
+
+
+def chapter_dict(ch, with_text=True):
+    out = {k: getattr(ch, k) for k in ('seq',) + CHAPTER_FIELDS if with_text or k != 'text'}
+    out.update(content_hash=ch.content_hash, updated_at=_iso(ch.updated_at))
+    return out
+
+
+# -- books --
+
+async def create_book(book_id, title, **fields):
+    async with AsyncSessionLocal() as db:
+        db.add(Book(id=book_id, title=title, **fields))
+        await db.commit()
+    return book_id
+
+
+async def update_book(book_id, **fields):
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Book).where(Book.id == book_id).values(updated_at=datetime.utcnow(), **fields))
+        await db.commit()
+
+
+async def get_book(book_id, with_text=False):
+    async with AsyncSessionLocal() as db:
+        book = await db.get(Book, book_id)
+        if book is None:
+            return None
+        chapters = (await db.execute(select(Chapter).where(Chapter.book_id == book_id).order_by(Chapter.seq))).scalars().all()
+        return book_dict(book, [chapter_dict(c, with_text) for c in chapters])
+
+
+async def list_books(limit=None, cursor=None, status=None):
+    limit = page_limit(limit)
+    query = select(Book)
+    if status:
+        query = query.where(Book.status == status)
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(_newest_first(query, Book, cursor, limit))).scalars().all()
+    return _page(rows, limit, book_dict, _created_cursor)
+
+
+# -- chapters --
+
+def _upsert_statement(dialect, rows, update_cols):
+    module = UPSERT_DIALECTS.get(dialect)
+    if module is None:
+        raise RuntimeError(f'Chapter upsert needs one of the {sorted(UPSERT_DIALECTS)} dialects, not {dialect!r}')
+    stmt = module.insert(Chapter).values(rows)
+    if dialect == 'mysql':
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_cols})
+    return stmt.on_conflict_do_update(index_elements=['book_id', 'seq'], set_={c: stmt.excluded[c] for c in update_cols})
+
+
+async def upsert_chapters(book_id, chapters):
+    """Insert or update chapters in bulk; each dict carries `seq` plus its full state (CHAPTER_FIELDS).
+
+    Returns the seqs whose text changed (and so got a new revision).
+    """
+    if not chapters:
+        return []
+    now = datetime.utcnow()
+    rows = []
+    for ch in chapters:
+        row = {k: ch.get(k) for k in CHAPTER_FIELDS}
+        row.update(book_id=book_id, seq=ch['seq'], attempts=ch.get('attempts') or 0, status=ch.get('status') or 'pending',
+                   content_hash=content_hash(ch['text']) if ch.get('text') else None, created_at=now, updated_at=now)
+        rows.append(row)
+    update_cols = CHAPTER_FIELDS + ('content_hash', 'updated_at')
+    seqs = [r['seq'] for r in rows]
+
+    async with AsyncSessionLocal() as db:
+        before = dict((await db.execute(
+            select(Chapter.seq, Chapter.content_hash).where(Chapter.book_id == book_id, Chapter.seq.in_(seqs)))).all())
+        await db.execute(_upsert_statement(db.bind.dialect.name, rows, update_cols))
+        changed = [r for r in rows if r['content_hash'] and r['content_hash'] != before.get(r['seq'])]
+        if changed:
+            ids = dict((await db.execute(select(Chapter.seq, Chapter.id).where(
+                Chapter.book_id == book_id, Chapter.seq.in_([r['seq'] for r in changed])))).all())
+            latest = dict((await db.execute(select(Revision.chapter_id, func.max(Revision.number)).where(
+                Revision.chapter_id.in_(ids.values())).group_by(Revision.chapter_id))).all())
+            await db.execute(insert(Revision), [
+                {'chapter_id': ids[r['seq']], 'number': latest.get(ids[r['seq']], 0) + 1, 'text': r['text'],
+                 'content_hash': r['content_hash'], 'provider': r['provider'], 'created_at': now}
+                for r in changed])
+        await db.commit()
+    return [r['seq'] for r in changed]
+
+
+async def list_revisions(book_id, seq, limit=None, cursor=None):
+    """Revisions of one chapter, newest first; the cursor is the last revision number."""
+    limit = page_limit(limit)
+    query = (select(Revision).join(Chapter, Chapter.id == Revision.chapter_id)
+             .where(Chapter.book_id == book_id, Chapter.seq == seq))
+    if cursor:
+        number = decode_cursor(cursor)
+        if not (isinstance(number, list) and len(number) == 1 and isinstance(number[0], int)):
+            raise ValueError('Invalid cursor')
+        query = query.where(Revision.number < number[0])
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(query.order_by(Revision.number.desc()).limit(limit + 1))).scalars().all()
+    return _page(rows, limit, lambda r: {'number': r.number, 'text': r.text, 'content_hash': r.content_hash,
+                                         'provider': r.provider, 'created_at': _iso(r.created_at)},
+                 lambda r: encode_cursor(r.number))
+
+
+# -- agent outputs --
+
+async def record_agent_output(agent, prompt_hash, output, provider=None, model=None, book_id=None):
+    async with AsyncSessionLocal() as db:
+        db.add(AgentOutput(agent=agent, prompt_hash=prompt_hash, output=json.dumps(output, default=str),
+                           provider=provider, model=model, book_id=book_id))
+        await db.commit()
+
+
+async def list_agent_outputs(agent=None, limit=None, cursor=None):
+    limit = page_limit(limit)
+    query = select(AgentOutput)
+    if agent:
+        query = query.where(AgentOutput.agent == agent)
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(_newest_first(query, AgentOutput, cursor, limit))).scalars().all()
+    return _page(rows, limit, lambda r: {
+        'id': r.id, 'agent': r.agent, 'provider': r.provider, 'model': r.model, 'book_id': r.book_id,
+        'prompt_hash': r.prompt_hash, 'output': json.loads(r.output), 'created_at': _iso(r.created_at),
+    }, _created_cursor)
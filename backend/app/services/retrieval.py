@@ -0,0 +1,200 @@
+import asyncio, threading, time
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from app.db.database import SessionLocal
+from app.db.models import Chunk
+from app.services.manuscript_service import UPSERT_DIALECTS
+from app.utils.config import settings
+from app.utils.embedding_utils import embed_texts, content_hash, get_embedding_backend
+from app.utils.metrics import RETRIEVAL_SECONDS
+
+
+def _insert_ignore(dialect):
+    """INSERT that skips a row violating the (doc_key, content_hash) constraint; None if the dialect has none."""
+    module = UPSERT_DIALECTS.get(dialect)
+    if module is None:
+        return None
+    if dialect == 'mysql':
+        return module.insert(Chunk).prefix_with('IGNORE')
+    return module.insert(Chunk).on_conflict_do_nothing(index_elements=['doc_key', 'content_hash'])
+
+
+def retrieval_enabled():
+    """RETRIEVAL_ENABLED, or when it is unset, whether the embeddings are semantic.
+
+    The deterministic demo backend seeds vectors from a content hash, so its
+    nearest neighbours are unrelated text.
+    """
+    if settings.RETRIEVAL_ENABLED is not None:
+        return settings.RETRIEVAL_ENABLED
+    return get_embedding_backend().name != 'deterministic'
+
+
+def scoped_key(scope, key):
+    """doc_key of a document stored in `scope` (see `book_scope`); retrieval never crosses scopes."""
+    return f'{scope}/{key}'
+
+
+def book_scope(book_id):
+    return f'book:{book_id}' if book_id else None
+
+
+def chunk_text(text, max_words=None, overlap=None):
+    """Split text into overlapping windows of roughly `max_words` words."""
+    max_words = max_words or settings.RETRIEVAL_CHUNK_WORDS
+    overlap = min(overlap if overlap is not None else settings.RETRIEVAL_CHUNK_OVERLAP, max_words - 1)
+    words = text.split()
+    if not words:
+        return []
+    step = max_words - overlap
+    return [' '.join(words[i:i + max_words]) for i in range(0, max(len(words) - overlap, 1), step)]
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English prose; good enough for budgeting
+    return len(text) // 4 + 1
+
+
+def format_context(chunks):
+    if not chunks:
+        return ''
+    return 'Relevant context from earlier drafts:\n' + '\n---\n'.join(c['text'] for c in chunks) + '\n\n'
+
+
+class Retriever:
+    """Chunk, embed and store documents in FAISS; fetch the most relevant chunks for a prompt.
+
+    Vector ids are `chunks` row ids, so search hits resolve straight to text.
+    """
+
+    def __init__(self, handler=None):
+        self._handler = handler
+        self._open_lock = threading.Lock()
+
+    def open(self):
+        """Build the FAISS handler: snapshot load, WAL replay and possibly the writer lock.
+
+        This blocks, so the app calls it from a thread at startup; `_ahandler`
+        does the same for a process that has not opened it yet.
+        """
+        with self._open_lock:
+            if self._handler is None:
+                from app.db.faiss_handler import FAISSHandler
+                self._handler = FAISSHandler(dim=get_embedding_backend().dim)
+            return self._handler
+
+    async def _ahandler(self):
+        return self._handler if self._handler is not None else await asyncio.to_thread(self.open)
+
+    def close(self):
+        """Flush and, in the writer process, hand the FAISS writer lock on to the next worker."""
+        if self._handler is not None:
+            self._handler.close()
+            self._handler = None
+
+    def stats(self):
+        """FAISS handler stats, or None before this process has touched the index."""
+        return self._handler.stats() if self._handler is not None else None
+
+    def _store_chunks(self, doc_key, pieces):
+        """Insert the pieces not yet stored under `doc_key`; returns [(id, text)] of the rows this call added.
+
+        Rows go in with INSERT .. ON CONFLICT DO NOTHING (INSERT IGNORE on
+        MySQL), so a concurrent call storing the same text neither fails on
+        the (doc_key, content_hash) constraint nor gets the row back to index
+        twice. Other dialects insert each row in a savepoint and skip the ones
+        the constraint rejects.
+        """
+        with SessionLocal() as db:
+            known = {h for (h,) in db.query(Chunk.content_hash).filter(Chunk.doc_key == doc_key)}
+            stmt = _insert_ignore(db.bind.dialect.name)
+            now = datetime.utcnow()
+            added = []
+            for seq, piece in enumerate(pieces):
+                h = content_hash(piece)
+                if h in known:
+                    continue
+                known.add(h)
+                row = dict(doc_key=doc_key, seq=seq, content_hash=h, text=piece, created_at=now)
+                if stmt is None:
+                    try:
+                        with db.begin_nested():
+                            res = db.execute(insert(Chunk).values(**row))
+                    except IntegrityError:
+                        continue
+                else:
+                    res = db.execute(stmt.values(**row))
+                if res.rowcount == 1:
+                    added.append((res.inserted_primary_key[0], piece))
+            db.commit()
+            return added
+
+    def _load_chunks(self, ids):
+        with SessionLocal() as db:
+            rows = db.query(Chunk).filter(Chunk.id.in_(ids)).all()
+            return {r.id: {'id': r.id, 'doc_key': r.doc_key, 'seq': r.seq, 'text': r.text} for r in rows}
+
+    def _scope_ids(self, scope, exclude_doc_key=None):
+        with SessionLocal() as db:
+            query = db.query(Chunk.id).filter(Chunk.doc_key.startswith(scoped_key(scope, ''), autoescape=True))
+            if exclude_doc_key is not None:
+                query = query.filter(Chunk.doc_key != exclude_doc_key)
+            return [i for (i,) in query]
+
+    async def index_document(self, doc_key, text):
+        """Store new chunks of `text` under `doc_key`; returns how many were added."""
+        pieces = chunk_text(text)
+        if not pieces:
+            return 0
+        stored = await asyncio.to_thread(self._store_chunks, doc_key, pieces)
+        if not stored:
+            return 0
+        ids, texts = zip(*stored)
+        matrix = await asyncio.to_thread(embed_texts, texts)
+        handler = await self._ahandler()
+        await handler.aadd_vectors(matrix, ids=list(ids))
+        return len(stored)
+
+    async def retrieve(self, query, scope, k=None, token_budget=None, exclude_doc_key=None, min_similarity=None):
+        """Return (chunks, elapsed_ms): the top-k chunks of `scope` for `query` that fit in the token budget.
+
+        Only documents stored under `scoped_key(scope, ...)` are searched, and
+        hits less similar than `min_similarity` (cosine, RETRIEVAL_MIN_SIMILARITY
+        by default) are dropped. Chunks already contained in the query, or
+        stored under `exclude_doc_key`, are skipped.
+        """
+        start = time.perf_counter()
+        k = k or settings.RETRIEVAL_TOP_K
+        budget = token_budget or settings.RETRIEVAL_TOKEN_BUDGET
+        if min_similarity is None:
+            min_similarity = settings.RETRIEVAL_MIN_SIMILARITY
+        # embeddings are unit length, so squared L2 distance = 2 - 2 * cosine similarity
+        max_distance = 2 - 2 * min_similarity
+        chunks = []
+        allowed = await asyncio.to_thread(self._scope_ids, scope, exclude_doc_key) if query and scope else []
+        if allowed:
+            handler = await self._ahandler()
+            await handler.arefresh()  # no-op in the FAISS writer process
+            vector = await asyncio.to_thread(embed_texts, [query])
+            distances, ids = await handler.asearch(vector, min(k * 2, len(allowed)), ids=allowed)
+            hits = [i for d, i in zip(distances[0], ids[0]) if i >= 0 and d <= max_distance]
+            rows = await asyncio.to_thread(self._load_chunks, hits) if hits else {}
+            used = 0
+            for i in hits:
+                row = rows.get(i)
+                if row is None or row['text'] in query:
+                    continue
+                cost = estimate_tokens(row['text'])
+                if used + cost > budget:
+                    break
+                chunks.append(row)
+                used += cost
+                if len(chunks) >= k:
+                    break
+        elapsed = time.perf_counter() - start
+        RETRIEVAL_SECONDS.observe(elapsed)
+        return chunks, elapsed * 1000
+
+
+retriever = Retriever()
@@ -0,0 +1,167 @@
+"""Incremental review: only chunks that changed since the last review go to the reviewer.
+
+A manuscript is split into paragraph-aligned chunks whose boundaries are
+chosen by paragraph content (a boundary falls after a paragraph whose hash
+is 0 mod BOUNDARY_MODULUS once the chunk reaches REVIEW_CHUNK_WORDS), so an
+edit only moves the boundaries of the chunk it lands in. Each chunk's review
+is stored under its content hash plus the reviewer's model and template
+fingerprint; a re-review sends just the chunks without a stored review,
+each wrapped in a little surrounding context, and merges the fresh reviews
+with the stored ones in manuscript order.
+"""
+import asyncio, json, re
+from sqlalchemy import select
+from app.db.database import AsyncSessionLocal
+from app.db.models import ReviewChunk, ReviewSnapshot
+from app.utils.cache import make_cache_key
+from app.utils.config import settings
+from app.utils.embedding_utils import content_hash
+from app.utils.logger import logger
+from app.utils.metrics import REVIEW_CHUNKS
+
+BOUNDARY_MODULUS = 4
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+def split_review_chunks(text, target_words=None, max_words=None):
+    """[{'seq', 'text', 'hash', 'words'}] covering every paragraph of `text` in order."""
+    target = target_words or settings.REVIEW_CHUNK_WORDS
+    limit = max(max_words or settings.REVIEW_CHUNK_MAX_WORDS, target)
+    chunks, current, words = [], [], 0
+
+    def close():
+        nonlocal current, words
+        if current:
+            body = '\n\n'.join(current)
+            chunks.append({'seq': len(chunks), 'text': body, 'hash': content_hash(body), 'words': words})
+        current, words = [], 0
+
+    for para in (p.strip() for p in PARAGRAPH_BREAK.split(text or '')):
+        if not para:
+            continue
+        n = len(para.split())
+        if n > limit:
+            # an oversized paragraph is cut into fixed windows of its own
+            close()
+            tokens = para.split()
+            for i in range(0, n, limit):
+                current, words = [' '.join(tokens[i:i + limit])], len(tokens[i:i + limit])
+                close()
+            continue
+        if words and words + n > limit:
+            close()
+        current.append(para)
+        words += n
+        if words >= target and int(content_hash(para)[:8], 16) % BOUNDARY_MODULUS == 0:
+            close()
+    close()
+    return chunks
+
+
+def _review_prompt(chunks, i, context_words):
+    parts = []
+    if i > 0 and context_words:
+        parts.append('[Preceding text, for context only]\n...' + ' '.join(chunks[i - 1]['text'].split()[-context_words:]))
+    parts.append('[Passage to review]\n' + chunks[i]['text'])
+    if i + 1 < len(chunks) and context_words:
+        parts.append('[Following text, for context only]\n' + ' '.join(chunks[i + 1]['text'].split()[:context_words]) + '...')
+    return '\n\n'.join(parts)
+
+
+def _review_text(out):
+    if out.get('text'):
+        return out['text']
+    parts = []
+    if out.get('issues'):
+        parts.append('Issues: ' + '; '.join(map(str, out['issues'])))
+    if out.get('corrected'):
+        parts.append(out['corrected'])
+    return '\n'.join(parts)
+
+
+async def _load_reviews(keys):
+    if not keys:
+        return {}
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(ReviewChunk).where(ReviewChunk.cache_key.in_(keys)))).scalars().all()
+    return {r.cache_key: {'review': json.loads(r.review), 'provider': r.provider} for r in rows}
+
+
+async def _load_snapshot(doc_key):
+    async with AsyncSessionLocal() as db:
+        row = await db.get(ReviewSnapshot, doc_key)
+    return json.loads(row.chunk_hashes) if row else []
+
+
+async def _save(doc_key, chunks, fresh):
+    async with AsyncSessionLocal() as db:
+        for key, (chunk, out) in fresh.items():
+            await db.merge(ReviewChunk(cache_key=key, content_hash=chunk['hash'], review=json.dumps(out, default=str),
+                                       provider=out.get('provider')))
+        await db.merge(ReviewSnapshot(doc_key=doc_key, chunk_hashes=json.dumps([c['hash'] for c in chunks])))
+        await db.commit()
+
+
+async def incremental_review(doc_key, text, crew=None):
+    """Review `text` as the next revision of `doc_key`, reusing stored reviews of unchanged chunks."""
+    if crew is None:
+        from app.agents.crew_setup import get_crew
+        crew = get_crew()
+    cfg = crew.registry.get('reviewer')
+    model = cfg.get('model', {})
+    # a stored review is only valid for the same reviewer model, settings and template
+    fingerprint = make_cache_key('reviewer', crew.registry.fingerprints.get('reviewer', ''), model.get('name'),
+                                 model.get('temperature'), model.get('provider'))
+    chunks = split_review_chunks(text)
+    keys = [make_cache_key(fingerprint, c['hash']) for c in chunks]
+    previous, stored = await asyncio.gather(_load_snapshot(doc_key), _load_reviews(list(set(keys))))
+    previous_set = set(previous)
+
+    limit = asyncio.Semaphore(settings.REVIEW_CONCURRENCY)
+    fresh = {}
+
+    async def review(i):
+        async with limit:
+            out = await crew.run_agent_async('reviewer', text=_review_prompt(chunks, i, settings.REVIEW_CONTEXT_WORDS))
+        if out.get('provider') != 'simulated':
+            # simulated reviews are placeholders; never let them stand in for a real one later
+            fresh[keys[i]] = (chunks[i], out)
+        return out
+
+    todo = {}
+    for i, key in enumerate(keys):
+        if key not in stored and key not in todo:
+            todo[key] = i
+    results = dict(zip(todo, await asyncio.gather(*(review(i) for i in todo.values()))))
+    REVIEW_CHUNKS.inc(len(todo), result='reviewed')
+    REVIEW_CHUNKS.inc(len(chunks) - len(todo), result='reused')
+
+    try:
+        await _save(doc_key, chunks, fresh)
+    except Exception as e:
+        logger.exception('Failed to store incremental review of %s: %s', doc_key, e)
+
+    sections = []
+    for chunk, key in zip(chunks, keys):
+        reused = key not in results
+        out = stored[key]['review'] if reused else results[key]
+        sections.append({
+            'seq': chunk['seq'],
+            'hash': chunk['hash'],
+            'words': chunk['words'],
+            'changed': chunk['hash'] not in previous_set,
+            'reused': reused,
+            'provider': out.get('provider'),
+            'review': _review_text(out),
+        })
+    current_set = {c['hash'] for c in chunks}
+    return {
+        'doc_key': doc_key,
+        'chunks': len(chunks),
+        'reviewed': len(todo),
+        'reused': len(chunks) - len(todo),
+        'changed': [s['seq'] for s in sections if s['changed']],
+        'removed': sum(1 for h in previous_set if h not in current_set),
+        'sections': sections,
+        'review': '\n\n'.join(f"Passage {s['seq'] + 1}:\n{s['review']}" for s in sections),
+    }
@@ -0,0 +1,170 @@
+"""Admission control: token buckets per provider and per client.
+
+Provider buckets (requests/min and tokens/min) keep us under upstream rate
+limits; callers wait for capacity in a bounded queue and are rejected with
+429 as soon as that queue is full or the wait would exceed the limit.
+Client quotas are enforced without waiting. Buckets live in each worker
+process, so with WORKERS > 1 every worker enforces its share of a limit.
+"""
+import asyncio, math, time
+from fastapi import HTTPException, Request
+from app.utils.config import settings
+from app.utils.logger import logger
+
+
+class AdmissionRejected(HTTPException):
+    def __init__(self, detail, retry_after=1.0):
+        super().__init__(status_code=429, detail=detail, headers={'Retry-After': str(max(1, int(retry_after + 0.999)))})
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, n=1):
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    def wait_time(self, n=1):
+        self._refill()
+        n = min(n, self.capacity)  # a request larger than the bucket waits for a full bucket
+        return 0.0 if self.tokens >= n else (n - self.tokens) / self.rate
+
+    @classmethod
+    def per_minute(cls, limit):
+        return cls(limit / 60.0, limit)
+
+
+class AdmissionQueue:
+    """Waiters for one provider's request and token buckets, admitted in FIFO order."""
+
+    def __init__(self, name, rpm, tpm, max_queue, max_wait):
+        self.name = name
+        self.requests = TokenBucket.per_minute(rpm) if rpm else None
+        self.tokens = TokenBucket.per_minute(tpm) if tpm else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._lock = asyncio.Lock()
+        self.waiting = 0
+        self.counters = {'admitted': 0, 'rejected': 0, 'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0}
+
+    def _wait_time(self, tokens):
+        wait = self.requests.wait_time(1) if self.requests else 0.0
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    def _reject(self, reason, retry_after):
+        self.counters['rejected'] += 1
+        logger.warning('Admission rejected for %s: %s', self.name, reason)
+        raise AdmissionRejected(f'{self.name} is overloaded: {reason}', retry_after)
+
+    async def acquire(self, tokens=0):
+        if self.waiting >= self.max_queue:
+            self._reject(f'queue full ({self.max_queue} waiting)', self._wait_time(tokens))
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            # the lock makes waiters take capacity in arrival order
+            async with self._lock:
+                while True:
+                    wait = self._wait_time(tokens)
+                    if wait <= 0:
+                        break
+                    if time.monotonic() - start + wait > self.max_wait:
+                        self._reject(f'wait would exceed {self.max_wait}s', wait)
+                    await asyncio.sleep(wait)
+                if self.requests:
+                    self.requests.try_take(1)
+                if self.tokens and tokens:
+                    self.tokens.tokens -= min(tokens, self.tokens.capacity)
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.counters['admitted'] += 1
+        self.counters['wait_seconds_total'] += waited
+        self.counters['wait_seconds_max'] = max(self.counters['wait_seconds_max'], waited)
+
+    def snapshot(self):
+        admitted = self.counters['admitted']
+        return {
+            **{k: round(v, 4) if isinstance(v, float) else v for k, v in self.counters.items()},
+            'queue_depth': self.waiting,
+            'wait_seconds_avg': round(self.counters['wait_seconds_total'] / admitted, 4) if admitted else 0.0,
+        }
+
+
+def worker_share(limit):
+    """This worker's part of a per-deployment limit (0 stays 0: unlimited)."""
+    return math.ceil(limit / max(1, settings.WORKERS)) if limit else limit
+
+
+class AdmissionController:
+    def __init__(self):
+        self.providers = {}
+        self.clients = {}
+        self.client_rejections = 0
+
+    def _provider_queue(self, name):
+        q = self.providers.get(name)
+        if q is None:
+            limits = (settings.ADMISSION_PROVIDER_LIMITS or {}).get(name, {})
+            q = self.providers[name] = AdmissionQueue(
+                name,
+                rpm=worker_share(limits.get('rpm', settings.ADMISSION_PROVIDER_RPM)),
+                tpm=worker_share(limits.get('tpm', settings.ADMISSION_PROVIDER_TPM)),
+                max_queue=limits.get('max_queue', settings.ADMISSION_MAX_QUEUE),
+                max_wait=limits.get('max_wait', settings.ADMISSION_MAX_WAIT),
+            )
+        return q
+
+    async def acquire_provider(self, name, tokens=0):
+        if settings.ADMISSION_ENABLED:
+            await self._provider_queue(name).acquire(tokens)
+
+    def admit_client(self, client_id):
+        if not settings.ADMISSION_ENABLED or not settings.ADMISSION_CLIENT_RPM:
+            return
+        bucket = self.clients.get(client_id)
+        if bucket is None:
+            if len(self.clients) >= settings.ADMISSION_MAX_CLIENTS:
+                # forget the least recently created client rather than grow without bound
+                self.clients.pop(next(iter(self.clients)))
+            bucket = self.clients[client_id] = TokenBucket.per_minute(worker_share(settings.ADMISSION_CLIENT_RPM))
+        if not bucket.try_take(1):
+            self.client_rejections += 1
+            raise AdmissionRejected('Client request quota exceeded', bucket.wait_time(1))
+
+    def snapshot(self):
+        return {
+            'enabled': settings.ADMISSION_ENABLED,
+            'providers': {name: q.snapshot() for name, q in self.providers.items()},
+            'clients_tracked': len(self.clients),
+            'client_rejections': self.client_rejections,
+        }
+
+
+admission = AdmissionController()
+
+
+def estimate_tokens(prompt, max_tokens=0):
+    return len(prompt) // 4 + 1 + max_tokens
+
+
+async def admit_client(request: Request):
+    """FastAPI dependency enforcing the per-client quota (X-Client-Id header, else client IP)."""
+    client_id = request.headers.get('x-client-id') or (request.client.host if request.client else 'anonymous')
+    admission.admit_client(client_id)
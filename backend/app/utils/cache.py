@@ -0,0 +1,173 @@
+import asyncio, hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from app.utils.config import settings
+from app.utils.logger import logger
+
+
+def make_cache_key(agent, prompt, model_name=None, temperature=None, provider=None):
+    """Stable content hash of everything that determines a completion."""
+    payload = json.dumps(
+        {'agent': agent, 'prompt': prompt, 'model': model_name, 'temperature': temperature, 'provider': provider},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SQLiteCacheTier:
+    """On-disk tier so cached completions survive restarts.
+
+    WAL mode lets several worker processes share one file: readers never
+    block, and writers wait up to `timeout` seconds for each other. Every
+    `purge_every` writes also delete the expired rows, so entries that are
+    never read again do not grow the file without bound.
+    """
+
+    def __init__(self, path, timeout=5.0, purge_every=256):
+        self.path = path
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires_at FROM response_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None, None
+            if row[1] < time.time():
+                self._conn.execute('DELETE FROM response_cache WHERE key = ?', (key,))
+                self._conn.commit()
+                return None, None
+            return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires_at),
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._purge()
+            self._conn.commit()
+
+    def _purge(self):
+        return self._conn.execute('DELETE FROM response_cache WHERE expires_at < ?', (time.time(),)).rowcount
+
+    def purge_expired(self):
+        with self._lock:
+            purged = self._purge()
+            self._conn.commit()
+            return purged
+
+
+class ResponseCache:
+    """Two-tier completion cache: in-process LRU with TTL, optional SQLite below it.
+
+    The memory tier evicts least-recently-used entries once either the entry
+    count or the total serialized size exceeds its limit.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=3600, sqlite_path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._disk = SQLiteCacheTier(sqlite_path) if sqlite_path else None
+        self.counters = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'expirations': 0}
+
+    @classmethod
+    def from_settings(cls):
+        sqlite_path = settings.CACHE_SQLITE_PATH
+        if sqlite_path is None and settings.WORKERS > 1:
+            # worker processes share completions through one SQLite file (an empty path opts out)
+            sqlite_path = settings.CACHE_SHARED_PATH
+        try:
+            return cls(
+                max_entries=settings.CACHE_MAX_ENTRIES,
+                max_bytes=settings.CACHE_MAX_BYTES,
+                ttl=settings.CACHE_TTL_SECONDS,
+                sqlite_path=sqlite_path,
+            )
+        except Exception as e:
+            logger.exception('Failed to open cache database %s, using memory only: %s', sqlite_path, e)
+            return cls(settings.CACHE_MAX_ENTRIES, settings.CACHE_MAX_BYTES, settings.CACHE_TTL_SECONDS)
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _remember(self, key, value, expires_at):
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.counters['evictions'] += 1
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] >= time.time():
+                self._entries.move_to_end(key)
+                self.counters['hits'] += 1
+                self.counters['memory_hits'] += 1
+                return entry[2]
+            self._drop(key)
+            self.counters['expirations'] += 1
+        if self._disk is not None:
+            try:
+                value, expires_at = await asyncio.to_thread(self._disk.get, key)
+            except Exception as e:
+                logger.exception('Cache disk read failed: %s', e)
+                value = None
+            if value is not None:
+                self._remember(key, value, expires_at)
+                self.counters['hits'] += 1
+                self.counters['disk_hits'] += 1
+                return value
+        self.counters['misses'] += 1
+        return None
+
+    async def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        self.counters['sets'] += 1
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.set, key, value, expires_at)
+            except Exception as e:
+                logger.exception('Cache disk write failed: %s', e)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self):
+        lookups = self.counters['hits'] + self.counters['misses']
+        return {
+            **self.counters,
+            'hit_ratio': (self.counters['hits'] / lookups) if lookups else 0.0,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'disk_enabled': self._disk is not None,
+        }
+
+
+response_cache = ResponseCache.from_settings()
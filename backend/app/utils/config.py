@@ -2,10 +2,88 @@ from pydantic import BaseSettings
 
 class Settings(BaseSettings):
     MYSQL_URI: str = 'sqlite:///./dev.db'
+    WORKERS: int = 1
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    PAGE_DEFAULT_LIMIT: int = 20
+    PAGE_MAX_LIMIT: int = 100
+    PERSIST_AGENT_OUTPUTS: bool = True
     OPENAI_API_KEY: str | None = None
     HUGGINGFACEHUB_API_TOKEN: str | None = None
+    OLLAMA_API_KEY: str | None = None
+    OLLAMA_BASE_URL: str | None = None
+    OPENAI_BASE_URL: str = 'https://api.openai.com/v1'
+    OPENAI_MODEL: str = 'gpt-4o-mini'
+    HF_BASE_URL: str = 'https://api-inference.huggingface.co/models'
     FAISS_PATH: str = './data/faiss.index'
+    FAISS_FLUSH_BATCH: int = 1024
+    FAISS_FLUSH_INTERVAL: float = 30.0
+    FAISS_WAL_FSYNC: bool = False
+    FAISS_INDEX_TYPE: str = 'flat'
+    FAISS_TRAIN_SIZE: int = 50000
+    FAISS_NLIST: int = 0
+    FAISS_NPROBE: int = 16
+    FAISS_PQ_M: int = 64
+    FAISS_PQ_NBITS: int = 8
+    FAISS_HNSW_M: int = 32
+    FAISS_HNSW_EF_CONSTRUCTION: int = 200
+    FAISS_EF_SEARCH: int = 64
+    FAISS_ROLE: str = 'auto'
+    FAISS_SYNC_INTERVAL: float = 1.0
+    EMBEDDING_BACKEND: str = 'deterministic'
+    EMBEDDING_MODEL: str = 'sentence-transformers/all-mpnet-base-v2'
+    EMBEDDING_DIM: int = 768
+    EMBEDDING_CACHE_SIZE: int = 10000
+    RETRIEVAL_ENABLED: bool | None = None
+    RETRIEVAL_TOP_K: int = 5
+    RETRIEVAL_MIN_SIMILARITY: float = 0.3
+    RETRIEVAL_TOKEN_BUDGET: int = 800
+    RETRIEVAL_CHUNK_WORDS: int = 200
+    RETRIEVAL_CHUNK_OVERLAP: int = 40
     BACKEND_PORT: int = 8000
+    WORKFLOW_MAX_CONCURRENCY: int = 4
+    AGENT_RELOAD_INTERVAL: float = 2.0
+    CACHE_ENABLED: bool = True
+    CACHE_TTL_SECONDS: int = 3600
+    CACHE_MAX_ENTRIES: int = 1024
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    CACHE_SQLITE_PATH: str | None = None
+    CACHE_SHARED_PATH: str = './data/response_cache.db'
+    HTTP_MAX_CONNECTIONS: int = 20
+    HTTP_MAX_KEEPALIVE: int = 10
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 120.0
+    ROUTER_WINDOW: int = 50
+    ROUTER_FAILURE_THRESHOLD: int = 5
+    ROUTER_ERROR_RATE: float = 0.5
+    ROUTER_MIN_SAMPLES: int = 10
+    ROUTER_OPEN_SECONDS: float = 30.0
+    ROUTER_HEDGE_ENABLED: bool = False
+    ROUTER_HEDGE_PERCENTILE: float = 95.0
+    ROUTER_HEDGE_MIN_SAMPLES: int = 20
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_PROVIDER_RPM: int = 60
+    ADMISSION_PROVIDER_TPM: int = 150000
+    ADMISSION_PROVIDER_LIMITS: dict = {}
+    ADMISSION_MAX_QUEUE: int = 32
+    ADMISSION_MAX_WAIT: float = 30.0
+    ADMISSION_CLIENT_RPM: int = 120
+    ADMISSION_MAX_CLIENTS: int = 10000
+    JOB_WORKERS: int = 2
+    JOB_QUEUE_SIZE: int = 100
+    JOB_POLL_INTERVAL: float = 1.0
+    JOB_LEASE_SECONDS: float = 60.0
+    EXPORT_WORKERS: int = 2
+    BOOK_DEFAULT_CHAPTERS: int = 10
+    BOOK_CHAPTER_CONCURRENCY: int = 4
+    BOOK_ROLLING_CONTEXT_CHARS: int = 1500
+    REVIEW_CHUNK_WORDS: int = 400
+    REVIEW_CHUNK_MAX_WORDS: int = 800
+    REVIEW_CONTEXT_WORDS: int = 60
+    REVIEW_CONCURRENCY: int = 4
 
     class Config:
         env_file = '.env'
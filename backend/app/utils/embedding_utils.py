@@ -1,6 +1,148 @@
+import hashlib, threading
+from collections import OrderedDict
 import numpy as np
+from app.utils.config import settings
+from app.utils.logger import logger
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except Exception:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+
+def content_hash(text):
+    """Process-independent hash of a text (unlike the salted builtin hash())."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingBackend:
+    """Turns a batch of texts into a contiguous float32 matrix of shape (n, dim)."""
+    name = 'base'
+    dim = 768
+
+    def embed(self, texts):
+        raise NotImplementedError
+
+
+class DeterministicBackend(EmbeddingBackend):
+    """Demo/testing embedder: pseudo-random vectors seeded by the text's content hash.
+
+    The whole batch is generated at once with a vectorised splitmix64 instead
+    of one RNG per text, and is identical across processes and workers.
+    """
+    name = 'deterministic'
+
+    def __init__(self, dim=768):
+        self.dim = dim
+
+    def embed(self, texts):
+        seeds = np.array([int(content_hash(t)[:16], 16) for t in texts], dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            z = seeds[:, None] + (np.arange(1, self.dim + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+            z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            z = z ^ (z >> np.uint64(31))
+        # top 24 bits -> uniform float32 in [0, 1)
+        return ((z >> np.uint64(40)).astype(np.float32) * np.float32(1.0 / (1 << 24)))
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    name = 'sentence_transformers'
+
+    def __init__(self, model_name, batch_size=64):
+        if not SENTENCE_TRANSFORMERS_AVAILABLE:
+            raise RuntimeError('sentence-transformers is not installed')
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+
+    def embed(self, texts):
+        out = self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                normalize_embeddings=True, show_progress_bar=False)
+        return np.ascontiguousarray(out, dtype=np.float32)
+
+
+class EmbeddingCache:
+    """LRU of embedding rows keyed by (backend, dim, content hash)."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0}
+
+    def get(self, key):
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                self.counters['misses'] += 1
+                return None
+            self._rows.move_to_end(key)
+            self.counters['hits'] += 1
+            return row
+
+    def put(self, key, row):
+        with self._lock:
+            self._rows[key] = row
+            self._rows.move_to_end(key)
+            while len(self._rows) > self.max_entries:
+                self._rows.popitem(last=False)
+
+    def stats(self):
+        return {**self.counters, 'entries': len(self._rows)}
+
+
+_backend = None
+embedding_cache = EmbeddingCache(settings.EMBEDDING_CACHE_SIZE)
+
+
+def get_embedding_backend():
+    global _backend
+    if _backend is None:
+        if settings.EMBEDDING_BACKEND == 'sentence_transformers':
+            try:
+                _backend = SentenceTransformerBackend(settings.EMBEDDING_MODEL)
+            except Exception as e:
+                logger.exception('Falling back to deterministic embeddings: %s', e)
+        if _backend is None:
+            _backend = DeterministicBackend(settings.EMBEDDING_DIM)
+    return _backend
+
+
+def set_embedding_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def embed_texts(texts, backend=None):
+    """Embed a list of texts into one (n, dim) float32 matrix.
+
+    Repeated texts (within the batch or seen before) are served from the
+    cache; only the distinct misses reach the backend, in a single call.
+    """
+    backend = backend or get_embedding_backend()
+    texts = list(texts)
+    out = np.empty((len(texts), backend.dim), dtype=np.float32)
+    missing = {}  # cache key -> (text, [row positions])
+    for i, text in enumerate(texts):
+        key = (backend.name, backend.dim, content_hash(text))
+        row = embedding_cache.get(key)
+        if row is not None:
+            out[i] = row
+        else:
+            missing.setdefault(key, (text, []))[1].append(i)
+    if missing:
+        keys = list(missing)
+        vectors = backend.embed([missing[k][0] for k in keys])
+        for key, vec in zip(keys, vectors):
+            embedding_cache.put(key, vec.copy())  # a copy: a row view would share the batch's memory
+            out[missing[key][1]] = vec
+    return out
+
+
 def text_to_vector(text, dim=768):
-    # deterministic vector via seeded rng for demo/testing
-    seed = abs(hash(text)) % (2**32)
-    rng = np.random.default_rng(seed)
-    return rng.random(dim).astype('float32').tolist()
\ No newline at end of file
+    backend = get_embedding_backend()
+    if backend.dim != dim:
+        backend = DeterministicBackend(dim)
+    return embed_texts([text], backend=backend)[0].tolist()
@@ -1,7 +1,12 @@
-import os
+import os, re, json, uuid, asyncio, tempfile, unicodedata, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import escape
 from docx import Document
-from reportlab.platypus import SimpleDocTemplate, Paragraph
+from reportlab.platypus import SimpleDocTemplate, Paragraph, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet
+from app.utils.config import settings
+from app.utils.logger import logger
+from app.utils.metrics import EXPORT_SECONDS
 
 DOCS_DIR = "output/docs"
 PDF_DIR = "output/pdfs"
@@ -9,18 +14,153 @@ PDF_DIR = "output/pdfs"
 os.makedirs(DOCS_DIR, exist_ok=True)
 os.makedirs(PDF_DIR, exist_ok=True)
 
-def save_docx(book_title: str, content: str) -> str:
-    path = os.path.join(DOCS_DIR, f"{book_title}.docx")
+_export_pool = None
+
+
+def safe_filename(title: str, max_len: int = 80) -> str:
+    """Filesystem-safe, collision-free base name derived from a book title."""
+    ascii_title = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode()
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", ascii_title).strip("-").lower()[:max_len] or "book"
+    return f"{slug}-{uuid.uuid4().hex[:8]}"
+
+
+def _normalize_chapter(chapter):
+    if isinstance(chapter, str):
+        return {"title": None, "text": chapter}
+    if isinstance(chapter, dict):
+        return {"title": chapter.get("title"), "text": chapter.get("text") or chapter.get("content", "")}
+    title, text = chapter
+    return {"title": title, "text": text}
+
+
+def _iter_spool(spool_path):
+    with open(spool_path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _atomic_target(path):
+    return f"{path}.{uuid.uuid4().hex[:6]}.tmp"
+
+
+def _render_docx(spool_path: str, path: str) -> str:
+    tmp = _atomic_target(path)
     doc = Document()
-    for line in content.split("\n"):
-        doc.add_paragraph(line)
-    doc.save(path)
+    for chapter in _iter_spool(spool_path):
+        if chapter["title"]:
+            doc.add_heading(chapter["title"], level=1)
+        for line in chapter["text"].split("\n"):
+            doc.add_paragraph(line)
+    doc.save(tmp)
+    os.replace(tmp, path)
     return path
 
-def save_pdf(book_title: str, content: str) -> str:
-    path = os.path.join(PDF_DIR, f"{book_title}.pdf")
+
+def _render_pdf(spool_path: str, path: str) -> str:
+    tmp = _atomic_target(path)
     styles = getSampleStyleSheet()
-    doc = SimpleDocTemplate(path)
-    story = [Paragraph(line, styles["Normal"]) for line in content.split("\n")]
-    doc.build(story)
+    story = []
+    for n, chapter in enumerate(_iter_spool(spool_path)):
+        if n:
+            story.append(PageBreak())
+        if chapter["title"]:
+            story.append(Paragraph(escape(chapter["title"]), styles["Heading1"]))
+        story.extend(Paragraph(escape(line), styles["Normal"]) for line in chapter["text"].split("\n"))
+    SimpleDocTemplate(tmp).build(story)
+    os.replace(tmp, path)
     return path
+
+
+RENDERERS = {
+    "docx": (DOCS_DIR, _render_docx),
+    "pdf": (PDF_DIR, _render_pdf),
+}
+
+
+def _spool(chapters, fd):
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        for chapter in chapters:
+            f.write(json.dumps(_normalize_chapter(chapter)) + "\n")
+
+
+def _write_spool(content, spool_path):
+    fd = os.open(spool_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    _spool([content] if isinstance(content, str) else content, fd)
+
+
+def save_docx(book_title: str, content) -> str:
+    return _save_sync("docx", book_title, content)
+
+
+def save_pdf(book_title: str, content) -> str:
+    return _save_sync("pdf", book_title, content)
+
+
+def _save_sync(fmt, book_title, content):
+    out_dir, render = RENDERERS[fmt]
+    fd, spool_path = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    try:
+        _write_spool(content, spool_path)
+        return render(spool_path, os.path.join(out_dir, f"{safe_filename(book_title)}.{fmt}"))
+    finally:
+        os.remove(spool_path)
+
+
+async def _timed_render(fmt, job):
+    # timed from the event loop: the renderers run in worker processes
+    with EXPORT_SECONDS.time(format=fmt):
+        return await job
+
+
+def get_export_pool():
+    global _export_pool
+    if _export_pool is None:
+        # forkserver, not fork: by now this process runs the log listener and FAISS threads,
+        # and a forked child could inherit one of their locks held
+        _export_pool = ProcessPoolExecutor(max_workers=settings.EXPORT_WORKERS,
+                                           mp_context=multiprocessing.get_context("forkserver"))
+    return _export_pool
+
+
+def shutdown_export_pool():
+    global _export_pool
+    if _export_pool is not None:
+        _export_pool.shutdown(wait=False, cancel_futures=True)
+        _export_pool = None
+
+
+async def export_book(book_title: str, chapters, formats=("docx", "pdf")) -> dict:
+    """Render a book to several formats at once in the export process pool.
+
+    `chapters` may be a string, or a (sync or async) iterable of strings,
+    (title, text) pairs or {"title", "text"} dicts. It is spooled to a temp
+    file one chapter at a time, and each renderer streams from that file, so
+    the whole manuscript is never held as one string. Outputs get sanitized,
+    unique names and are written via temp file + rename.
+    """
+    fd, spool_path = tempfile.mkstemp(suffix=".jsonl")
+    try:
+        if hasattr(chapters, "__aiter__"):
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                async for chapter in chapters:
+                    await asyncio.to_thread(f.write, json.dumps(_normalize_chapter(chapter)) + "\n")
+        else:
+            os.close(fd)
+            await asyncio.to_thread(_write_spool, chapters, spool_path)
+
+        base = safe_filename(book_title)
+        loop = asyncio.get_running_loop()
+        pool = get_export_pool()
+        jobs = {}
+        for fmt in formats:
+            out_dir, render = RENDERERS[fmt]
+            jobs[fmt] = _timed_render(fmt, loop.run_in_executor(pool, render, spool_path, os.path.join(out_dir, f"{base}.{fmt}")))
+        paths = await asyncio.gather(*jobs.values())
+        return dict(zip(jobs, paths))
+    except Exception:
+        logger.exception("Export of %r failed", book_title)
+        raise
+    finally:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
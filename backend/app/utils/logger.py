@@ -1,12 +1,20 @@
-import logging, os
+import atexit, logging, logging.handlers, os, queue
 LOG_DIR = './logs'
 os.makedirs(LOG_DIR, exist_ok=True)
+
+# Request handlers only enqueue records; a listener thread does the file and
+# console I/O so a slow disk never stalls the event loop.
+_log_queue = queue.SimpleQueue()
+_listener = logging.handlers.QueueListener(
+    _log_queue,
+    logging.FileHandler(os.path.join(LOG_DIR, 'app.log')),
+    logging.StreamHandler(),
+)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(LOG_DIR, 'app.log')),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
 )
-logger = logging.getLogger('book_writer_ai')
\ No newline at end of file
+_listener.start()
+atexit.register(_listener.stop)
+logger = logging.getLogger('book_writer_ai')
@@ -0,0 +1,174 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Counters and histograms are updated on the hot path (plain dict updates
+under a lock, safe from worker threads); collectors registered with
+`metrics.collector` turn the existing stats dicts (response cache, router,
+admission, job queue) into samples at scrape time.
+"""
+import bisect, threading, time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f'{self.name} expects labels {self.label_names}, got {sorted(labels)}')
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f'{self.name}{_labels(self.label_names, k)} {_number(v)}' for k, v in items]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block in seconds, including when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(counts), total)) for k, (counts, total) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = [('le', _number(float(bound)) if bound != float('inf') else '+Inf')]
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, key)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError('Duplicate metric: ' + metric.name)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def collector(self, fn):
+        """Register `fn() -> [(name, kind, help, [(labels dict, value)])]`, called on every scrape."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        for fn in self._collectors:
+            try:
+                families = fn()
+            except Exception as e:
+                lines.append(f'# collector {getattr(fn, "__name__", fn)} failed: {_escape(e)}')
+                continue
+            for name, kind, help, samples in families:
+                lines += [f'# HELP {name} {help}', f'# TYPE {name} {kind}']
+                for labels, value in samples:
+                    lines.append(f'{name}{_labels(list(labels), list(labels.values()))} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+# -- hot-path metrics --
+
+PROMPT_RENDER_SECONDS = metrics.histogram(
+    'prompt_render_seconds', 'Time to render an agent prompt template.', ['agent'],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05))
+PROVIDER_REQUEST_SECONDS = metrics.histogram(
+    'provider_request_seconds', 'LLM provider call latency (streams: until the last token).', ['provider', 'model', 'mode'])
+PROVIDER_FIRST_TOKEN_SECONDS = metrics.histogram(
+    'provider_first_token_seconds', 'Time to first streamed token.', ['provider', 'model'])
+PROVIDER_ERRORS = metrics.counter('provider_errors_total', 'Failed LLM provider calls.', ['provider', 'model'])
+PROVIDER_TOKENS = metrics.counter(
+    'provider_tokens_total', 'Prompt and completion tokens (estimated when the provider reports no usage).',
+    ['provider', 'model', 'kind'])
+RETRIEVAL_SECONDS = metrics.histogram('retrieval_seconds', 'Retrieval of context chunks for a prompt.')
+FAISS_SECONDS = metrics.histogram('faiss_seconds', 'FAISS index operations.', ['op'])
+EXPORT_SECONDS = metrics.histogram('export_render_seconds', 'Rendering a book to one output format.', ['format'])
+WORKFLOW_SECONDS = metrics.histogram('workflow_seconds', 'End-to-end workflow and book generation time.', ['workflow'])
+WORKFLOW_TASK_SECONDS = metrics.histogram('workflow_task_seconds', 'Time spent in one workflow task.', ['agent'])
+AGENT_CACHE_HITS = metrics.counter('agent_cache_hits_total', 'Agent calls answered from the response cache.', ['agent'])
+AGENT_SIMULATED = metrics.counter(
+    'agent_simulated_fallbacks_total', 'Agent calls answered by the simulated provider.', ['agent'])
+REVIEW_CHUNKS = metrics.counter(
+    'review_chunks_total', 'Incremental review chunks, sent to the reviewer or reused from the review cache.', ['result'])
@@ -0,0 +1,55 @@
+import asyncio
+from app.utils.config import settings
+from app.utils.logger import logger
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except Exception:
+    HTTPX_AVAILABLE = False
+
+
+class ProviderClientRegistry:
+    """Long-lived async HTTP clients, one per (provider, base URL).
+
+    Each client keeps a keep-alive connection pool so provider calls reuse
+    TCP/TLS connections instead of paying a handshake per request.
+    """
+
+    def __init__(self, max_connections=None, max_keepalive=None, keepalive_expiry=None,
+                 connect_timeout=None, read_timeout=None):
+        self.max_connections = max_connections or settings.HTTP_MAX_CONNECTIONS
+        self.max_keepalive = max_keepalive or settings.HTTP_MAX_KEEPALIVE
+        self.keepalive_expiry = keepalive_expiry or settings.HTTP_KEEPALIVE_EXPIRY
+        self.connect_timeout = connect_timeout or settings.HTTP_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or settings.HTTP_READ_TIMEOUT
+        self._clients = {}
+
+    def get(self, provider, base_url):
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError('httpx is not installed')
+        key = (provider, base_url.rstrip('/'))
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=key[1],
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            )
+            self._clients[key] = client
+            logger.info('Created %s client for %s', provider, key[1])
+        return client
+
+    async def aclose(self):
+        clients, self._clients = list(self._clients.values()), {}
+        results = await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
+        for r in results:
+            if isinstance(r, Exception):
+                logger.warning('Failed closing provider client: %s', r)
+
+
+provider_clients = ProviderClientRegistry()
@@ -0,0 +1,50 @@
+import asyncio
+from app.utils.logger import logger
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still running await the same task. A failure is delivered to every waiter
+    and the key is released, so the next call retries. Cancelling one waiter
+    does not cancel the shared work unless it was the last one waiting.
+    """
+
+    def __init__(self):
+        self._inflight = {}  # key -> [task, waiter count]
+        self.counters = {'calls': 0, 'coalesced': 0}
+
+    def _release(self, key, task):
+        entry = self._inflight.get(key)
+        if entry is not None and entry[0] is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug('Single-flight call %s failed: %s', key, task.exception())
+
+    async def do(self, key, fn):
+        self.counters['calls'] += 1
+        entry = self._inflight.get(key)
+        # a finished task whose done callback has not run yet (its _release is pending) is not joinable
+        if entry is None or entry[0].done():
+            task = asyncio.ensure_future(fn())
+            entry = self._inflight[key] = [task, 0]
+            task.add_done_callback(lambda t: self._release(key, t))
+        else:
+            self.counters['coalesced'] += 1
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and entry[1] == 1:
+                task.cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+    def stats(self):
+        return {**self.counters, 'inflight': len(self._inflight)}
+
+
+agent_calls = SingleFlight()
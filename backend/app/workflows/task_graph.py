@@ -0,0 +1,109 @@
+import asyncio, yaml
+from pathlib import Path
+from app.utils.config import settings
+from app.utils.logger import logger
+from app.utils.metrics import WORKFLOW_TASK_SECONDS
+
+TASKS_FILE = Path(__file__).parent.parent / 'config' / 'tasks.yaml'
+
+
+def output_text(out):
+    """Text an agent output hands to downstream tasks."""
+    return out.get('draft') or out.get('text', '')
+
+
+class TaskGraph:
+    """Dependency graph of agent tasks declared in `config/tasks.yaml`.
+
+    Each task names an agent, the template variable it fills (`prompt_var`)
+    and optionally the upstream tasks (`inputs`) it consumes. Tasks start as
+    soon as their inputs are done, so independent branches run concurrently.
+    """
+
+    def __init__(self, tasks, max_concurrency=None):
+        self.tasks = tasks
+        self.max_concurrency = max_concurrency or settings.WORKFLOW_MAX_CONCURRENCY
+        self.order = self._toposort()
+
+    @classmethod
+    def from_config(cls, workflow='book_flow', path=None):
+        cfg = yaml.safe_load(Path(path or TASKS_FILE).read_text()) or {}
+        all_tasks = cfg.get('tasks') or {}
+        flow = (cfg.get('workflows') or {}).get(workflow)
+        if flow is None:
+            raise ValueError('Unknown workflow: ' + workflow)
+        names = flow.get('tasks') or list(all_tasks)
+        missing = [n for n in names if n not in all_tasks]
+        if missing:
+            raise ValueError(f'Workflow {workflow} references unknown tasks: {missing}')
+        return cls({n: all_tasks[n] for n in names}, max_concurrency=flow.get('max_concurrency'))
+
+    def _toposort(self):
+        order, state = [], {}
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError('Cycle in task graph: ' + ' -> '.join(path + [name]))
+            state[name] = 'visiting'
+            for dep in self.tasks[name].get('inputs') or []:
+                if dep not in self.tasks:
+                    raise ValueError(f'Task {name} depends on unknown task {dep}')
+                visit(dep, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for name in self.tasks:
+            visit(name, [])
+        return order
+
+    def _task_kwargs(self, name, inputs, upstream):
+        task = self.tasks[name]
+        var = task.get('prompt_var', 'prompt')
+        if upstream:
+            value = '\n\n'.join(output_text(out) for out in upstream)
+        else:
+            value = inputs.get(var, '')
+        return {var: value}
+
+    async def _call_agent(self, crew, name, kwargs, emit):
+        agent = self.tasks[name]['agent']
+        with WORKFLOW_TASK_SECONDS.time(agent=agent):
+            if emit is None:
+                return await crew.run_agent_async(agent, **kwargs)
+            info, chunks = {}, []
+            async for token in crew.stream_agent_async(agent, info=info, **kwargs):
+                chunks.append(token)
+                emit({'event': 'token', 'task': name, 'agent': agent, 'token': token})
+        out = {'text': ''.join(chunks), **info}
+        emit({'event': 'task_done', 'task': name, 'agent': agent, 'output': out})
+        return out
+
+    async def run(self, crew, inputs, max_concurrency=None, emit=None):
+        """Run every task and return a mapping of task name to agent output.
+
+        With `emit`, agents are streamed and every token and finished task is
+        passed to `emit` as an event dict.
+        """
+        limit = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+        futures = {}
+
+        async def run_task(name):
+            task = self.tasks[name]
+            upstream = [await futures[dep] for dep in task.get('inputs') or []]
+            kwargs = self._task_kwargs(name, inputs, upstream)
+            async with limit:
+                logger.info('Running task %s (agent=%s)', name, task['agent'])
+                return await self._call_agent(crew, name, kwargs, emit)
+
+        # topological order guarantees upstream futures exist before dependants
+        for name in self.order:
+            futures[name] = asyncio.ensure_future(run_task(name))
+        try:
+            results = await asyncio.gather(*futures.values())
+        except BaseException:
+            for fut in futures.values():
+                fut.cancel()
+            raise
+        return dict(zip(futures, results))
@@ -1,13 +1,44 @@
-from app.agents.crew_setup import CrewManager
+from app.agents.crew_setup import get_crew
+from app.workflows.task_graph import TaskGraph
 from app.utils.logger import logger
+from app.utils.metrics import WORKFLOW_SECONDS
 import asyncio
 
 class WorkflowRunner:
-    def __init__(self):
-        self.crew = CrewManager.load_from_folder()
+    def __init__(self, workflow='book_flow'):
+        self.crew = get_crew()
+        self.workflow = workflow
+        self.graph = TaskGraph.from_config(workflow)
 
     async def run_book_workflow_async(self, prompt: str):
-        writer = await self.crew.run_agent_async('writer', prompt=prompt)
-        reviewer = await self.crew.run_agent_async('reviewer', text=writer.get('draft') or writer.get('text',''))
-        designer = await self.crew.run_agent_async('designer', context=writer.get('draft') or writer.get('text',''))
-        return {'writer': writer, 'reviewer': reviewer, 'designer': designer}
\ No newline at end of file
+        # writer runs first; reviewer and designer only depend on the draft and run concurrently
+        with WORKFLOW_SECONDS.time(workflow=self.workflow):
+            results = await self.graph.run(self.crew, {'prompt': prompt})
+        return {self.graph.tasks[name]['agent']: out for name, out in results.items()}
+
+    async def stream_book_workflow(self, prompt: str):
+        """Yield workflow events (tokens, finished tasks, final result) as they happen."""
+        queue = asyncio.Queue()
+        done = object()
+
+        async def drive():
+            try:
+                with WORKFLOW_SECONDS.time(workflow=self.workflow + '_stream'):
+                    results = await self.graph.run(self.crew, {'prompt': prompt}, emit=queue.put_nowait)
+                queue.put_nowait({'event': 'result', 'result': {self.graph.tasks[n]['agent']: out for n, out in results.items()}})
+            except Exception as e:
+                logger.exception('Streaming workflow failed')
+                queue.put_nowait({'event': 'error', 'detail': str(e)})
+            finally:
+                queue.put_nowait(done)
+
+        runner = asyncio.ensure_future(drive())
+        try:
+            while True:
+                event = await queue.get()
+                if event is done:
+                    break
+                yield event
+        finally:
+            # client went away: stop generating
+            runner.cancel()
@@ -0,0 +1,117 @@
+"""Benchmark harness.
+
+    cd backend
+    python -m bench run --output bench-results.json
+    python -m bench run --provider fake --fake-latency 0.2 --driver uvicorn --suite api
+    python -m bench compare bench-results.json baseline.json --threshold 0.2
+
+`run` writes machine-readable JSON (and compares it when --baseline is
+given); `compare` exits with status 1 when any benchmark regressed by more
+than the threshold, so it can gate a deploy.
+"""
+import argparse, asyncio, json, sys, tempfile
+from pathlib import Path
+
+SUITES = ('api', 'micro')
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Book Writer AI benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='run benchmarks and write a JSON result file')
+    run.add_argument('--suite', action='append', choices=SUITES, help='default: all suites')
+    run.add_argument('--scenario', action='append', help='API scenario to run (default: all)')
+    run.add_argument('--driver', action='append', choices=('inprocess', 'uvicorn'), help='default: inprocess')
+    run.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    run.add_argument('--provider', choices=('simulated', 'fake'), default='simulated')
+    run.add_argument('--fake-latency', type=float, default=0.05, help='fake server time to first token (s)')
+    run.add_argument('--fake-token-latency', type=float, default=0.002, help='fake server delay per token (s)')
+    run.add_argument('--fake-tokens', type=int, default=200)
+    run.add_argument('--requests', type=int, default=200, help='requests per API scenario (books use a share)')
+    run.add_argument('--concurrency', type=int, default=16)
+    run.add_argument('--cache', action='store_true', help='leave the response cache enabled')
+    run.add_argument('--faiss-sizes', default='1000,10000,50000')
+    run.add_argument('--faiss-index', default='flat', help='flat, ivf_flat, ivf_pq or hnsw')
+    run.add_argument('--export-repeat', type=int, default=5)
+    run.add_argument('--quick', action='store_true', help='small sizes for a smoke run')
+    run.add_argument('--output', default='bench-results.json')
+    run.add_argument('--baseline')
+    run.add_argument('--threshold', type=float, default=0.2)
+
+    cmp = sub.add_parser('compare', help='compare a result file with a baseline')
+    cmp.add_argument('current')
+    cmp.add_argument('baseline')
+    cmp.add_argument('--threshold', type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+def _report_regressions(current, baseline, threshold):
+    from bench.report import compare
+    regressions = compare(current, baseline, threshold)
+    for name, metric, old, new, change in regressions:
+        pct = '' if change is None else f' ({change:+.0%})'
+        print(f'REGRESSION {name} {metric}: {old} -> {new}{pct}')
+    if not regressions:
+        print(f'No regressions beyond {threshold:.0%} against the baseline')
+    return 1 if regressions else 0
+
+
+async def _run_api(args, drivers):
+    from bench.api import SCENARIOS, run_api
+    from bench.drivers import DRIVERS
+    names = args.scenario or list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f'Unknown scenarios: {sorted(unknown)}')
+    results = {}
+    for name in drivers:
+        driver = DRIVERS[name](workers=args.workers) if name == 'uvicorn' else DRIVERS[name]()
+        async with driver as client:
+            results.update(await run_api(client, names, args.requests, args.concurrency, f'{name}.{args.provider}'))
+    return results
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    if args.command == 'compare':
+        current, baseline = (json.loads(Path(p).read_text()) for p in (args.current, args.baseline))
+        return _report_regressions(current, baseline, args.threshold)
+
+    output = Path(args.output).resolve()
+    baseline = Path(args.baseline).resolve() if args.baseline else None
+    if args.quick:
+        args.requests, args.faiss_sizes, args.export_repeat = min(args.requests, 20), '1000,5000', 2
+    suites = args.suite or list(SUITES)
+
+    from bench.drivers import configure_env
+    from bench.fake_llm import FakeLLMServer
+    fake = FakeLLMServer(args.fake_latency, args.fake_token_latency, args.fake_tokens) if args.provider == 'fake' else None
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    results = {}
+    try:
+        if fake is not None:
+            fake.start()
+        configure_env(workdir, fake=fake, cache=args.cache)
+        if 'micro' in suites:
+            from bench.micro import bench_embeddings, bench_faiss, bench_export
+            results.update(bench_embeddings(200 if args.quick else 2000))
+            results.update(bench_faiss([int(s) for s in args.faiss_sizes.split(',')], index_type=args.faiss_index))
+            results.update(bench_export(args.export_repeat))
+        if 'api' in suites:
+            results.update(asyncio.run(_run_api(args, args.driver or ['inprocess'])))
+    finally:
+        if fake is not None:
+            fake.stop()
+
+    from bench.report import write_results, print_table
+    doc = write_results(output, results, vars(args))
+    print_table(results)
+    print(f'Results written to {output} (scratch files in {workdir})')
+    if baseline is not None:
+        return _report_regressions(doc, json.loads(baseline.read_text()), args.threshold)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""HTTP load scenarios against the agent, workflow and book endpoints."""
+import asyncio, time
+from bench.report import summarize
+
+# name -> (method, path, request kwargs factory, share of the configured request count)
+# Every request gets a distinct prompt so the single-flight layer cannot coalesce them.
+SCENARIOS = {
+    'agents_write': ('POST', '/agents/write', lambda i: {'json': {'prompt': f'A lighthouse keeper finds a letter #{i}'}}, 1.0),
+    'agents_review': ('POST', '/agents/review', lambda i: {'json': {'text': f'The draft number {i} is here.'}}, 1.0),
+    'agents_design': ('POST', '/agents/design', lambda i: {'json': {'context': f'A mystery novel, edition {i}'}}, 1.0),
+    'agents_write_stream': ('POST', '/agents/write/stream', lambda i: {'json': {'prompt': f'Stream a tale #{i}'}}, 1.0),
+    'workflows_run_book_flow': ('POST', '/workflows/run_book_flow', lambda i: {'json': {'prompt': f'Book flow #{i}'}}, 0.5),
+    'books_generate': ('POST', '/books/generate', lambda i: {'params': {'title': f'Bench {i}', 'topic': 'the sea'}}, 0.25),
+    'books_generate_outline': ('POST', '/books/generate', lambda i: {
+        'params': {'title': f'Bench outline {i}', 'topic': 'the sea', 'mode': 'outline', 'chapters': 3}}, 0.1),
+}
+
+
+async def run_load(client, method, path, make_kwargs, requests, concurrency):
+    """Fire `requests` requests with at most `concurrency` in flight; returns summary stats."""
+    limit = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with limit:
+            start = time.perf_counter()
+            try:
+                resp = await client.request(method, path, **make_kwargs(i))
+                ok = resp.status_code < 400 and 'event: error' not in resp.text[:4096]
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(latencies, time.perf_counter() - start, errors, concurrency=concurrency)
+
+
+async def run_api(client, names, requests, concurrency, label):
+    results = {}
+    for name in names:
+        method, path, make_kwargs, share = SCENARIOS[name]
+        n = max(1, int(requests * share))
+        # warm up lazily initialized state (FAISS index, registry, connection pools) outside the measurement
+        await client.request(method, path, **make_kwargs(-1))
+        results[f'{label}.{name}'] = await run_load(client, method, path, make_kwargs, n, concurrency)
+    return results
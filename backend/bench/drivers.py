@@ -0,0 +1,100 @@
+"""Ways of driving the backend: in-process over ASGI, or a real uvicorn process over HTTP.
+
+`configure_env` must run before anything imports `app`, since settings are
+read once at import time.
+"""
+import asyncio, os, subprocess, sys, time
+from pathlib import Path
+import httpx
+from bench.fake_llm import free_port
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PROVIDER_ENV = ('OPENAI_API_KEY', 'OPENAI_BASE_URL', 'HUGGINGFACEHUB_API_TOKEN', 'OLLAMA_API_KEY', 'OLLAMA_BASE_URL')
+
+
+def configure_env(workdir, fake=None, cache=False):
+    """Point the app at a scratch directory and at `fake` (a FakeLLMServer) or the simulated provider."""
+    workdir = Path(workdir)
+    os.environ.update({
+        'MYSQL_URI': f'sqlite:///{workdir / "bench.db"}',
+        'FAISS_PATH': str(workdir / 'faiss.index'),
+        'CACHE_ENABLED': 'true' if cache else 'false',
+        'CACHE_SQLITE_PATH': '',
+        # benchmarks measure the service, not the quotas protecting it
+        'ADMISSION_ENABLED': 'false',
+        'AGENT_RELOAD_INTERVAL': '0',
+    })
+    for key in PROVIDER_ENV:
+        os.environ.pop(key, None)
+    # empty values shadow anything a .env file would provide
+    os.environ.update({key: '' for key in ('OPENAI_API_KEY', 'HUGGINGFACEHUB_API_TOKEN', 'OLLAMA_API_KEY')})
+    if fake is not None:
+        os.environ.update({
+            'OPENAI_API_KEY': 'bench',
+            'OPENAI_BASE_URL': fake.openai_url,
+            'OLLAMA_BASE_URL': fake.ollama_url,
+        })
+    os.chdir(workdir)  # logs/ and output/ are relative to the working directory
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+
+class InProcessDriver:
+    """Calls the ASGI app directly; no sockets, so it isolates application overhead."""
+
+    name = 'inprocess'
+
+    async def __aenter__(self):
+        from app.main import app
+        self.app = app
+        await app.router.startup()
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://bench', timeout=600)
+        return self.client
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        await self.app.router.shutdown()
+
+
+class UvicornDriver:
+    """Runs `uvicorn app.main:app` in a subprocess (inheriting the configured env) and talks HTTP to it."""
+
+    name = 'uvicorn'
+
+    def __init__(self, workers=1, max_connections=100):
+        self.workers = workers
+        self.max_connections = max_connections
+        self.port = free_port()
+        self.proc = None
+
+    async def __aenter__(self):
+        env = {**os.environ, 'WORKERS': str(self.workers),
+               'PYTHONPATH': os.pathsep.join(filter(None, [str(BACKEND_DIR), os.environ.get('PYTHONPATH')]))}
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1', '--port', str(self.port),
+             '--workers', str(self.workers), '--log-level', 'warning'],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        self.client = httpx.AsyncClient(base_url=f'http://127.0.0.1:{self.port}', timeout=600, limits=limits)
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                if (await self.client.get('/health')).status_code == 200:
+                    return self.client
+            except httpx.TransportError:
+                pass
+            if self.proc.poll() is not None or time.monotonic() > deadline:
+                await self.__aexit__()
+                raise RuntimeError('uvicorn did not come up')
+            await asyncio.sleep(0.1)
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+DRIVERS = {'inprocess': InProcessDriver, 'uvicorn': UvicornDriver}
@@ -0,0 +1,131 @@
+"""Stand-in LLM server mimicking the OpenAI chat completions and Ollama generate APIs.
+
+Latency is configurable per request (time to first token) and per streamed
+token, so provider-bound paths can be benchmarked without network access or
+API keys. Runs in a background thread on an ephemeral port.
+"""
+import asyncio, json, socket, threading, time
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def build_app(latency=0.05, token_latency=0.002, tokens=200):
+    app = FastAPI()
+    app.state.requests = 0
+
+    def words(prompt):
+        seed = sum(prompt.encode()) % 997
+        return [f'w{(seed + i) % 97}' for i in range(tokens)]
+
+    def usage(prompt):
+        return {'prompt_tokens': len(prompt) // 4 + 1, 'completion_tokens': tokens}
+
+    async def token_stream(prompt, frame):
+        await asyncio.sleep(latency)
+        for i, word in enumerate(words(prompt)):
+            yield frame(word if i == 0 else ' ' + word)
+            if token_latency:
+                await asyncio.sleep(token_latency)
+
+    @app.post('/v1/chat/completions')
+    async def chat_completions(request: Request):
+        app.state.requests += 1
+        body = await request.json()
+        prompt = ''.join(m.get('content', '') for m in body.get('messages', []))
+        if body.get('stream'):
+            def frame(token):
+                return 'data: ' + json.dumps({'choices': [{'delta': {'content': token}}]}) + '\n\n'
+
+            async def events():
+                async for chunk in token_stream(prompt, frame):
+                    yield chunk
+                yield 'data: [DONE]\n\n'
+            return StreamingResponse(events(), media_type='text/event-stream')
+        await asyncio.sleep(latency + token_latency * tokens)
+        return JSONResponse({
+            'choices': [{'message': {'role': 'assistant', 'content': ' '.join(words(prompt))}}],
+            'usage': usage(prompt),
+        })
+
+    @app.post('/api/generate')
+    async def ollama_generate(request: Request):
+        app.state.requests += 1
+        body = await request.json()
+        prompt = body.get('prompt', '')
+        if body.get('stream'):
+            def frame(token):
+                return json.dumps({'response': token, 'done': False}) + '\n'
+
+            async def lines():
+                async for chunk in token_stream(prompt, frame):
+                    yield chunk
+                yield json.dumps({'response': '', 'done': True, 'eval_count': tokens}) + '\n'
+            return StreamingResponse(lines(), media_type='application/x-ndjson')
+        await asyncio.sleep(latency + token_latency * tokens)
+        u = usage(prompt)
+        return JSONResponse({'response': ' '.join(words(prompt)), 'done': True,
+                             'prompt_eval_count': u['prompt_tokens'], 'eval_count': u['completion_tokens']})
+
+    return app
+
+
+class FakeLLMServer:
+    """`with FakeLLMServer(latency=0.1) as fake:` exposes `fake.openai_url` / `fake.ollama_url`."""
+
+    def __init__(self, latency=0.05, token_latency=0.002, tokens=200, port=None):
+        self.app = build_app(latency, token_latency, tokens)
+        self.port = port or free_port()
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host='127.0.0.1', port=self.port,
+                                                     log_level='warning', lifespan='off'))
+        self._thread = None
+
+    @property
+    def ollama_url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    @property
+    def openai_url(self):
+        return self.ollama_url + '/v1'
+
+    @property
+    def requests(self):
+        return self.app.state.requests
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError('Fake LLM server did not start')
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--token-latency', type=float, default=0.002)
+    parser.add_argument('--tokens', type=int, default=200)
+    args = parser.parse_args()
+    uvicorn.run(build_app(args.latency, args.token_latency, args.tokens), host='127.0.0.1', port=args.port)
@@ -0,0 +1,89 @@
+"""Micro-benchmarks for embedding, FAISS ingest/search and DOCX/PDF export."""
+import asyncio, os, tempfile, time
+import numpy as np
+from bench.report import summarize
+
+
+def _timed_calls(fn, args_list):
+    latencies = []
+    start = time.perf_counter()
+    for args in args_list:
+        t = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - t)
+    return latencies, time.perf_counter() - start
+
+
+def bench_embeddings(n=2000):
+    from app.utils.embedding_utils import text_to_vector, embed_texts, embedding_cache
+    texts = [f'Chapter {i}: the tide came in over the stones and the keeper waited.' for i in range(n)]
+    results = {}
+    latencies, elapsed = _timed_calls(text_to_vector, [(t,) for t in texts])
+    results['micro.text_to_vector'] = summarize(latencies, elapsed)
+    latencies, elapsed = _timed_calls(text_to_vector, [(t,) for t in texts])
+    results['micro.text_to_vector_cached'] = summarize(latencies, elapsed)
+    embedding_cache._rows.clear()
+    batch = [t + ' (batch)' for t in texts]
+    start = time.perf_counter()
+    embed_texts(batch)
+    elapsed = time.perf_counter() - start
+    results['micro.embed_texts_batch'] = summarize([elapsed], elapsed, batch_size=n, texts_per_sec=round(n / elapsed, 1))
+    return results
+
+
+def bench_faiss(sizes=(1000, 10000, 50000), index_type='flat', dim=768, queries=200, k=10, batch=1000):
+    from app.db.faiss_handler import FAISSHandler
+    rng = np.random.default_rng(0)
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            handler = FAISSHandler(dim=dim, path=os.path.join(tmp, 'bench.index'), flush_batch=10 ** 9,
+                                   flush_interval=10 ** 9, index_type=index_type)
+            data = rng.standard_normal((size, dim), dtype=np.float32)
+            latencies, elapsed = _timed_calls(handler.add_vectors, [(data[i:i + batch],) for i in range(0, size, batch)])
+            results[f'micro.faiss_add.{index_type}.{size}'] = summarize(
+                latencies, elapsed, batch_size=batch, vectors_per_sec=round(size / elapsed, 1))
+            start = time.perf_counter()
+            handler.flush()
+            results[f'micro.faiss_flush.{index_type}.{size}'] = summarize([time.perf_counter() - start], time.perf_counter() - start)
+            probes = rng.standard_normal((queries, dim), dtype=np.float32)
+            latencies, elapsed = _timed_calls(handler.search, [(probes[i], k) for i in range(queries)])
+            results[f'micro.faiss_search.{index_type}.{size}'] = summarize(latencies, elapsed, k=k)
+            # what the other worker processes serve: the published snapshot, memory-mapped
+            reader = FAISSHandler(dim=dim, path=handler.path, index_type=index_type, role='reader')
+            latencies, elapsed = _timed_calls(reader.search, [(probes[i], k) for i in range(queries)])
+            results[f'micro.faiss_search_mmap.{index_type}.{size}'] = summarize(latencies, elapsed, k=k)
+            reader.close()
+            handler.close()
+    return results
+
+
+def _book(chapters=10, words=1000):
+    para = ' '.join(f'word{i % 50}' for i in range(100))
+    return [(f'Chapter {c + 1}', '\n'.join([para] * (words // 100))) for c in range(chapters)]
+
+
+def bench_export(repeat=5, chapters=10, words=1000):
+    from app.utils.file_manager import save_docx, save_pdf, export_book, shutdown_export_pool
+    book = _book(chapters, words)
+    results = {}
+    for fmt, fn in (('docx', save_docx), ('pdf', save_pdf)):
+        latencies, elapsed = _timed_calls(fn, [('Bench export', book)] * repeat)
+        results[f'micro.export_{fmt}'] = summarize(latencies, elapsed, chapters=chapters, words_per_chapter=words)
+
+    async def parallel():
+        await export_book('Bench warmup', book)  # spin up the process pool outside the measurement
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(repeat):
+            t = time.perf_counter()
+            await export_book('Bench export', book)
+            latencies.append(time.perf_counter() - t)
+        return latencies, time.perf_counter() - start
+
+    try:
+        latencies, elapsed = asyncio.run(parallel())
+    finally:
+        shutdown_export_pool()
+    results['micro.export_book_parallel'] = summarize(latencies, elapsed, chapters=chapters, words_per_chapter=words)
+    return results
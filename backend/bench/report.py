@@ -0,0 +1,85 @@
+"""Latency summaries, JSON result files and baseline comparison."""
+import json, platform, subprocess, sys, time
+from pathlib import Path
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+def summarize(latencies, elapsed, errors=0, **extra):
+    """Stats for one benchmark; latencies in seconds, reported in milliseconds."""
+    lat = sorted(latencies)
+    ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        'count': len(lat),
+        'errors': errors,
+        'seconds': round(elapsed, 4),
+        'per_sec': round(len(lat) / elapsed, 2) if elapsed else None,
+        'mean_ms': ms(sum(lat) / len(lat)) if lat else None,
+        'p50_ms': ms(percentile(lat, 50)),
+        'p95_ms': ms(percentile(lat, 95)),
+        'p99_ms': ms(percentile(lat, 99)),
+        'max_ms': ms(lat[-1]) if lat else None,
+        **extra,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def write_results(path, results, args):
+    doc = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'commit': _git_commit(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'args': args,
+        },
+        'results': results,
+    }
+    Path(path).write_text(json.dumps(doc, indent=2, sort_keys=True))
+    return doc
+
+
+# metric name -> True when a larger value is better
+COMPARED = {'p50_ms': False, 'p95_ms': False, 'mean_ms': False, 'per_sec': True, 'errors': False}
+
+
+def compare(current, baseline, threshold=0.2):
+    """Return [(benchmark, metric, baseline, current, change)] for metrics that got worse by more than `threshold`."""
+    regressions = []
+    for name, stats in current['results'].items():
+        base = baseline['results'].get(name)
+        if not base:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            old, new = base.get(metric), stats.get(metric)
+            if old is None or new is None:
+                continue
+            if metric == 'errors':
+                if new > old:
+                    regressions.append((name, metric, old, new, None))
+                continue
+            if not old:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append((name, metric, old, new, round(change, 3)))
+    return regressions
+
+
+def print_table(results, out=sys.stdout):
+    cols = ('count', 'errors', 'per_sec', 'p50_ms', 'p95_ms', 'p99_ms')
+    width = max((len(n) for n in results), default=10)
+    out.write(f"{'benchmark':<{width}}  " + '  '.join(f'{c:>10}' for c in cols) + '\n')
+    for name, stats in results.items():
+        out.write(f'{name:<{width}}  ' + '  '.join(f"{'' if stats.get(c) is None else stats[c]:>10}" for c in cols) + '\n')
@@ -0,0 +1,37 @@
+"""Point settings at a scratch directory before anything imports `app`.
+
+Settings are read once at import time, so this runs first: no provider
+keys (agents answer from the simulated provider unless a test routes them
+elsewhere), a throwaway SQLite database and FAISS path, and the scratch
+directory as cwd so logs/ and output/ stay out of the tree.
+"""
+import os, sys, tempfile
+from pathlib import Path
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+WORKDIR = Path(tempfile.mkdtemp(prefix='book-writer-tests-'))
+
+for key in ('OPENAI_BASE_URL', 'OLLAMA_BASE_URL'):
+    os.environ.pop(key, None)
+os.environ.update({
+    'MYSQL_URI': f'sqlite:///{WORKDIR / "test.db"}',
+    'FAISS_PATH': str(WORKDIR / 'data' / 'faiss.index'),
+    'CACHE_SQLITE_PATH': '',
+    'OPENAI_API_KEY': '',
+    'HUGGINGFACEHUB_API_TOKEN': '',
+    'OLLAMA_API_KEY': '',
+    'AGENT_RELOAD_INTERVAL': '0',
+})
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def pytest_sessionstart(session):
+    # after pytest has resolved its paths, before test modules (and so `app`) are imported
+    os.chdir(WORKDIR)
+
+
+@pytest.fixture(scope='session')
+def database():
+    from app.db.database import init_db
+    init_db()
@@ -0,0 +1,93 @@
+import asyncio, time
+import pytest
+from app.utils.admission import AdmissionController, AdmissionQueue, AdmissionRejected, TokenBucket
+from app.utils.config import settings
+
+
+def test_bucket_spends_burst_then_refills():
+    bucket = TokenBucket(rate=100.0, capacity=3)
+    assert [bucket.try_take() for _ in range(4)] == [True, True, True, False]
+    assert 0 < bucket.wait_time(1) <= 0.01
+    time.sleep(0.02)
+    assert bucket.try_take()
+    # a request larger than the bucket waits for a full bucket, not forever
+    assert bucket.wait_time(10) <= 3 / 100.0
+
+
+def test_queue_admits_in_order_once_capacity_returns():
+    queue = AdmissionQueue('p', rpm=6000, tpm=0, max_queue=10, max_wait=1.0)
+    queue.requests = TokenBucket(rate=100.0, capacity=1)
+    order = []
+
+    async def call(i):
+        await queue.acquire()
+        order.append(i)
+
+    async def main():
+        await asyncio.gather(*(call(i) for i in range(4)))
+
+    start = time.monotonic()
+    asyncio.run(main())
+    assert order == [0, 1, 2, 3]
+    assert time.monotonic() - start >= 0.025  # three refills of 10 ms
+    assert queue.snapshot()['admitted'] == 4
+
+
+def test_queue_rejects_a_wait_past_the_limit():
+    queue = AdmissionQueue('p', rpm=60, tpm=0, max_queue=10, max_wait=0.2)
+    queue.requests = TokenBucket(rate=1.0, capacity=1)
+
+    async def main():
+        await queue.acquire()  # spends the only token
+        with pytest.raises(AdmissionRejected) as rejected:
+            await queue.acquire()  # the next one is a second away
+        return rejected.value
+
+    rejected = asyncio.run(main())
+    assert rejected.status_code == 429
+    assert 'wait would exceed' in rejected.detail
+    assert rejected.headers['Retry-After'] == '1'
+
+
+def test_queue_rejects_when_full():
+    queue = AdmissionQueue('p', rpm=600, tpm=0, max_queue=1, max_wait=1.0)
+    queue.requests = TokenBucket(rate=20.0, capacity=1)
+
+    async def main():
+        await queue.acquire()
+        waiter = asyncio.ensure_future(queue.acquire())
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await queue.acquire()
+        await waiter  # the queued caller is still admitted
+        return rejected.value
+
+    assert 'queue full' in asyncio.run(main()).detail
+    assert queue.snapshot()['admitted'] == 2
+    assert queue.snapshot()['rejected'] == 1
+
+
+def test_token_budget_limits_large_prompts():
+    queue = AdmissionQueue('p', rpm=0, tpm=6000, max_queue=10, max_wait=0.05)
+    queue.tokens = TokenBucket(rate=1000.0, capacity=100)
+
+    async def main():
+        await queue.acquire(tokens=80)
+        with pytest.raises(AdmissionRejected):
+            await queue.acquire(tokens=100)  # 80 tokens short, 80 ms away
+        await queue.acquire(tokens=20)
+
+    asyncio.run(main())
+
+
+def test_client_quota_is_split_between_workers(monkeypatch):
+    monkeypatch.setattr(settings, 'ADMISSION_ENABLED', True)
+    monkeypatch.setattr(settings, 'ADMISSION_CLIENT_RPM', 4)
+    monkeypatch.setattr(settings, 'WORKERS', 2)
+    controller = AdmissionController()
+    controller.admit_client('c1')
+    controller.admit_client('c1')
+    with pytest.raises(AdmissionRejected):
+        controller.admit_client('c1')
+    controller.admit_client('c2')  # quotas are per client
+    assert controller.snapshot()['client_rejections'] == 1
@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from app.agents.crew_setup import get_crew
+from app.services import book_service
+
+
+@pytest.fixture
+def crew(database, monkeypatch):
+    crew = get_crew()
+    calls = []
+    run = crew.run_agent_async
+
+    async def spy(name, **kwargs):
+        calls.append((name, kwargs))
+        return await run(name, **kwargs)
+
+    monkeypatch.setattr(crew, 'run_agent_async', spy)
+    crew.calls = calls
+    return crew
+
+
+def test_outline_comes_from_the_outliner(crew, monkeypatch):
+    monkeypatch.setattr(crew, 'has_provider', lambda name: False)
+    book = asyncio.run(book_service.generate_book_from_outline('Tides', 'the sea', 3))
+
+    assert crew.calls[0] == ('outliner', {'title': 'Tides', 'topic': 'the sea', 'chapters': 3})
+    assert [name for name, _ in crew.calls[1:]] == ['writer'] * 3
+    assert book['failed'] == []
+
+
+def test_previous_chapter_context_is_labelled():
+    chapters = [{'index': 0, 'title': 'Ebb', 'synopsis': 'The water leaves.', 'text': None},
+                {'index': 1, 'title': 'Flow', 'synopsis': 'It returns.', 'text': None}]
+    book = {'title': 'Tides', 'topic': 'the sea', 'chapters': chapters}
+    assert 'The previous chapter (Ebb) is not written yet. Its synopsis:\nThe water leaves.' in \
+        book_service._chapter_prompt(book, 1)
+    chapters[0]['text'] = 'And the bay was dry.'
+    assert 'The previous chapter (Ebb) ends:\nAnd the bay was dry.' in book_service._chapter_prompt(book, 1)
+
+
+def test_simulated_chapters_fail_when_a_provider_is_configured(crew, monkeypatch):
+    monkeypatch.setattr(crew, 'has_provider', lambda name: True)
+    book = asyncio.run(book_service.generate_book_from_outline('Tides', 'the sea', 2))
+
+    assert book['failed'] == [0, 1]
+    assert all(c['error'] == 'All providers failed; got simulated output' for c in book['chapters'])
+    assert book['docx_file'] is None
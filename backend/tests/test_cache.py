@@ -0,0 +1,17 @@
+import time
+from app.utils.cache import SQLiteCacheTier
+
+
+def rows(tier):
+    return tier._conn.execute('SELECT count(*) FROM response_cache').fetchone()[0]
+
+
+def test_sqlite_tier_purges_expired_rows_while_writing(tmp_path):
+    tier = SQLiteCacheTier(str(tmp_path / 'cache.db'), purge_every=4)
+    past, future = time.time() - 1, time.time() + 3600
+    for i in range(3):
+        tier.set(f'old{i}', {'text': 'stale'}, past)  # never read again
+    assert rows(tier) == 3
+    tier.set('new', {'text': 'fresh'}, future)  # fourth write purges
+    assert rows(tier) == 1
+    assert tier.get('new') == ({'text': 'fresh'}, future)
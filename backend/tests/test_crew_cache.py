@@ -0,0 +1,94 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app.agents.crew_setup import get_crew
+from app.services import retrieval
+from app.services.retrieval import retriever, book_scope
+from app.utils.config import settings
+
+LIGHTHOUSE = ('The lighthouse keeper counted the ships that never came home. '
+              'Each night the lamp swept the harbour, and each morning the tide gave back a little less. ') * 8
+SPACE = ('The fleet dropped out of hyperspace above the burning moon. '
+         'Admiral Vey ordered every gunship to hold fire until the signal. ') * 8
+
+
+@pytest.fixture
+def crew(database, monkeypatch):
+    # the deterministic test embeddings are not semantic: turn retrieval on and accept any distance
+    monkeypatch.setattr(settings, 'RETRIEVAL_ENABLED', True)
+    monkeypatch.setattr(settings, 'RETRIEVAL_MIN_SIMILARITY', float('-inf'))
+    crew, dispatched = get_crew(), []
+
+    async def dispatch(cfg, provider, prompt_body, temp):
+        dispatched.append(prompt_body)
+        return {'text': LIGHTHOUSE if 'lighthouse' in prompt_body.split('Prompt:')[-1] else SPACE, 'provider': 'fake'}
+
+    monkeypatch.setattr(crew, '_dispatch_providers', dispatch)
+    crew.dispatched = dispatched
+    return crew
+
+
+async def indexed(text, scope):
+    for _ in range(100):  # ingest runs in the background
+        chunks, _ = await retriever.retrieve('ships and fleets', scope, k=5)
+        if any(text[:40] in c['text'] for c in chunks):
+            return
+        await asyncio.sleep(0.02)
+    raise AssertionError('answer was never indexed')
+
+
+def test_unrelated_call_between_identical_calls_keeps_the_cache_hit(crew):
+    lighthouse, space = book_scope('cache-book-a'), book_scope('cache-book-b')
+    prompt = 'A lighthouse story about a keeper waiting for lost ships'
+
+    async def main():
+        first = await crew.run_agent_async('writer', scope=lighthouse, prompt=prompt)
+        await indexed(LIGHTHOUSE, lighthouse)
+        await crew.run_agent_async('writer', scope=space, prompt='A space opera about a fleet over a burning moon')
+        await indexed(SPACE, space)
+        return first, await crew.run_agent_async('writer', scope=lighthouse, prompt=prompt)
+
+    first, again = asyncio.run(main())
+    assert len(crew.dispatched) == 2
+    assert not first.get('cached')
+    assert again.get('cached') and again['text'] == LIGHTHOUSE
+    assert 'lighthouse keeper counted' not in crew.dispatched[1]  # the other book's answer never leaks in
+
+
+def test_unscoped_calls_neither_retrieve_nor_index(crew):
+    prompt = 'An unscoped lighthouse prompt'
+
+    async def main():
+        first = await crew.run_agent_async('writer', prompt=prompt)
+        await asyncio.sleep(0.1)
+        return first, await crew.run_agent_async('writer', prompt=prompt)
+
+    first, again = asyncio.run(main())
+    assert 'retrieval' not in first
+    assert again.get('cached')
+    assert len(crew.dispatched) == 1
+
+
+def test_retrieval_stays_in_scope_and_drops_dissimilar_chunks(database):
+    async def main():
+        await retriever.index_document('book:scope-a/writer:x', LIGHTHOUSE)
+        await retriever.index_document('book:scope-b/writer:y', SPACE)
+        await retriever.index_document('book:scope-a2/writer:z', SPACE)  # 'book:scope-a' is a prefix of this scope's name
+        in_a, _ = await retriever.retrieve('the fleet and the keeper', 'book:scope-a', min_similarity=float('-inf'))
+        in_b, _ = await retriever.retrieve('the fleet and the keeper', 'book:scope-b', min_similarity=float('-inf'))
+        # deterministic vectors are nowhere near cosine 0.3 of each other
+        strict, _ = await retriever.retrieve('the fleet and the keeper', 'book:scope-a')
+        return in_a, in_b, strict
+
+    in_a, in_b, strict = asyncio.run(main())
+    assert in_a and {c['doc_key'] for c in in_a} == {'book:scope-a/writer:x'}
+    assert in_b and {c['doc_key'] for c in in_b} == {'book:scope-b/writer:y'}
+    assert strict == []
+
+
+def test_chunks_are_stored_once_without_a_dialect_insert_ignore(database, monkeypatch):
+    monkeypatch.setattr(retrieval, '_insert_ignore', lambda dialect: None)
+    pieces = [f'portable piece {i}' for i in range(20)]
+    with ThreadPoolExecutor(8) as pool:
+        added = list(pool.map(lambda _: retriever._store_chunks('book:portable/writer:p', pieces), range(8)))
+    assert sorted(text for batch in added for _, text in batch) == sorted(pieces)
@@ -0,0 +1,46 @@
+from sqlalchemy import create_engine, inspect, text
+from app.db import models  # noqa: F401 (registers the tables on Base.metadata)
+from app.db.database import LEGACY_BOOKS_TABLE, upgrade_schema
+
+
+def old_engine(tmp_path, *ddl):
+    eng = create_engine(f'sqlite:///{tmp_path / "old.db"}')
+    with eng.begin() as conn:
+        for stmt in ddl:
+            conn.execute(text(stmt))
+    return eng
+
+
+def test_integer_keyed_books_are_copied_and_kept(tmp_path):
+    eng = old_engine(
+        tmp_path,
+        'CREATE TABLE books (id INTEGER PRIMARY KEY, title VARCHAR(255) NOT NULL, author VARCHAR(255), summary TEXT)',
+        "INSERT INTO books (id, title, author, summary) VALUES (1, 'One', 'A', 's1'), (2, 'Two', NULL, NULL)",
+    )
+    for _ in range(2):  # the second start finds nothing left to migrate
+        with eng.begin() as conn:
+            upgrade_schema(conn)
+
+    with eng.connect() as conn:
+        rows = conn.execute(text('SELECT id, title, author, mode, status FROM books ORDER BY id')).all()
+        legacy = conn.execute(text(f'SELECT count(*) FROM {LEGACY_BOOKS_TABLE}')).scalar()
+    assert [tuple(r) for r in rows] == [('1', 'One', 'A', 'single', 'done'), ('2', 'Two', None, 'single', 'done')]
+    assert legacy == 2
+    id_col = next(c for c in inspect(eng).get_columns('books') if c['name'] == 'id')
+    assert id_col['type'].python_type is str
+
+
+def test_jobs_gain_lease_columns(tmp_path):
+    eng = old_engine(
+        tmp_path,
+        'CREATE TABLE jobs (id VARCHAR(36) PRIMARY KEY, kind VARCHAR(64) NOT NULL, status VARCHAR(16) NOT NULL, '
+        'params TEXT, result TEXT, error TEXT, created_at DATETIME NOT NULL, started_at DATETIME, finished_at DATETIME)',
+        "INSERT INTO jobs (id, kind, status, created_at) VALUES ('j1', 'book', 'queued', '2025-01-01 00:00:00')",
+    )
+    for _ in range(2):
+        with eng.begin() as conn:
+            upgrade_schema(conn)
+
+    assert {'worker_id', 'heartbeat_at'} <= {c['name'] for c in inspect(eng).get_columns('jobs')}
+    with eng.connect() as conn:
+        assert conn.execute(text("SELECT status, worker_id FROM jobs WHERE id = 'j1'")).one() == ('queued', None)
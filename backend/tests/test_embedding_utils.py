@@ -0,0 +1,20 @@
+import numpy as np
+from app.utils.embedding_utils import DeterministicBackend, embed_texts
+
+
+class SharedBatchBackend(DeterministicBackend):
+    """Hands out the batch it last returned, like a backend reusing an output buffer."""
+    name = 'shared-batch'
+
+    def embed(self, texts):
+        self.last = super().embed(texts)
+        return self.last
+
+
+def test_cached_rows_do_not_alias_the_backend_batch():
+    backend = SharedBatchBackend(dim=8)
+    first = embed_texts(['alias one', 'alias two'], backend=backend)
+    backend.last[:] = 0  # the caller (or backend) edits the batch in place
+    first /= np.linalg.norm(first, axis=1, keepdims=True)
+    again = embed_texts(['alias one', 'alias two'], backend=backend)
+    assert np.array_equal(again, DeterministicBackend(dim=8).embed(['alias one', 'alias two']))
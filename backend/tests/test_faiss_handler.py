@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+from app.db.faiss_handler import FAISSHandler, INDEX_TYPES, index_type
+from app.utils.config import settings
+
+DIM = 32
+
+
+@pytest.fixture
+def small_index_settings(monkeypatch):
+    # PQ needs dim % M == 0; keep training sets small
+    monkeypatch.setattr(settings, 'FAISS_PQ_M', 8)
+    monkeypatch.setattr(settings, 'FAISS_TRAIN_SIZE', 2000)
+    monkeypatch.setattr(settings, 'FAISS_NPROBE', 64)
+
+
+def vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, DIM), dtype=np.float32)
+
+
+def writer(path, **kw):
+    kw.setdefault('flush_batch', 10 ** 9)
+    kw.setdefault('flush_interval', 10 ** 9)
+    return FAISSHandler(dim=DIM, path=str(path), role='writer', sync_interval=0, **kw)
+
+
+def reader(path):
+    return FAISSHandler(dim=DIM, path=str(path), role='reader', sync_interval=0)
+
+
+@pytest.mark.parametrize('kind', INDEX_TYPES)
+def test_reader_maps_every_index_kind(tmp_path, small_index_settings, kind):
+    path = tmp_path / 'f.index'
+    w = writer(path)
+    data = vectors(3000)
+    w.add_vectors(data, ids=np.arange(1000, 4000))
+    w.migrate(kind)
+    assert index_type(w.index) == kind
+
+    r = reader(path)
+    assert r.role == 'reader'
+    assert r.version == w.version
+    assert index_type(r.index) == kind
+    assert r.index.ntotal == 3000
+    _, ids = r.search(data[:5], 5)
+    assert all(1000 + i in row for i, row in enumerate(ids))
+    r.close()
+    w.close()
+
+
+def test_reader_remaps_new_snapshot_and_hands_inserts_to_writer(tmp_path):
+    path = tmp_path / 'f.index'
+    w = writer(path)
+    w.add_vectors(vectors(10), ids=np.arange(10))
+    w.flush()
+    r = reader(path)
+    assert r.index.ntotal == 10
+
+    r.add_vectors(vectors(5, seed=1), ids=np.arange(100, 105))
+    with pytest.raises(ValueError):
+        r.add_vectors(vectors(1))  # readers cannot allocate ids
+    assert r.index.ntotal == 10  # read-only until the writer publishes
+
+    assert w._drain_inbox() == 5
+    w.flush()
+    r.refresh(force=True)
+    assert r.version == w.version
+    assert r.index.ntotal == 15
+    _, ids = r.search(vectors(5, seed=1)[:1], 1)
+    assert ids[0][0] == 100
+    w.close()
+    r.close()
+
+
+def test_auto_reader_takes_over_when_writer_exits(tmp_path):
+    path = tmp_path / 'f.index'
+    first = FAISSHandler(dim=DIM, path=str(path), sync_interval=0)
+    second = FAISSHandler(dim=DIM, path=str(path), sync_interval=0)
+    assert (first.role, second.role) == ('writer', 'reader')
+    first.add_vectors(vectors(4), ids=np.arange(4))
+    first.close()
+
+    second.refresh(force=True)
+    assert second.role == 'writer'
+    assert second.index.ntotal == 4
+    second.add_vectors(vectors(1, seed=2))
+    second.close()
+
+
+def crash(h):
+    # what a killed process leaves behind: the WAL on disk, no final snapshot
+    h._wal.close()
+    h._lock_file.close()
+
+
+def test_wal_replay_after_crash_drops_torn_record(tmp_path):
+    path = tmp_path / 'f.index'
+    w = writer(path)
+    data = vectors(8)
+    w.add_vectors(data[:5], ids=np.arange(5))
+    w.flush()
+    w.add_vectors(data[5:], ids=np.arange(5, 8))
+    crash(w)
+    with open(f'{path}.wal', 'ab') as f:
+        f.write(b'\x01' * (w._record.itemsize // 2))  # the record being written when the process died
+
+    w = writer(path)
+    assert w.index.ntotal == 8
+    _, ids = w.search(data[5:], 1)
+    assert [row[0] for row in ids] == [5, 6, 7]
+    # replay ends in a snapshot covering everything, so the next start has nothing to redo
+    assert not (tmp_path / 'f.index.wal.1').exists()
+    assert w._read_segment(w.wal_path)[1].size == 0
+    assert int(w.add_vector(vectors(1, seed=3)[0])) == 8
+    w.close()
+
+
+def test_wal_replay_includes_segment_retired_by_failed_snapshot(tmp_path):
+    path = tmp_path / 'f.index'
+    w = writer(path)
+    data = vectors(9)
+    w.add_vectors(data[:3], ids=np.arange(3))
+    w.flush()
+    w.add_vectors(data[3:6], ids=np.arange(3, 6))
+    with w._lock:  # rotation happened, the snapshot write did not
+        w._wal.close()
+        w._retire_segment()
+        w._wal = w._open_segment(w.wal_path)
+    w.add_vectors(data[6:], ids=np.arange(6, 9))
+    crash(w)
+
+    w = writer(path)
+    assert w.index.ntotal == 9
+    _, ids = w.search(data, 1)
+    assert [row[0] for row in ids] == list(range(9))
+    w.close()
+
+
+@pytest.mark.parametrize('kind', INDEX_TYPES)
+def test_search_restricted_to_ids(tmp_path, small_index_settings, kind):
+    w = writer(tmp_path / 'f.index')
+    data = vectors(3000)
+    w.add_vectors(data, ids=np.arange(3000))
+    w.migrate(kind)
+    allowed = [7, 1500, 2999]
+    _, ids = w.search(data[[7, 100]], 3, ids=allowed)
+    assert ids[0][0] == 7
+    assert all(i in allowed or i == -1 for row in ids for i in row)
+    w.close()
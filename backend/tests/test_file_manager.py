@@ -0,0 +1,14 @@
+import asyncio, os
+from app.utils.file_manager import export_book, get_export_pool
+
+
+def test_export_from_async_chapters_in_forkserver_pool():
+    async def chapters():
+        for i in range(3):
+            yield {'title': f'Chapter {i + 1}', 'text': f'Text of chapter {i + 1}.'}
+            await asyncio.sleep(0)
+
+    paths = asyncio.run(export_book('Async Export', chapters()))
+    assert get_export_pool()._mp_context.get_start_method() == 'forkserver'
+    assert set(paths) == {'docx', 'pdf'}
+    assert all(os.path.getsize(p) > 0 for p in paths.values())
@@ -0,0 +1,99 @@
+import asyncio, json
+from datetime import datetime, timedelta
+import pytest
+from app.db.database import SessionLocal
+from app.db.models import Job
+from app.services.job_service import JobQueue, JOB_HANDLERS, FINISHED, SUCCEEDED, CANCELLED, RUNNING
+from app.utils.config import settings
+
+
+@pytest.fixture
+def runs(database, monkeypatch):
+    """Two worker processes' worth of settings and a `sleep` job kind that records who ran it."""
+    monkeypatch.setattr(settings, 'WORKERS', 2)
+    monkeypatch.setattr(settings, 'JOB_POLL_INTERVAL', 0.02)
+    monkeypatch.setattr(settings, 'JOB_LEASE_SECONDS', 0.5)
+    runs = []
+
+    async def sleep(seconds, tag=None):
+        runs.append({'tag': tag, 'state': 'started'})
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            runs[-1]['state'] = 'cancelled'
+            raise
+        runs[-1]['state'] = 'done'
+        return tag
+
+    monkeypatch.setitem(JOB_HANDLERS, 'sleep', sleep)
+    return runs
+
+
+async def finished(queue, job_id, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await queue.get(job_id)
+        if job['status'] in FINISHED:
+            return job
+        assert asyncio.get_running_loop().time() < deadline, f'job still {job["status"]}'
+        await asyncio.sleep(0.02)
+
+
+def test_jobs_run_once_across_worker_processes(runs):
+    first, second = JobQueue(concurrency=1), JobQueue(concurrency=2)
+
+    async def main():
+        await first.start()
+        await second.start()
+        try:
+            ids = [await first.submit('sleep', {'seconds': 0.05, 'tag': i}) for i in range(6)]
+            return ids, [await finished(first, job_id) for job_id in ids]
+        finally:
+            await first.stop()
+            await second.stop()
+
+    ids, jobs = asyncio.run(main())
+    assert [j['status'] for j in jobs] == [SUCCEEDED] * 6
+    assert sorted(r['tag'] for r in runs) == list(range(6))
+    with SessionLocal() as db:
+        owners = {w for (w,) in db.query(Job.worker_id).filter(Job.id.in_(ids))}
+    assert owners == {first.worker_id, second.worker_id}  # the second process pulled from the shared table
+
+
+def test_lapsed_lease_is_run_again(runs):
+    stale = datetime.utcnow() - timedelta(seconds=60)
+    with SessionLocal() as db:
+        db.add(Job(id='lapsed-job', kind='sleep', status=RUNNING, params=json.dumps({'seconds': 0, 'tag': 'again'}),
+                   worker_id='dead-worker', started_at=stale, heartbeat_at=stale))
+        db.commit()
+    queue = JobQueue(concurrency=1)
+
+    async def main():
+        await queue.start()
+        try:
+            return await finished(queue, 'lapsed-job')
+        finally:
+            await queue.stop()
+
+    job = asyncio.run(main())
+    assert job['status'] == SUCCEEDED
+    assert runs == [{'tag': 'again', 'state': 'done'}]
+
+
+def test_cancel_through_another_worker_stops_the_owner(runs):
+    owner, other = JobQueue(concurrency=1), JobQueue(concurrency=1)
+
+    async def main():
+        await owner.start()
+        try:
+            job_id = await owner.submit('sleep', {'seconds': 10})
+            while not owner._running:
+                await asyncio.sleep(0.01)
+            assert await other.cancel(job_id)
+            return await finished(owner, job_id)
+        finally:
+            await owner.stop()
+
+    job = asyncio.run(main())
+    assert job['status'] == CANCELLED
+    assert runs[0]['state'] == 'cancelled'
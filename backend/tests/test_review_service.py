@@ -0,0 +1,64 @@
+import asyncio, random
+from app.agents.crew_setup import get_crew
+from app.services.review_service import split_review_chunks, incremental_review
+
+WORDS = 'tide harbour lantern salt rope gull anchor mist keel shore drift current ember stone'.split()
+
+
+def manuscript(paragraphs=60, seed=0):
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 60))) for _ in range(paragraphs)]
+
+
+def hashes(paras):
+    return [c['hash'] for c in split_review_chunks('\n\n'.join(paras), target_words=200, max_words=600)]
+
+
+def test_chunks_cover_every_paragraph_in_order():
+    paras = manuscript()
+    chunks = split_review_chunks('\n\n'.join(paras) + '\n\n\n', target_words=200, max_words=600)
+    assert '\n\n'.join(c['text'] for c in chunks) == '\n\n'.join(paras)
+    assert [c['seq'] for c in chunks] == list(range(len(chunks)))
+    assert all(c['words'] <= 600 for c in chunks)
+    assert len(chunks) > 5
+
+
+def test_one_paragraph_edit_changes_only_nearby_chunks():
+    paras = manuscript()
+    before = hashes(paras)
+    for i in (3, 30, 57):
+        edited = paras[:i] + [paras[i] + ' revised'] + paras[i + 1:]
+        after = hashes(edited)
+        # boundaries are content-defined: the edit may merge or split its own chunk, nothing else moves
+        assert len(set(after) - set(before)) <= 2
+        assert len(set(before) - set(after)) <= 2
+
+
+def test_oversized_paragraph_is_windowed():
+    chunks = split_review_chunks('short one\n\n' + ' '.join(['word'] * 1250), target_words=200, max_words=500)
+    assert [c['words'] for c in chunks] == [2, 500, 500, 250]
+
+
+class FakeReviewer:
+    def __init__(self):
+        self.registry = get_crew().registry
+        self.prompts = []
+
+    async def run_agent_async(self, name, text):
+        self.prompts.append(text)
+        return {'text': f'review {len(self.prompts)}', 'provider': 'fake'}
+
+
+def test_rereview_sends_only_changed_chunks(database):
+    paras = manuscript(seed=1)
+    reviewer = FakeReviewer()
+    text = '\n\n'.join(paras)
+    first = asyncio.run(incremental_review('test-review-doc', text, crew=reviewer))
+    assert first['reviewed'] == first['chunks'] == len(reviewer.prompts)
+
+    paras[20] += ' revised'
+    second = asyncio.run(incremental_review('test-review-doc', '\n\n'.join(paras), crew=reviewer))
+    assert 1 <= second['reviewed'] <= 2
+    assert second['reused'] == second['chunks'] - second['reviewed']
+    assert len(second['changed']) == second['reviewed']
+    assert any('revised' in p for p in reviewer.prompts[first['chunks']:])
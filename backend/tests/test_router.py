@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from app.agents.router import ProviderRouter, NoProviderAvailable, CLOSED, OPEN, HALF_OPEN
+from app.utils.config import settings
+
+
+@pytest.fixture
+def router(monkeypatch):
+    monkeypatch.setattr(settings, 'ADMISSION_ENABLED', False)
+    monkeypatch.setattr(settings, 'ROUTER_FAILURE_THRESHOLD', 3)
+    monkeypatch.setattr(settings, 'ROUTER_OPEN_SECONDS', 0.05)
+    return ProviderRouter()
+
+
+def answer(text, delay=0.0, calls=None):
+    async def factory():
+        if calls is not None:
+            calls.append(text)
+        await asyncio.sleep(delay)
+        return text
+    return factory
+
+
+def fail(calls=None):
+    async def factory():
+        if calls is not None:
+            calls.append('fail')
+        raise RuntimeError('provider down')
+    return factory
+
+
+def test_failure_falls_through_to_next_provider(router):
+    name, text = asyncio.run(router.call([('a', fail()), ('b', answer('from b'))]))
+    assert (name, text) == ('b', 'from b')
+    assert router.counters['fallthroughs'] == 1
+    assert router.snapshot()['providers']['a']['failures'] == 1
+
+
+def test_breaker_opens_skips_and_recovers_through_one_probe(router):
+    calls = []
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            asyncio.run(router.call([('a', fail(calls))]))
+    assert router.breakers['a'].state == OPEN
+    with pytest.raises(NoProviderAvailable):
+        asyncio.run(router.call([('a', fail(calls))]))
+    assert len(calls) == 3  # skipped, not called
+
+    asyncio.run(asyncio.sleep(0.06))
+    breaker = router.breakers['a']
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()  # a single probe at a time
+    breaker.release_probe()
+    assert asyncio.run(router.call([('a', answer('back'))])) == ('a', 'back')
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens_the_circuit(router):
+    for _ in range(3):
+        router.record('a', 0.01, False)
+    asyncio.run(asyncio.sleep(0.06))
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.call([('a', fail())]))
+    assert router.breakers['a'].state == OPEN
+
+
+def test_slow_call_is_hedged_with_the_next_provider(router, monkeypatch):
+    monkeypatch.setattr(settings, 'ROUTER_HEDGE_ENABLED', True)
+    monkeypatch.setattr(settings, 'ROUTER_HEDGE_MIN_SAMPLES', 5)
+    for _ in range(5):
+        router.record('slow', 0.01, True)
+    assert router.hedge_delay('slow') == pytest.approx(0.01)
+
+    calls = []
+    name, text = asyncio.run(router.call([('slow', answer('late', 0.5, calls)), ('fast', answer('quick', 0, calls))]))
+    assert (name, text) == ('fast', 'quick')
+    assert calls == ['late', 'quick']
+    assert router.counters['hedges'] == 1
+    # the hedged-out call was cancelled, not recorded as a failure
+    assert router.snapshot()['providers']['slow']['failures'] == 0
+
+
+def test_hedging_waits_for_enough_samples(router, monkeypatch):
+    monkeypatch.setattr(settings, 'ROUTER_HEDGE_ENABLED', True)
+    monkeypatch.setattr(settings, 'ROUTER_HEDGE_MIN_SAMPLES', 5)
+    router.record('slow', 0.01, True)
+    assert router.hedge_delay('slow') is None
+    assert asyncio.run(router.call([('slow', answer('late', 0.05)), ('fast', answer('quick'))])) == ('slow', 'late')
+
+
+def test_stream_first_token_samples_stay_out_of_the_hedge_delay(router, monkeypatch):
+    monkeypatch.setattr(settings, 'ROUTER_HEDGE_ENABLED', True)
+    monkeypatch.setattr(settings, 'ROUTER_HEDGE_MIN_SAMPLES', 5)
+    for _ in range(5):
+        router.record('a', 2.0, True)
+    for _ in range(20):
+        router.record('a', 0.05, True, stream=True)
+    assert router.hedge_delay('a') == pytest.approx(2.0)
+    snap = router.snapshot()['providers']['a']
+    assert (snap['window'], snap['stream']['window']) == (5, 20)
+    # stream failures still count towards the breaker
+    for _ in range(3):
+        router.record('a', 0.05, False, stream=True)
+    assert router.breakers['a'].state == OPEN
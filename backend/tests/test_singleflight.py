@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+from app.agents.crew_setup import get_crew
+from app.utils.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    sf, runs = SingleFlight(), []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return 'answer'
+
+    async def main():
+        return await asyncio.gather(*(sf.do('k', work) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['answer'] * 5
+    assert len(runs) == 1
+    assert sf.stats() == {'calls': 5, 'coalesced': 4, 'inflight': 0}
+
+
+def test_failure_reaches_every_waiter_and_next_call_retries():
+    sf, runs = SingleFlight(), []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        if len(runs) == 1:
+            raise RuntimeError('provider down')
+        return 'answer'
+
+    async def main():
+        failed = await asyncio.gather(*(sf.do('k', work) for _ in range(3)), return_exceptions=True)
+        return failed, await sf.do('k', work)
+
+    failed, retried = asyncio.run(main())
+    assert [str(e) for e in failed] == ['provider down'] * 3
+    assert retried == 'answer'
+    assert len(runs) == 2
+
+
+def test_cancelling_one_waiter_keeps_the_shared_work():
+    sf = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return 'answer'
+
+    async def main():
+        first = asyncio.ensure_future(sf.do('k', work))
+        second = asyncio.ensure_future(sf.do('k', work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == 'answer'
+
+
+def test_cancelling_the_last_waiter_cancels_the_work():
+    sf, finished = SingleFlight(), []
+
+    async def work():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+
+    async def main():
+        only = asyncio.ensure_future(sf.do('k', work))
+        await asyncio.sleep(0.01)
+        only.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await only
+        await asyncio.sleep(0.06)
+        return sf.stats()['inflight']
+
+    assert asyncio.run(main()) == 0
+    assert finished == []
+
+
+def test_coalesced_agent_calls_store_the_answer_once(database, monkeypatch):
+    crew, dispatched, ingested, persisted = get_crew(), [], [], []
+
+    async def dispatch(cfg, provider, prompt_body, temp):
+        dispatched.append(prompt_body)
+        await asyncio.sleep(0.01)
+        return {'text': 'Reviewed.', 'provider': 'fake'}
+
+    monkeypatch.setattr(crew, '_dispatch_providers', dispatch)
+    monkeypatch.setattr(crew, '_ingest', lambda *a: ingested.append(a))
+    monkeypatch.setattr(crew, '_persist', lambda *a: persisted.append(a))
+
+    async def main():
+        return await asyncio.gather(*(crew.run_agent_async('reviewer', text='single-flight draft') for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert [r['text'] for r in results] == ['Reviewed.'] * 5
+    assert (len(dispatched), len(ingested), len(persisted)) == (1, 1, 1)
+
+
+def test_finished_task_awaiting_release_is_not_joined():
+    sf = SingleFlight()
+
+    async def work():
+        return 'fresh'
+
+    async def main():
+        stale = asyncio.get_running_loop().create_future()
+        stale.cancel()  # done, but its release callback has not run
+        sf._inflight['k'] = [stale, 0]
+        return await sf.do('k', work)
+
+    assert asyncio.run(main()) == 'fresh'